@@ -127,7 +127,10 @@ _DEFAULTS = {
         "nfdrs": {},
         "wims": {
             "url": "https://www.wfas.net/archive/www.fs.fed.us/land/wfas/archive/%Y/%m/%d/fdr_obs.dat",
-            "data_dir": None # defaults to tmp folder
+            "data_dir": None, # defaults to tmp folder
+            "download_timeout": 30, # seconds
+            "num_stations": 1,
+            "max_distance_km": 300
         }
     },
     "consumption": {
@@ -293,6 +296,7 @@ _DEFAULTS = {
         #     "truncate" - defaults to false
         #     "start_day" - defaults to null
         #     "end_day" - defaults to null
+        #     "copy_on_write" - defaults to false
         # 'days_to_persist' and 'daily_percentages' can't both be specified.
         # in any single config object. If neither is specified,
         # 'days_to_persist' (defaulted to 1) is used.
@@ -332,6 +336,9 @@ _DEFAULTS = {
         "ubc-bsf-feps": {
             "interpolation_type": 1,
             "normalize": True,
+            # Compute profiles in process rather than with the
+            # feps_weather and feps_timeprofile binaries
+            "in_process": False,
             "working_dir": None,
             "delete_working_dir_if_no_error": True
         }
@@ -342,6 +349,8 @@ _DEFAULTS = {
         "model": "feps",
         "working_dir": None,
         "delete_working_dir_if_no_error": True,
+        # number of threads over which to distribute locations
+        "num_workers": 1,
         # Note: feps and sev specific configs are usd by 'sev-feps' model
         "feps": {
             "load_heat": False
@@ -436,6 +445,9 @@ _DEFAULTS = {
         "working_dir": None,
         "delete_working_dir_if_no_error": True,
         "handle_existing": "fail",
+        # Species for which to compute hourly emissions, in addition to
+        # any required by the dispersion model (e.g. PM2.5)
+        "species": ["PM2.5", "CO"],
         # As with hysplit grid configuration, below, there are no default
         # plume merge parameters, and the presence/absence
         # of plume_merge config (nonempty vs. empty dict) is used in
@@ -448,7 +460,9 @@ _DEFAULTS = {
             #         "sw": { "lat":None, "lng": None},
             #         "ne": { "lat":None, "lng": None}
             #     }
-            # }
+            # },
+            # # numpy float type used in merging plume hours
+            # "precision": "float64"
         },
         "hysplit": {
             "emissions_split": {
@@ -524,6 +538,12 @@ _DEFAULTS = {
             "ensure_dummy_fire": True,
 
             "CONVERT_HYSPLIT2NETCDF": True,
+            # Convert with bluesky's streaming converter, which reads one
+            # record at a time, rather than with the hysplit2netcdf
+            # executable; HYSPLIT2NETCDF_COMPRESSION (0-9) > 0 writes
+            # zlib compressed NETCDF4_CLASSIC output
+            "CONVERT_HYSPLIT2NETCDF_IN_PROCESS": False,
+            "HYSPLIT2NETCDF_COMPRESSION": 0,
             "output_file_name": "hysplit_conc.nc",
 
             # default height to inject smoldering emissions
@@ -708,6 +728,30 @@ _DEFAULTS = {
             "NFIRES_PER_PROCESS": -1,
             "NPROCESSES_MAX": -1,
 
+            # Assign fires to tranches by estimated cost (hours with
+            # emissions, emissions sources, and PM2.5 emissions), rather
+            # than by count, so that the processes finish at about the
+            # same time; TRANCHE_COST_WEIGHTS overrides the weights of the
+            # components of the cost, e.g. {"pm25_tons": 0.0}
+            "BALANCE_TRANCHES_BY_COST": False,
+            "TRANCHE_COST_WEIGHTS": {},
+
+            # Tranches are run on a pool of at most MAX_CONCURRENT_PROCESSES
+            # HYSPLIT processes (default: # cores / NCPUS if MPI, else #
+            # cores), further limited, if PROCESS_MEMORY_MB is set, to the
+            # number that fit in available memory. Failed processes are
+            # retried up to PROCESS_RETRIES times.
+            "MAX_CONCURRENT_PROCESSES": None,
+            "PROCESS_MEMORY_MB": None,
+            "PROCESS_RETRIES": 0,
+
+            # Tranches' outputs are summed in process as each tranche
+            # completes, reading at most SUM_TRANCHES_CHUNK_SIZE grid
+            # values at a time, unless SUM_TRANCHES_WITH_NCO is set, in
+            # which case they're summed with ncea after all have completed
+            "SUM_TRANCHES_WITH_NCO": False,
+            "SUM_TRANCHES_CHUNK_SIZE": 4194304,
+
             # Machines file (TODO: functionality for multiple nodes)
             #MACHINEFILE": machines,
 
@@ -854,7 +898,11 @@ _DEFAULTS = {
             "XNTVL": 0.05,
 
             # Tolerance for isopleths
-            "TOL": 0.1
+            "TOL": 0.1,
+
+            # Number of VSMOKE and VSMOKEGIS processes to run at once, each
+            # in its own scratch directory under the working dir
+            "NUM_WORKERS": 1
         }
     },
     "visualization": {
@@ -16,7 +16,6 @@ import logging
 import math
 import os
 import shutil
-from datetime import timedelta
 
 from pyairfire import osutils
 from afdatetime import parsing as datetime_parsing
@@ -24,8 +23,8 @@ from afdatetime import parsing as datetime_parsing
 from bluesky import datautils, locationutils
 from bluesky.config import Config
 from bluesky.datetimeutils import parse_utc_offset
-from bluesky.models.fires import Fire
 from . import firemerge
+from .dispersioninput import DispersionInput
 
 
 # Note: HYSPLIT can accept concentrations in any units, but for
@@ -163,10 +162,25 @@ class DispersionBase(object, metaclass=abc.ABCMeta):
     )
     MISSING_TIMEPROFILE_HOUR = dict({p: 0.0 for p in PHASES}, area_fraction=0.0)
 
-    SPECIES = ('PM2.5', 'CO')
+    # Species whose hourly emissions the model uses; subclasses that
+    # use others should override
+    REQUIRED_SPECIES = ('PM2.5', )
+
+    def _get_species(self):
+        """Returns the species for which to compute hourly emissions --
+        those configured in 'config' > 'dispersion' > 'species', plus any
+        others required by the model.  Other species' emissions are
+        ignored.
+        """
+        species = list(Config().get('dispersion', 'species') or [])
+        species.extend([s for s in self.REQUIRED_SPECIES if s not in species])
+        return species
 
     def _set_fire_data(self, fires):
-        self._fires = []
+        self._species = self._get_species()
+        self._dispersion_input = DispersionInput(self._model_start,
+            self._num_hours, self._species, PHASES,
+            self.MISSING_PLUMERISE_HOUR, self.MISSING_TIMEPROFILE_HOUR)
 
         # TODO: aggreagating over all fires (if psossible)
         #  use self.model_start and self.model_end
@@ -206,6 +220,10 @@ class DispersionBase(object, metaclass=abc.ABCMeta):
                 else:
                     raise
 
+        # Each location's Fire references views of its data in
+        # self._dispersion_input, rather than hourly dicts
+        self._fires = self._dispersion_input.fires()
+
         # Note: even if self._fires is emtpy, we don't want to abort (like
         # we used to do), since we want output even if it's blank
 
@@ -221,12 +239,6 @@ class DispersionBase(object, metaclass=abc.ABCMeta):
                 "Missing emissions data required for computing dispersion")
 
         heat = self._get_heat(fire, aa, loc)
-        plumerise, timeprofile = self._get_plumerise_and_timeprofile(
-            loc, utc_offset)
-        emissions = self._get_emissions(loc)
-        timeprofiled_emissions = self._get_timeprofiled_emissions(
-            timeprofile, emissions)
-        timeprofiled_area = {dt: e.get('area_fraction') * loc['area'] for dt,e in timeprofile.items()}
 
         # consumption = datautils.sum_nested_data(
         #     [fb.get("consumption", {}) for fb in a['fuelbeds']], 'summary', 'total')
@@ -234,66 +246,28 @@ class DispersionBase(object, metaclass=abc.ABCMeta):
 
         latlng = locationutils.LatLng(loc)
 
-        f = Fire(
-            id="{}-{}".format(fire.id, loc_num),
-            # See note above, in _merge_two_fires, about why
-            # original_fire_ids is a set instead of scalar
-            original_fire_ids=set([fire.id]),
-            meta=fire.get('meta', {}),
-            start=datetime_parsing.parse(aa['start']),
-            end=datetime_parsing.parse(aa['end']),
-            area=loc['area'],
-            latitude=latlng.latitude,
-            longitude=latlng.longitude,
-            utc_offset=utc_offset,
-            plumerise=plumerise,
-            timeprofiled_emissions=timeprofiled_emissions,
-            timeprofiled_area=timeprofiled_area,
-            consumption=consumption
-        )
-        if heat:
-            f['heat'] = heat
-        self._fires.append(f)
-
-    def _get_plumerise_and_timeprofile(self, loc, utc_offset):
-        # TODO: only include plumerise and timeprofile keys within model run
-        # time window; and somehow fill in gaps (is this possible?)
-        all_plumerise = loc.get('plumerise', {})
-        all_timeprofile = loc.get('timeprofile', {})
-        plumerise = {}
-        timeprofile = {}
-        for i in range(self._num_hours):
-            local_dt = self._model_start + timedelta(hours=(i + utc_offset))
-            # TODO: will all_plumerise and all_timeprofile always
-            #    have string value keys
-            local_dt = local_dt.strftime('%Y-%m-%dT%H:%M:%S')
-            plumerise[local_dt] = all_plumerise.get(local_dt) or self.MISSING_PLUMERISE_HOUR
-            timeprofile[local_dt] = all_timeprofile.get(local_dt) or self.MISSING_TIMEPROFILE_HOUR
-
-        return plumerise, timeprofile
-
-    def _get_emissions(self, loc):
-        # sum the emissions across all fuelbeds, but keep them separate by phase
+        # TODO: only include plumerise and timeprofile hours within model
+        # run time window; and somehow fill in gaps (is this possible?)
+        self._dispersion_input.add_location(fire.id, loc_num,
+            fire.get('meta', {}), datetime_parsing.parse(aa['start']),
+            datetime_parsing.parse(aa['end']), loc['area'],
+            latlng.latitude, latlng.longitude, utc_offset,
+            loc.get('plumerise', {}), loc.get('timeprofile', {}),
+            self._get_emissions(loc, self._species), consumption, heat)
+
+    def _get_emissions(self, loc, species):
+        # sum the emissions of the given species across all fuelbeds,
+        # but keep them separate by phase
         emissions = {p: {} for p in PHASES}
         for fb in loc['fuelbeds']:
             for p in PHASES:
-                for s in fb['emissions'][p]:
-                    emissions[p][s] = (emissions[p].get(s, 0.0)
-                        + sum(fb['emissions'][p][s]))
+                fb_emissions = fb['emissions'][p]
+                for s in species:
+                    if s in fb_emissions:
+                        emissions[p][s] = (emissions[p].get(s, 0.0)
+                            + sum(fb_emissions[s]))
         return emissions
 
-    def _get_timeprofiled_emissions(self, timeprofile, emissions):
-        timeprofiled_emissions = {}
-        for dt in timeprofile:
-            timeprofiled_emissions[dt] = {}
-            for e in self.SPECIES:
-                timeprofiled_emissions[dt][e] = sum([
-                    timeprofile[dt][p] * emissions[p].get(e, 0.0)
-                        for p in PHASES
-                ])
-        return timeprofiled_emissions
-
-
     def _get_heat(self, fire, aa, loc):
         # TDOO: handle case where heat is defined by phase, but not total
         #   (just make sure each phase is defined, and set total to sum)
@@ -329,7 +303,17 @@ class DispersionBase(object, metaclass=abc.ABCMeta):
         return { datetime_parsing.parse(k): v for k, v in d.items() }
 
 
-    def _archive_file(self, filename, src_dir=None, suffix=None):
+    def _archive_file(self, filename, src_dir=None, suffix=None, move=False):
+        """Archives file in the run output dir, optionally adding a suffix
+        to its name
+
+        kwargs:
+         - src_dir -- directory containing the file, if filename isn't
+           a path
+         - suffix -- added to the archived file's name, before the extension
+         - move -- move the file, rather than copy it, if it's in a
+           scratch directory that's about to be discarded
+        """
         archived_filename = os.path.basename(filename)
         if suffix is not None:
             filename_parts = archived_filename.split('.')
@@ -344,4 +328,9 @@ class DispersionBase(object, metaclass=abc.ABCMeta):
             filename = os.path.join(src_dir, filename)
 
         if os.path.exists(filename):
-            shutil.copy(filename, archived_filename)
+            if move:
+                # shutil.move renames the file if the output dir is on the
+                # same file system, and only falls back to copying if not
+                shutil.move(filename, archived_filename)
+            else:
+                shutil.copy(filename, archived_filename)
@@ -0,0 +1,393 @@
+"""bluesky.dispersers.dispersioninput
+
+Columnar representation of the fire locations input to dispersion.
+
+DispersionBase used to create, for each fire location, a Fire with dicts
+of plumerise, emissions, and area, keyed by local hour string, with a new
+dict of emissions for every hour.  DispersionInput instead holds each
+location's values in arrays (and each location's plumerise hours in a
+list, referencing the location's own plumerise data), built in one pass
+over the fires.  Each location's Fire references read-only views of
+these arrays (HourlyPlumerise, HourlyEmissions, and HourlyArea), which
+support the dict interface of the former, so that fire merging and the
+dispersion models work with both them and the hourly dicts of merged
+fires.  Per-hour dicts are created only if accessed through the dict
+interface.
+"""
+
+__author__ = "Joel Dubowy"
+
+import abc
+import datetime
+from collections.abc import Mapping
+
+import numpy
+
+from bluesky.models.fires import Fire
+from bluesky.models.timeprofile import HourlyTimeProfile
+from bluesky.numpyutils import SequentialSum
+
+__all__ = [
+    'DispersionInput',
+    'HourlyPlumerise',
+    'HourlyEmissions',
+    'HourlyArea',
+    'get_hourly_emissions'
+]
+
+INVALID_TIMEPROFILE_HOUR_MSG = ("Timeprofile hour {} is missing area_fraction"
+    " or a phase fraction")
+
+class DispersionInput():
+    """Fire locations' lat/lng, area, etc., and their hourly plumerise,
+    emissions, and area, over the dispersion window
+    """
+
+    HOUR_FORMAT = '%Y-%m-%dT%H:%M:%S'
+    ONE_HOUR = datetime.timedelta(hours=1)
+
+    def __init__(self, model_start, num_hours, species, phases,
+            missing_plumerise_hour, missing_timeprofile_hour):
+        """Constructor
+
+        args:
+         - model_start -- dispersion start, in UTC
+         - num_hours -- number of hours in dispersion run
+         - species -- list of species for which to compute hourly
+           emissions; other species' emissions are ignored
+         - phases -- combustion phases of the emissions and timeprofiles
+         - missing_plumerise_hour -- plumerise used for hours for which
+           a location has none
+         - missing_timeprofile_hour -- timeprofile used for hours for which
+           a location has none
+        """
+        self.model_start = model_start
+        self.num_hours = num_hours
+        self.species = list(species)
+        self.phases = list(phases)
+        self._missing_plumerise_hour = missing_plumerise_hour
+        self._timeprofile_fields = ['area_fraction'] + self.phases
+        self._missing_timeprofile_values = [
+            missing_timeprofile_hour[f] for f in self._timeprofile_fields]
+
+        # local hour strings and their indices, by utc offset
+        self._local_hours = {}
+        self._hour_indices = {}
+
+        self._locations = []
+        self.plumerise = []
+        self._timeprofiles = []
+        self._phase_emissions = []
+        self._timeprofile_array = None
+        self._phase_emissions_array = None
+        self._hourly_area = None
+        self._emissions = {}
+
+    def __len__(self):
+        return len(self._locations)
+
+    ##
+    ## Local hours
+    ##
+
+    def local_hours(self, utc_offset):
+        """Returns list of the dispersion window's hours, as local time
+        strings (the keys of plumerise and timeprofile data)
+        """
+        hours = self._local_hours.get(utc_offset)
+        if hours is None:
+            local_start = self.model_start + datetime.timedelta(hours=utc_offset)
+            hours = self._local_hours[utc_offset] = [
+                (local_start + i * self.ONE_HOUR).strftime(self.HOUR_FORMAT)
+                    for i in range(self.num_hours)]
+        return hours
+
+    def hour_indices(self, utc_offset):
+        """Returns dict of indices of local hour strings"""
+        indices = self._hour_indices.get(utc_offset)
+        if indices is None:
+            indices = self._hour_indices[utc_offset] = {
+                h: i for i, h in enumerate(self.local_hours(utc_offset))}
+        return indices
+
+    ##
+    ## Adding locations
+    ##
+
+    def add_location(self, fire_id, loc_num, meta, start, end, area, latitude,
+            longitude, utc_offset, plumerise, timeprofile, emissions,
+            consumption, heat):
+        """Adds a fire location
+
+        args:
+         - fire_id -- id of the location's fire
+         - loc_num -- index of the location within its fire
+         - meta -- the fire's meta data
+         - start -- start of the location's active area
+         - end -- end of the location's active area
+         - area -- location's area
+         - latitude -- location's latitude
+         - longitude -- location's longitude
+         - utc_offset -- utc offset, in whole hours
+         - plumerise -- dict of location's plumerise, keyed by local hour
+         - timeprofile -- dict or HourlyTimeProfile of location's
+           timeprofile, keyed by local hour
+         - emissions -- location's total emissions, by phase and species
+         - consumption -- location's consumption summary
+         - heat -- location's total heat, or None if not defined
+
+        Raises an exception, without adding the location, if its
+        timeprofile or emissions are invalid (e.g. TypeError if an hour's
+        area fraction or any phase fraction is None).
+        """
+        hours = self.local_hours(utc_offset)
+        timeprofile = self._get_timeprofile_values(timeprofile, utc_offset)
+        phase_emissions = numpy.array([[emissions[p].get(s, 0.0)
+            for s in self.species] for p in self.phases], dtype=float)
+        plumerise = [plumerise.get(h) or self._missing_plumerise_hour
+            for h in hours]
+
+        self._locations.append((fire_id, loc_num, meta, start, end, area, latitude,
+            longitude, utc_offset, consumption, heat))
+        self.plumerise.append(plumerise)
+        self._timeprofiles.append(timeprofile)
+        self._phase_emissions.append(phase_emissions)
+        # arrays will be restacked, and emissions recomputed
+        self._timeprofile_array = self._hourly_area = None
+
+    def _get_timeprofile_values(self, timeprofile, utc_offset):
+        """Returns array of shape (num hours, num phases + 1), with each
+        hour's area fraction followed by its phase fractions
+        """
+        values = numpy.empty((self.num_hours, len(self._timeprofile_fields)))
+        values[:] = self._missing_timeprofile_values
+
+        local_start = self.model_start + datetime.timedelta(hours=utc_offset)
+        if self._is_aligned(timeprofile, local_start):
+            # Copy the overlapping hours directly from the arrays
+            offset = (timeprofile.start - local_start) // self.ONE_HOUR
+            fractions = timeprofile.fractions
+            lower = max(0, offset)
+            upper = min(self.num_hours, offset + len(timeprofile))
+            if lower < upper:
+                for j, f in enumerate(self._timeprofile_fields):
+                    values[lower:upper, j] = fractions[f][lower - offset:upper - offset]
+
+        else:
+            for i, h in enumerate(self.local_hours(utc_offset)):
+                hour = timeprofile.get(h)
+                if hour:
+                    hour_values = [hour.get('area_fraction')] + [
+                        hour[p] for p in self.phases]
+                    # numpy would silently convert None to NaN, which
+                    # would then propagate into area and emissions
+                    if None in hour_values:
+                        raise TypeError(INVALID_TIMEPROFILE_HOUR_MSG.format(h))
+                    values[i] = hour_values
+
+        return values
+
+    def _is_aligned(self, timeprofile, local_start):
+        """Returns True if timeprofile is an HourlyTimeProfile with all
+        fractions and whose hour keys are whole hours from local_start
+        and formatted like those returned by local_hours
+        """
+        return (isinstance(timeprofile, HourlyTimeProfile)
+            and not set(self._timeprofile_fields).difference(timeprofile.fields)
+            and local_start.tzinfo is None and timeprofile.start.tzinfo is None
+            and (timeprofile.start - local_start) % self.ONE_HOUR
+                == datetime.timedelta(0)
+            and timeprofile.start.isoformat()
+                == timeprofile.start.strftime(self.HOUR_FORMAT))
+
+    ##
+    ## Hourly arrays
+    ##
+
+    @property
+    def hourly_area(self):
+        """Array of shape (num locations, num hours)"""
+        if self._hourly_area is None:
+            self._stack()
+        return self._hourly_area
+
+    @property
+    def emissions(self):
+        """dict of arrays of shape (num locations, num hours), keyed by
+        species
+        """
+        return {s: self.species_emissions(s) for s in self.species}
+
+    def species_emissions(self, species):
+        """Returns array of species' hourly emissions, of shape
+        (num locations, num hours), computing it the first time it's
+        requested
+
+        Raises KeyError if species isn't one of self.species
+        """
+        if self._timeprofile_array is None:
+            self._stack()
+        totals = self._emissions.get(species)
+        if totals is None:
+            k = self.species.index(species) if species in self.species else None
+            if k is None:
+                raise KeyError(species)
+
+            # Each hour's emissions are the sum of the phases' timeprofiled
+            # emissions, added in the same order, and the same way, as by
+            # sum(), so that they're identical to summing the phases of
+            # each hour individually
+            phase_sum = SequentialSum(self._timeprofile_array.shape[:2])
+            for j in range(len(self.phases)):
+                phase_sum.add(self._timeprofile_array[:, :, j + 1]
+                    * self._phase_emissions_array[:, j, k][:, None])
+            totals = self._emissions[species] = phase_sum.totals()
+
+        return totals
+
+    def _stack(self):
+        shape = (len(self), self.num_hours)
+        self._timeprofile_array = numpy.array(self._timeprofiles).reshape(
+            shape + (len(self._timeprofile_fields),))
+        self._phase_emissions_array = numpy.array(self._phase_emissions).reshape(
+            (len(self), len(self.phases), len(self.species)))
+        areas = numpy.array([l[5] for l in self._locations], dtype=float)
+        self._hourly_area = self._timeprofile_array[:, :, 0] * areas[:, None]
+        self._emissions = {}
+
+    ##
+    ## Fires
+    ##
+
+    def fires(self):
+        """Returns list of a Fire for each location, referencing views
+        of the location's hourly data
+        """
+        fires = []
+        for i, (fire_id, loc_num, meta, start, end, area, latitude, longitude,
+                utc_offset, consumption, heat) in enumerate(self._locations):
+            f = Fire(
+                id="{}-{}".format(fire_id, loc_num),
+                # See note in firemerge._MergedFire about why
+                # original_fire_ids is a set instead of scalar
+                original_fire_ids=set([fire_id]),
+                meta=meta,
+                start=start,
+                end=end,
+                area=area,
+                latitude=latitude,
+                longitude=longitude,
+                utc_offset=utc_offset,
+                plumerise=HourlyPlumerise(self, i, utc_offset),
+                timeprofiled_emissions=HourlyEmissions(self, i, utc_offset),
+                timeprofiled_area=HourlyArea(self, i, utc_offset),
+                consumption=consumption
+            )
+            if heat:
+                f['heat'] = heat
+            fires.append(f)
+        return fires
+
+
+##
+## Views
+##
+
+class _LocationHours(Mapping, abc.ABC):
+    """Read-only dict-like view of one location's values of an hourly
+    field, keyed by local hour string
+    """
+
+    def __init__(self, dispersion_input, location, utc_offset):
+        self._input = dispersion_input
+        self._location = location
+        self._index = dispersion_input.hour_indices(utc_offset)
+        self._values = None
+
+    @abc.abstractmethod
+    def _get_values(self):
+        """Returns list of hourly values"""
+        pass
+
+    def __getitem__(self, key):
+        if self._values is None:
+            self._values = self._get_values()
+        return self._values[self._index[key]]
+
+    def get(self, key, default=None):
+        i = self._index.get(key)
+        if i is None:
+            return default
+        if self._values is None:
+            self._values = self._get_values()
+        return self._values[i]
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def to_dict(self):
+        return {k: self[k] for k in self}
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__, self.to_dict())
+
+
+class HourlyPlumerise(_LocationHours):
+
+    def _get_values(self):
+        return self._input.plumerise[self._location]
+
+
+class HourlyArea(_LocationHours):
+
+    def _get_values(self):
+        return self._input.hourly_area[self._location].tolist()
+
+
+class HourlyEmissions(_LocationHours):
+    """Each hour's value is a dict of emissions, keyed by species; use
+    species_value or species_items to avoid creating those dicts
+    """
+
+    def _get_species_values(self, species):
+        return self._input.species_emissions(species)[self._location].tolist()
+
+    def _get_values(self):
+        species_values = {s: self._get_species_values(s)
+            for s in self._input.species}
+        return [{s: v[i] for s, v in species_values.items()}
+            for i in range(len(self))]
+
+    def species_value(self, key, species):
+        """Returns species' emissions in the given hour
+
+        Raises KeyError if hour or species isn't defined
+        """
+        i = self._index[key]
+        return self._input.species_emissions(species)[self._location, i].item()
+
+    def species_items(self, species):
+        """Returns list of (hour, emissions) tuples of the given species,
+        or of (hour, None) if the species isn't defined
+        """
+        if species in self._input.species:
+            return list(zip(self._index, self._get_species_values(species)))
+        return [(k, None) for k in self._index]
+
+
+def get_hourly_emissions(timeprofiled_emissions, hour, species):
+    """Returns species' emissions in the given hour, from either an
+    HourlyEmissions view or dict of hourly emissions dicts (e.g. of
+    merged fires)
+
+    Raises KeyError if hour or species isn't defined
+    """
+    if isinstance(timeprofiled_emissions, HourlyEmissions):
+        return timeprofiled_emissions.species_value(hour, species)
+    return timeprofiled_emissions[hour][species]
@@ -1,17 +1,18 @@
 """bluesky.dispersers.firemerge"""
 
 import copy
-import itertools
 import logging
 import uuid
 from collections import defaultdict
 
 import afconfig
+import numpy
 from afdatetime import parsing as datetime_parsing
 
 from bluesky.exceptions import BlueSkyConfigurationError
 from bluesky.models.fires import Fire
 from bluesky import locationutils
+from bluesky.numpyutils import SequentialSum
 
 class BaseFireMerger():
 
@@ -40,33 +41,53 @@ class BaseFireMerger():
 
 
 class FireMerger(BaseFireMerger):
+    """Merges fires at the same lat,lng whose time windows don't overlap
+    and whose meta data don't conflict.
+
+    Fires are sorted by start time once and grouped by lat,lng in one
+    pass.  Each group's merged fires are accumulated in place (see
+    _MergedFire), and the merged Fire objects are created once all of the
+    group's fires have been considered, rather than creating a new Fire,
+    with copies of all merged data, for each pair of fires merged.
+    """
+
+    def __init__(self):
+        # Parsed hourly data keys, which are shared across many fires
+        self._parsed_dts = {}
 
     def merge(self, fires):
         logging.debug("Merging fires with same lat,lng")
+
+        # Since fires are sorted by start before being grouped, each group
+        # is sorted by start, and groups are ordered by their first fires'
+        # start times
         fires_by_lat_lng = defaultdict(lambda: [])
         for f in sorted(fires, key=lambda f: f['start']):
-            key = (f.latitude, f.longitude)
-            merged = False
-
-            # Sort fires_by_lat_lng[key] for unit testing purposes - for
-            # deterministic behavior (since f could potentially merge with
-            # possibly multiple fires in fires_by_lat_lng[key])
-            # TODO: this shouldn't be a significant performance hit, but
-            #   currently unit tests are structured so that the sorting
-            #   doesn't come into play, so we could remove it for now.
-            for i, f_merged in enumerate(sorted(fires_by_lat_lng[key], key=lambda f: f['start'])):
-                if (not self._do_fires_overlap(f, f_merged)
-                        and not self._do_fire_metas_conflict(f, f_merged)):
-                    # replace f_merged with f_merged merged with f
-                    fires_by_lat_lng[key][i] = self._merge_two_fires(f_merged, f)
-                    merged = True
-
-            if not merged:
-                # just add it
-                fires_by_lat_lng[key].append(f)
-
-        # return flattened list
-        return list(itertools.chain.from_iterable(fires_by_lat_lng.values()))
+            fires_by_lat_lng[(f['latitude'], f['longitude'])].append(f)
+
+        merged_fires = []
+        for group in fires_by_lat_lng.values():
+            # Merged fires remain sorted by start, since each keeps the
+            # start of its first fire, and fires are considered in order
+            # of start
+            merged = []
+            for f in group:
+                was_merged = False
+                # f is merged with each merged fire that it doesn't
+                # overlap or conflict with
+                for f_merged in merged:
+                    if (not self._do_fires_overlap(f, f_merged)
+                            and not self._do_fire_metas_conflict(f, f_merged)):
+                        f_merged.add(f)
+                        was_merged = True
+
+                if not was_merged:
+                    # just add it
+                    merged.append(_MergedFire(self, f))
+
+            merged_fires.extend([f_merged.to_fire() for f_merged in merged])
+
+        return merged_fires
 
     def _do_fires_overlap(self, f1, f2):
         return (f1['start'] < f2['end']) and (f2['start'] < f1['end'])
@@ -78,64 +99,128 @@ class FireMerger(BaseFireMerger):
 
         return False
 
-    def _merge_two_fires(self, f_merged, f):
+    def _update_hourly_data(self, data, data2, start2):
+        """Adds to data the hours of data2 on or after start2"""
+        parsed_start2 = None
+        for k, v in data2.items():
+            # make sure same type, and convert to datetimes if not
+            if type(k) == type(start2):
+                on_or_after = k >= start2
+            else:
+                if parsed_start2 is None:
+                    parsed_start2 = self._parse_dt(start2)
+                on_or_after = self._parse_dt(k) >= parsed_start2
+            if on_or_after:
+                data[k] = v
+
+    def _parse_dt(self, dt):
+        parsed = self._parsed_dts.get(dt)
+        if parsed is None:
+            parsed = self._parsed_dts[dt] = datetime_parsing.parse(dt)
+        return parsed
+
+    def _add_data(self, data, data2):
+        """Adds data2 to data, in place, recursing into nested dicts.
+        Values from data2 are copied, so that input fires aren't modified.
+        """
+        for k, v in data2.items():
+            if k not in data:
+                data[k] = copy.deepcopy(v)
+            elif isinstance(data[k], dict):
+                self._add_data(data[k], v)
+            else:
+                data[k] = data[k] + v
+
+
+class _MergedFire():
+    """Fire, or set of fires merged by FireMerger
+
+    Supports f['start'], f['end'], and f['meta'], used by FireMerger in
+    deciding whether to merge another fire.
+    """
+
+    HOURLY_FIELDS = ('plumerise', 'timeprofiled_area', 'timeprofiled_emissions')
+
+    def __init__(self, merger, fire):
+        self._merger = merger
+        self._fires = [fire]
+        self._data = {
+            "start": fire['start'],
+            "end": fire['end'],
+            "meta": fire['meta']
+        }
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def add(self, f):
+        if len(self._fires) == 1:
+            self._start_accumulating()
+        self._fires.append(f)
+
+        self._original_fire_ids.update(f['original_fire_ids'])
+        # we know at this point that their meta dicts don't conflict
+        self._data['meta'].update(f['meta'])
+        # there may be a gap between the current end and f['start'],
+        # but no subsequent fires will be in that gap, since fires are
+        # merged in order of start
+        # Note: we need to use f['start'] instead of f.start because the
+        #   Fire model has special property 'start' that returns the
+        #   first start time of all active_areas in the fire's activity,
+        #   and since we're not using nested activity here, f.start
+        #   returns 'None' rather than the actual value set in _add_location
+        self._data['end'] = f['end']
+        self._area = self._area + f['area']
+        if self._has_heat or 'heat' in f:
+            self._heat = self._heat + f.get('heat', 0.0)
+            self._has_heat = True
+        for field in self.HOURLY_FIELDS:
+            self._merger._update_hourly_data(self._hourly[field],
+                f[field], f['start'])
+        self._merger._add_data(self._consumption, f['consumption'])
+
+    def _start_accumulating(self):
+        fire = self._fires[0]
+        # It's possible, but not likely, that locations from different
+        # fires will get merged together.  This set of original fire
+        # ids isn't currently used other than in log messages, but
+        # could be used in tranching
+        self._original_fire_ids = set(fire.original_fire_ids)
+        self._data['meta'] = dict(fire.meta)
+        self._area = fire.area
+        self._has_heat = 'heat' in fire
+        self._heat = fire.get('heat', 0.0)
+        self._hourly = {field: dict(fire[field]) for field in self.HOURLY_FIELDS}
+        self._consumption = copy.deepcopy(fire.consumption)
+
+    def to_fire(self):
+        if len(self._fires) == 1:
+            return self._fires[0]
+
+        fire = self._fires[0]
         new_f_merged = Fire(
             # We'll let the new fire be assigned a new id
-            # It's possible, but not likely, that locations from different
-            # fires will get merged together.  This set of original fire
-            # ids isn't currently used other than in log messages, but
-            # could be used in tranching
-            original_fire_ids=f_merged.original_fire_ids.union(f.original_fire_ids),
-            # we know at this point that their meta dicts don't conflict
-            meta=dict(f_merged.meta, **f.meta),
-            # there may be a gap between f_merged['end'] and f['start']
-            # but no subsequent fires will be in that gap, since
-            # fires were sorted by 'start'
-            # Note: we need to use f_merged['start'] instead of f_merged.start
-            #   because the Fire model has special property 'start' that
-            #   returns the first start time of all active_areas in the fire's
-            #   activity, and since we're not using nested activity here,
-            #   f_merged.start returns 'None' rather than the actual value
-            #   set in _add_location
-            start=f_merged['start'],
+            original_fire_ids=self._original_fire_ids,
+            meta=self._data['meta'],
+            start=self._data['start'],
             # end will only be used when merging fires
-            # Note: see note about 'start', above
-            end=f['end'],
-            area=f_merged.area + f.area,
-            # f_merged and f have the same lat,lng (o.w. they wouldn't
+            end=self._data['end'],
+            area=self._area,
+            # the fires have the same lat,lng (o.w. they wouldn't
             # be merged)
-            latitude=f_merged.latitude,
-            longitude=f_merged.longitude,
+            latitude=fire.latitude,
+            longitude=fire.longitude,
             # the offsets could be different, but only if on DST transition
             # TODO: Should we worry about this?  If so, we should add same
             #   utc offset to criteria for deciding to merge or not
-            utc_offset=f_merged.utc_offset,
-            plumerise=self._merge_hourly_data(
-                f_merged.plumerise, f.plumerise, f['start']),
-            timeprofiled_area=self._merge_hourly_data(
-                f_merged.timeprofiled_area, f.timeprofiled_area, f['start']),
-            timeprofiled_emissions=self._merge_hourly_data(
-                f_merged.timeprofiled_emissions, f.timeprofiled_emissions,
-                f['start']),
-            consumption=self._sum_data(f_merged.consumption, f.consumption)
+            utc_offset=fire.utc_offset,
+            consumption=self._consumption,
+            **self._hourly
         )
-        if 'heat' in f_merged or 'heat' in f:
-            new_f_merged['heat'] = f_merged.get('heat', 0.0) + f.get('heat', 0.0)
+        if self._has_heat:
+            new_f_merged['heat'] = self._heat
         return new_f_merged
 
-    def _merge_hourly_data(self, data1, data2, start2):
-        pruned_data2 = {k: v for k, v in data2.items()
-            if self._on_or_after(k, start2)}
-        return dict(data1, **pruned_data2)
-
-    def _on_or_after(self, dt1, dt2):
-        # make sure same type, and convert to datetimes if not
-        if type(dt1) != type(dt2):
-            dt1 = datetime_parsing.parse(dt1)
-            dt2 = datetime_parsing.parse(dt2)
-        return dt1 >= dt2
-
-
 
 class PlumeMerger(BaseFireMerger):
 
@@ -155,10 +240,16 @@ class PlumeMerger(BaseFireMerger):
                     config, 'grid', 'boundary', 'ne', 'lat')
                 self.neLng = afconfig.get_config_value(
                     config, 'grid', 'boundary', 'ne', 'lng')
+                # Precision of the arrays used in merging plume hours;
+                # float64 (the default) gives the same values as
+                # merging with python floats
+                self.dtype = numpy.dtype(afconfig.get_config_value(
+                    config, 'precision') or 'float64')
                 if (self.spacing and self.swLat is not None
                         and self.swLng is not None
                         and self.neLat is not None
-                        and self.neLng is not None):
+                        and self.neLng is not None
+                        and self.dtype.kind == 'f'):
                     return
 
             except Exception as e:
@@ -265,18 +356,109 @@ class PlumeMerger(BaseFireMerger):
 
     def _merge_plumerise(self, fires):
         plumerise = {}
-        for dt in set.union(*[set(f['plumerise'].keys()) for f in fires]):
+        # hours to merge, grouped by number of heights
+        hours_to_merge = defaultdict(lambda: [])
+        for dt in sorted(set.union(*[set(f['plumerise'].keys()) for f in fires])):
             fires_with_dt = [f for f in fires
-                if dt in f.plumerise and dt in f.timeprofiled_emissions]
-            if fires_with_dt:
-                if len(fires_with_dt) == 1:
-                    # Use the plumerise data from the one fire that has
-                    # data for this hour
-                    plumerise[dt] = fires_with_dt[0].plumerise[dt]
+                if dt in f['plumerise'] and dt in f['timeprofiled_emissions']]
+            if len(fires_with_dt) == 1:
+                # Use the plumerise data from the one fire that has
+                # data for this hour
+                plumerise[dt] = fires_with_dt[0]['plumerise'][dt]
+            elif fires_with_dt:
+                num_heights = set([
+                    (len(f['plumerise'][dt]['heights']),
+                    len(f['plumerise'][dt]['emission_fractions']))
+                    for f in fires_with_dt])
+                if len(num_heights) == 1:
+                    hours_to_merge[num_heights.pop()].append((dt, fires_with_dt))
                 else:
                     plumerise[dt] = self._merge_plumerise_hour(fires_with_dt, dt)
             # else, no fires have plumerise for that hour
 
+        for hours in hours_to_merge.values():
+            plumerise.update(self._merge_plumerise_hours(
+                _PlumeHours(hours, self.dtype)))
+
+        return dict(sorted(plumerise.items()))
+
+    def _merge_plumerise_hours(self, plume_hours):
+        """Merges each of the hours in plume_hours, all at once.
+
+        Values are computed as in _merge_plumerise_hour, and, with
+        float64 precision, are identical to what it returns.
+        """
+        ph = plume_hours
+        num_hours, num_fires, num_levels = ph.fractions.shape
+
+        # Add fires' values in the same order as in _aggregate_plumerise_hour
+        total_pm25 = numpy.zeros(num_hours, dtype=ph.dtype)
+        weighted_smolder_fraction = numpy.zeros(num_hours, dtype=ph.dtype)
+        for i in range(num_fires):
+            total_pm25 += ph.pm25[:, i]
+            weighted_smolder_fraction += ph.smolder_fractions[:, i] * ph.pm25[:, i]
+        min_height = numpy.minimum(1000000, numpy.fmin.reduce(ph.heights[:, :, 0], axis=1))
+        max_height = numpy.maximum(0, numpy.fmax.reduce(ph.heights[:, :, -1], axis=1))
+        total_height_diff = max_height - min_height
+
+        plumerise = {}
+        # See _merge_plumerise_hour about hours with no heights or
+        # emissions. Hours with all heights equal are also left to
+        # _merge_plumerise_hour
+        unmerged = (max_height == 0) | (total_pm25 == 0)
+        for h in numpy.nonzero(unmerged)[0]:
+            plumerise[ph.dts[h]] = copy.deepcopy(ph.fires[h][0]['plumerise'][ph.dts[h]])
+        for h in numpy.nonzero(~unmerged & (total_height_diff == 0))[0]:
+            plumerise[ph.dts[h]] = self._merge_plumerise_hour(ph.fires[h], ph.dts[h])
+        merge = ~unmerged & (total_height_diff != 0)
+        if not merge.any():
+            return plumerise
+
+        hours = numpy.nonzero(merge)[0]
+        height_bucket_height = total_height_diff[hours] / num_levels
+        min_height = min_height[hours]
+
+        # Levels of each hour, sorted by height midpoint; the stable sort
+        # keeps levels with the same midpoint in the same order as
+        # _aggregate_plumerise_hour
+        heights = ph.heights[hours]
+        midpoints = ((heights[:, :, :-1] + heights[:, :, 1:]) / 2).reshape(len(hours), -1)
+        values = (ph.fractions[hours] * ph.pm25[hours, :, None]).reshape(len(hours), -1)
+        valid = numpy.repeat(ph.valid[hours], num_levels, axis=1)
+        midpoints[~valid] = numpy.inf
+        order = numpy.argsort(midpoints, axis=1, kind='stable')
+        midpoints = numpy.take_along_axis(midpoints, order, axis=1)
+        values = numpy.take_along_axis(values, order, axis=1)
+        valid = numpy.take_along_axis(valid, order, axis=1)
+
+        idx = ((midpoints - min_height[:, None])
+            / height_bucket_height[:, None])
+        idx[~valid] = 0
+        idx = numpy.minimum(idx.astype(int), num_levels - 1)
+
+        # Each hour's bucket is a segment of the flattened levels
+        segments = (idx + (numpy.arange(len(hours)) * num_levels)[:, None])[valid]
+        bucket_pm25 = _sum_segments(values[valid], segments,
+            len(hours) * num_levels).reshape(len(hours), num_levels)
+        fractions = bucket_pm25 / total_pm25[hours, None]
+
+        heights = (min_height[:, None] + height_bucket_height[:, None]
+            * numpy.arange(num_levels + 1))
+
+        # this will never divide by zero; see _merge_plumerise_hour
+        weighted_smolder_fraction = weighted_smolder_fraction[hours]
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            smolder_fractions = numpy.where(weighted_smolder_fraction != 0,
+                weighted_smolder_fraction / total_pm25[hours],
+                weighted_smolder_fraction)
+
+        for i, h in enumerate(hours):
+            plumerise[ph.dts[h]] = {
+                "emission_fractions": fractions[i].tolist(),
+                "heights": heights[i].tolist(),
+                "smolder_fraction": smolder_fractions[i].item()
+            }
+
         return plumerise
 
     def _merge_plumerise_hour(self, fires, dt):
@@ -362,3 +544,64 @@ class PlumeMerger(BaseFireMerger):
             (heights[i] + heights[i+1]) / 2
                 for i in range(len(heights) - 1)
         ]
+
+
+class _PlumeHours():
+    """Plumerise data and PM2.5 emissions of fires for a set of hours,
+    in arrays of shape (num hours, max num fires per hour, ...)
+
+    Hours with fewer fires are padded at the end with invalid values,
+    with zero emissions.
+    """
+
+    def __init__(self, hours, dtype):
+        """
+        args:
+         - hours -- list of (dt, fires) tuples, where each fire has plumerise
+           data and emissions for dt, with the same number of heights
+         - dtype -- numpy dtype of the arrays
+        """
+        self.dtype = dtype
+        self.dts = [dt for dt, fires in hours]
+        self.fires = [fires for dt, fires in hours]
+        num_fires = max([len(fires) for fires in self.fires])
+        num_heights = len(self.fires[0][0]['plumerise'][self.dts[0]]['heights'])
+
+        shape = (len(hours), num_fires)
+        self.heights = numpy.full(shape + (num_heights,), numpy.nan, dtype=dtype)
+        self.fractions = numpy.zeros(shape + (num_heights - 1,), dtype=dtype)
+        self.smolder_fractions = numpy.zeros(shape, dtype=dtype)
+        self.pm25 = numpy.zeros(shape, dtype=dtype)
+        self.valid = numpy.zeros(shape, dtype=bool)
+        for h, (dt, fires) in enumerate(hours):
+            hour_data = [f['plumerise'][dt] for f in fires]
+            n = len(fires)
+            self.heights[h, :n] = [d['heights'] for d in hour_data]
+            self.fractions[h, :n] = [d['emission_fractions'] for d in hour_data]
+            self.smolder_fractions[h, :n] = [d['smolder_fraction'] for d in hour_data]
+            self.pm25[h, :n] = [f['timeprofiled_emissions'][dt].get('PM2.5')
+                for f in fires]
+            self.valid[h, :n] = True
+
+
+def _sum_segments(values, segments, num_segments):
+    """Sums values by segment, adding each segment's values in order, the
+    same way as by sum()
+
+    args:
+     - values -- 1-D array of values
+     - segments -- non-decreasing segment index of each value
+     - num_segments -- total number of segments, including empty ones
+    """
+    totals = SequentialSum(num_segments, dtype=values.dtype)
+    if not len(values):
+        return totals.totals()
+
+    # position of each value within its segment
+    positions = numpy.arange(len(values)) - numpy.searchsorted(segments, segments)
+    order = numpy.argsort(positions, kind='stable')
+    bounds = numpy.cumsum(numpy.bincount(positions))
+    # Each iteration adds one value to each segment that has another
+    for idx in numpy.split(order, bounds[:-1]):
+        totals.add(values[idx], segments[idx])
+    return totals.totals()
@@ -1,8 +1,13 @@
 import datetime
 import logging
 
+import numpy
+
+from bluesky.numpyutils import SequentialSum
+
 from .hysplit_utils import DUMMY_PLUMERISE_HOUR
 from .. import GRAMS_PER_TON, SQUARE_METERS_PER_ACRE
+from ..dispersioninput import HourlyEmissions
 
 
 def get_emissions_rows_data(fire, dt, config, reduction_factor):
@@ -40,19 +45,45 @@ def _compute_emissions_rows_data(config, reduction_factor,
 
     return rows
 
-def _get_hour_data(dt, fire):
+def _get_local_dt_str(dt, utc_offset):
+    local_dt = dt + datetime.timedelta(hours=utc_offset)
+    # TODO: will fire.plumerise and fire.timeprofile always
+    #    have string value keys
+    return local_dt.strftime('%Y-%m-%dT%H:%M:%S')
+
+def _get_hour_data(dt, fire, local_dts=None):
+    """Returns (plumerise_hour, pm25_emitted, hourly_area, dummy)
+
+    local_dts, if specified, is used to cache local time strings by
+    (dt, utc_offset), since many fires share utc offsets
+    """
     if fire.plumerise and fire.timeprofiled_emissions and fire.timeprofiled_area:
-        local_dt = dt + datetime.timedelta(hours=fire.utc_offset)
-        # TODO: will fire.plumerise and fire.timeprofile always
-        #    have string value keys
-        local_dt = local_dt.strftime('%Y-%m-%dT%H:%M:%S')
+        if local_dts is None:
+            local_dt = _get_local_dt_str(dt, fire.utc_offset)
+        else:
+            key = (dt, fire.utc_offset)
+            local_dt = local_dts.get(key)
+            if local_dt is None:
+                local_dt = local_dts[key] = _get_local_dt_str(*key)
         plumerise_hour = fire.plumerise.get(local_dt)
-        timeprofiled_emissions_hour = fire.timeprofiled_emissions.get(local_dt)
         hourly_area = fire.timeprofiled_area.get(local_dt)
-        if plumerise_hour and timeprofiled_emissions_hour and hourly_area:
+        if isinstance(fire.timeprofiled_emissions, HourlyEmissions):
+            # Read PM2.5 from the dispersion input's arrays, rather than
+            # creating the hour's dict of emissions
+            try:
+                pm25_emitted = fire.timeprofiled_emissions.species_value(
+                    local_dt, 'PM2.5')
+            except KeyError:
+                pm25_emitted = 0.0 if local_dt in fire.timeprofiled_emissions else None
+            has_emissions = pm25_emitted is not None
+        else:
+            timeprofiled_emissions_hour = fire.timeprofiled_emissions.get(local_dt)
+            has_emissions = bool(timeprofiled_emissions_hour)
+            pm25_emitted = has_emissions and timeprofiled_emissions_hour.get('PM2.5', 0.0)
+        if plumerise_hour and has_emissions and hourly_area:
             return (
                 plumerise_hour,
-                timeprofiled_emissions_hour.get('PM2.5', 0.0),
+                pm25_emitted,
                 hourly_area,
                 False
             )
@@ -154,3 +185,171 @@ def _reduce_and_reallocate_vertical_levels(plumerise_hour, reduction_factor):
             fractions = [f * factor for f in fractions[:-1]] + [0]
 
     return heights, fractions
+
+
+##
+## Vectorized
+##
+
+# Max number of fire-hours for which to compute emissions rows at once
+# (~20Mb, with 21 heights)
+MAX_FIRE_HOURS = 25000
+
+def iter_emissions_rows_data(fires, dts, config, reduction_factor,
+        max_fire_hours=MAX_FIRE_HOURS):
+    """Computes emissions rows for all fires for each hour, as arrays,
+    a block of hours at a time
+
+    args:
+     - fires -- list of fires
+     - dts -- list of UTC datetimes
+     - config -- config getter
+     - reduction_factor -- vertical level reduction factor
+
+    Yields, for each hour, (dt, rows, num_rows, dummy), where rows is an
+    array of shape (num fires, max num rows, 4), with each fire's rows of
+    (height, pm25, area, heat) -- the same values returned by
+    get_emissions_rows_data -- and num_rows and dummy are arrays of the
+    number of rows and dummy flag for each fire
+    """
+    hours_per_block = max(1, max_fire_hours // max(1, len(fires)))
+    for i in range(0, len(dts), hours_per_block):
+        block_dts = dts[i:i + hours_per_block]
+        local_dts = {}
+        hour_data = [_get_hour_data(dt, fire, local_dts)
+            for dt in block_dts for fire in fires]
+        rows, num_rows, dummy = _compute_emissions_rows_data_arrays(
+            config, reduction_factor, hour_data)
+        shape = (len(block_dts), len(fires))
+        rows = rows.reshape(shape + rows.shape[1:])
+        num_rows = num_rows.reshape(shape)
+        dummy = dummy.reshape(shape)
+        for j, dt in enumerate(block_dts):
+            yield dt, rows[j], num_rows[j], dummy[j]
+
+def _compute_emissions_rows_data_arrays(config, reduction_factor, hour_data):
+    """Vectorized _compute_emissions_rows_data, for a list of fire-hours'
+    (plumerise_hour, pm25_emitted, hourly_area, dummy) tuples
+
+    Fire-hours are grouped by their plumerise's number of heights and
+    fractions, which determine the number of rows.
+
+    Returns rows array, of shape (num fire-hours, max num rows, 4), and
+    arrays of each fire-hour's number of rows and dummy flag
+    """
+    groups = {}
+    for i, (plumerise_hour, pm25_emitted, hourly_area, dummy) in enumerate(hour_data):
+        key = (len(plumerise_hour['heights']),
+            len(plumerise_hour['emission_fractions']))
+        groups.setdefault(key, []).append(i)
+
+    num_rows = numpy.zeros(len(hour_data), dtype=int)
+    dummy = numpy.array([d[3] for d in hour_data], dtype=bool)
+    group_rows = []
+    for idx in groups.values():
+        plumerise_hours = [hour_data[i][0] for i in idx]
+        rows = _compute_emissions_rows(config, reduction_factor,
+            numpy.array([p['heights'] for p in plumerise_hours], dtype=float),
+            numpy.array([p['emission_fractions'] for p in plumerise_hours], dtype=float),
+            numpy.array([p['smolder_fraction'] for p in plumerise_hours], dtype=float),
+            numpy.array([hour_data[i][1] for i in idx], dtype=float),
+            numpy.array([hour_data[i][2] for i in idx], dtype=float),
+            dummy[idx])
+        num_rows[idx] = rows.shape[1]
+        group_rows.append((idx, rows))
+
+    rows = numpy.zeros((len(hour_data), num_rows.max(initial=0), 4))
+    for idx, r in group_rows:
+        rows[idx, :r.shape[1]] = r
+
+    return rows, num_rows, dummy
+
+def _compute_emissions_rows(config, reduction_factor, heights, fractions,
+        smolder_fractions, pm25_emitted, hourly_area, dummy):
+    """Vectorized _compute_emissions_rows_data, for fire-hours with the
+    same number of plumerise heights and fractions
+
+    Returns array of shape (num fire-hours, num rows, 4)
+    """
+    # See _get_emissions_params
+    area_meters = numpy.where(dummy, 0.0, hourly_area * SQUARE_METERS_PER_ACRE)
+    pm25_emitted = pm25_emitted * GRAMS_PER_TON
+    if config("USE_CONST_SMOLDERING_FRACTION"):
+        smolder_fractions = numpy.full(len(pm25_emitted),
+            float(config("SMOLDERING_FRACTION_CONST")))
+    pm25_injected = numpy.where(dummy, 0.0, pm25_emitted * smolder_fractions)
+    pm25_entrained = numpy.where(dummy, 0.0,
+        pm25_emitted * (1.0 - smolder_fractions))
+
+    heights, fractions = reduce_and_reallocate_vertical_levels(
+        heights, fractions, reduction_factor)
+
+    # if reduction factor == 20 (i.e. one height), add
+    # pm25_entrained to pm25_injected
+    if heights.shape[1] == 1:
+        pm25_injected = pm25_injected + pm25_entrained
+        pm25_entrained = numpy.zeros(len(pm25_entrained))
+
+    rows = numpy.zeros((len(pm25_emitted), heights.shape[1] + 1, 4))
+    # smoldering emissions, at ground level; heat is always zero
+    rows[:, 0, 0] = config("SMOLDER_HEIGHT")
+    rows[:, 0, 1] = pm25_injected
+    rows[:, :, 2] = area_meters[:, None]
+    rows[:, 1:, 0] = numpy.where(dummy[:, None], 0.0, heights)
+    rows[:, 1:, 1] = numpy.where(dummy[:, None], 0.0,
+        pm25_entrained[:, None] * fractions)
+
+    return rows
+
+def _sum_levels(fractions, levels, reduction_factor):
+    """Sums each group of reduction_factor fractions, starting at each of
+    levels.  Fractions are added one level at a time, in order, the same
+    way as by sum(), rather than with numpy.sum, so that sums are
+    identical to those computed by _reduce_and_reallocate_vertical_levels
+    """
+    total = SequentialSum((fractions.shape[0], len(levels)))
+    for k in range(reduction_factor):
+        cols = [l + k for l in levels if l + k < fractions.shape[1]]
+        total.add(fractions[:, cols], (slice(None), slice(None, len(cols))))
+    return total.totals()
+
+def reduce_and_reallocate_vertical_levels(heights, fractions, reduction_factor):
+    """Vectorized _reduce_and_reallocate_vertical_levels
+
+    args:
+     - heights -- array of plume heights, of shape (num fire-hours,
+       num levels + 1)
+     - fractions -- array of emission fractions, of shape (num fire-hours,
+       num levels)
+     - reduction_factor -- number of levels to combine into one
+
+    Returns arrays of reduced heights and reallocated fractions, each of
+    shape (num fire-hours, num reduced levels).  Values are identical to
+    those returned by _reduce_and_reallocate_vertical_levels.
+    """
+    levels = range(0, heights.shape[1] - 1, reduction_factor)
+
+    ## Reduce
+
+    upper = [min(level + reduction_factor, heights.shape[1] - 1) for level in levels]
+    if reduction_factor == 1:
+        reduced_heights = (heights[:, :-1] + heights[:, 1:]) / 2.0  # original approach
+    else:
+        reduced_heights = heights[:, upper] # top-edge approach
+
+    reduced_fractions = _sum_levels(fractions, levels, reduction_factor)
+
+    ## Allocation top level's emissions to the rest
+    num_heights = len(levels)
+    if num_heights > 1:
+        top = reduced_fractions[:, -1]
+        all_in_top = top == 1
+        # factor is inf where all emissions are in the top level, but
+        # those fire-hours' fractions are set evenly instead
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            factor = 1 / (1 - top)
+            reduced_fractions[:, :-1] = numpy.where(all_in_top[:, None],
+                1 / (num_heights - 1), reduced_fractions[:, :-1] * factor[:, None])
+        reduced_fractions[:, -1] = 0
+
+    return reduced_heights, reduced_fractions
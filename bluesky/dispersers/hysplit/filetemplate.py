@@ -0,0 +1,54 @@
+"""bluesky.dispersers.hysplit.filetemplate
+
+Templates for HYSPLIT input files (CONTROL and SETUP.CFG).  Most of the
+content of these files is the same for every HYSPLIT process in a run,
+and is resolved from the config once per run.  Only the fields that vary
+by process (e.g. fire locations, particle file names) are filled in when
+each process's files are written.
+"""
+
+__author__ = "Joel Dubowy"
+
+__all__ = [
+    'FileTemplate'
+]
+
+class FileTemplate():
+    """Sequence of literal text and named fields
+
+    Consecutive literal text is joined as it's added, so that rendering
+    just joins a few strings with the field values.
+    """
+
+    def __init__(self):
+        self._parts = []
+        self._fields = []
+
+    def add(self, text):
+        """Appends literal text"""
+        if self._parts and self._parts[-1][1] is None:
+            self._parts[-1] = (self._parts[-1][0] + text, None)
+        else:
+            self._parts.append((text, None))
+        return self
+
+    def add_field(self, name):
+        """Appends a field whose value is specified when rendering"""
+        self._parts.append((None, name))
+        self._fields.append(name)
+        return self
+
+    @property
+    def fields(self):
+        return list(self._fields)
+
+    def render(self, **values):
+        """Returns the text, with each field replaced by its value
+
+        Raises KeyError if any field's value isn't specified.
+        """
+        return ''.join([t if f is None else values[f] for t, f in self._parts])
+
+    def write(self, filename, **values):
+        with open(filename, 'w') as f:
+            f.write(self.render(**values))
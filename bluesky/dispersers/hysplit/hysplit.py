@@ -51,19 +51,20 @@ import math
 import os
 import shutil
 # import tarfile
-import threading
 import datetime
 
 from afdatetime.parsing import parse_datetime
 
 from bluesky import io
-from bluesky.config import Config
 from bluesky.models.fires import Fire
 from .. import DispersionBase
 
-from . import hysplit_utils
-from .emissions_file_utils import get_emissions_rows_data
+from . import hysplit2netcdf, hysplit_utils
+from .emissions_file_utils import iter_emissions_rows_data
 from .emissionssplit import EmissionsSplitter
+from .filetemplate import FileTemplate
+from .netcdfsum import NetCDFSummer
+from .trancherunner import Tranche, TrancheRunner
 
 __all__ = [
     'HYSPLITDispersion'
@@ -163,6 +164,8 @@ class HYSPLITDispersion(DispersionBase):
         self._set_met_info(copy.deepcopy(met_info))
         self._output_file_name = self.config('output_file_name')
         self._has_parinit = []
+        self._control_file_template = None
+        self._setup_file_template = None
 
         # If configured for sub-hour emissions, SERI must be 1 to 12 and
         # result in an integer when 60 is divided by it
@@ -185,6 +188,10 @@ class HYSPLITDispersion(DispersionBase):
 
         self._set_grid_params()
         self._set_reduction_factor()
+        # CONTROL and SETUP.CFG templates depend on dispersion window
+        # and grid, so are created once they're set
+        self._control_file_template = None
+        self._setup_file_template = None
 
         # TODO: We're using self.config("NPROCESSES") instead of
         #   self._num_processes (computed in self._num_processes) because we
@@ -194,6 +201,7 @@ class HYSPLITDispersion(DispersionBase):
             self._grid_params, self.config("NPROCESSES"), self._fires).split()
 
         self._compute_tranches()
+        self._tranches = None
 
         if 1 < self._num_processes:
                 # hysplit_utils.create_fire_tranches will log number of processes
@@ -214,6 +222,7 @@ class HYSPLITDispersion(DispersionBase):
                 "grid_parameters": self._grid_params
             },
             "num_processes": self._num_processes,
+            "tranches": self._tranches,
             "met_info": self._met_info,
             "carryover": {
                 "any": bool(self._has_parinit) and any(self._has_parinit),
@@ -334,54 +343,62 @@ class HYSPLITDispersion(DispersionBase):
             len(self._fire_sets), **tranching_config)
 
     def _run_parallel(self, working_dir):
-        runner = self
-        class T(threading.Thread):
-            def  __init__(self, fires, config, working_dir, tranche_num):
-                super(T, self).__init__()
-                self.fires = fires
-                self.config = config
-                self.working_dir = working_dir
-                if not os.path.exists(working_dir):
-                    os.makedirs(working_dir)
-                self.tranche_num = tranche_num
-                self.exc = None
-
-            def run(self):
-                # We need to set config to what was loaded in the main thread.
-                # Otherwise, we'll just be using defaults
-                Config().set(self.config)
-                try:
-                    runner._run_process(self.fires, self.working_dir,
-                        self.tranche_num)
-                except Exception as e:
-                    self.exc = e
-
-        # TODO: consider emissions when tranching in order to allocate
-        #  emissions equally (as much as possible)
+        def _estimate_costs(fire_sets):
+            return hysplit_utils.estimate_fire_set_costs(fire_sets,
+                self._model_start, self._num_hours,
+                self.num_output_quantiles + 1,
+                weights=self.config("TRANCHE_COST_WEIGHTS"))
+
+        costs = None
+        if self.config("BALANCE_TRANCHES_BY_COST"):
+            costs = _estimate_costs(self._fire_sets)
 
         fire_tranches = hysplit_utils.create_fire_tranches(self._fire_sets,
             self._num_processes, self._model_start, self._num_hours,
-            self._grid_params)
-        threads = []
-        main_thread_config = Config().get()
-        for nproc in range(len(fire_tranches)):
-            fires = fire_tranches[nproc]
-            # Note: no need to set _context.basedir; it will be set to workdir
-            logging.info("Starting thread to run HYSPLIT on %d fires." % (len(fires)))
-            t = T(fires, main_thread_config,
-                os.path.join(working_dir, str(nproc)), nproc)
-            t.start()
-            threads.append(t)
-
-        # If there were any exceptions, raise one of them after joining all threads
-        exc = None
-        for t in threads:
-            t.join()
-            if t.exc:
-                exc = t.exc # TODO: just raise exception here, possibly before all threads have been joined?
-        if exc:
-            raise exc
+            self._grid_params, costs=costs)
+        # Estimated in either case, for comparison with actual runtimes
+        tranche_costs = _estimate_costs(fire_tranches)
+
+        output_file = os.path.join(working_dir, self._output_file_name)
+        summer = None
+        on_complete = None
+        if not self.config("SUM_TRANCHES_WITH_NCO"):
+            # Sum each tranche's output as soon as it's available
+            summer = NetCDFSummer(output_file,
+                chunk_size=self.config("SUM_TRANCHES_CHUNK_SIZE"))
+            on_complete = lambda t: summer.add(
+                os.path.join(t.working_dir, self._output_file_name))
+
+        # Note: no need to set _context.basedir; it will be set to workdir
+        tranches = [Tranche(nproc, fires, os.path.join(working_dir, str(nproc)))
+            for nproc, fires in enumerate(fire_tranches)]
+        try:
+            TrancheRunner(self._run_process,
+                max_concurrency=self.config("MAX_CONCURRENT_PROCESSES"),
+                cpus_per_tranche=self.config("NCPUS") if self.config("MPI") else 1,
+                memory_mb=self.config("PROCESS_MEMORY_MB"),
+                max_retries=self.config("PROCESS_RETRIES"),
+                on_complete=on_complete).run(tranches)
+
+            self._record_tranche_runtimes(tranches, tranche_costs)
+
+            # If there were any exceptions, raise one of them
+            exc = [t.exc for t in tranches if t.exc]
+            if exc:
+                raise exc[0]
+
+            if summer:
+                summer.write()
+            else:
+                self._sum_tranches_with_nco(working_dir, output_file)
+
+        finally:
+            if summer:
+                summer.close()
+
+        self._archive_file(output_file)
 
+    def _sum_tranches_with_nco(self, working_dir, output_file):
         #  'ttl' is sum of values; see http://nco.sourceforge.net/nco.html#Operation-Types
         # sum together all the PM2.5 fields then append the TFLAG field from
         # one of the individual runs (they're all the same)
@@ -390,8 +407,6 @@ class HYSPLITDispersion(DispersionBase):
         # prevents ncea from adding all the TFLAGs together and mucking up the
         # date
 
-        output_file = os.path.join(working_dir, self._output_file_name)
-
         #ncea_args = ["-y", "ttl", "-O"]
         ncea_args = ["-O","-v","PM25","-y","ttl"]
         ncea_args.extend(["%d/%s" % (i, self._output_file_name) for i in  range(self._num_processes)])
@@ -402,7 +417,24 @@ class HYSPLITDispersion(DispersionBase):
         ncks_args.append("0/%s" % (self._output_file_name))
         ncks_args.append(output_file)
         io.SubprocessExecutor().execute(self.BINARIES['NCKS'], *ncks_args, cwd=working_dir)
-        self._archive_file(output_file)
+
+    def _record_tranche_runtimes(self, tranches, tranche_costs):
+        """Records each tranche's estimated cost, predicted runtime, and
+        actual runtime.  Costs are relative, so predicted runtimes are
+        costs scaled by the overall runtime per unit cost.
+        """
+        run = [(t, c) for t, c in zip(tranches, tranche_costs)
+            if t.runtime is not None]
+        total_cost = sum([c for t, c in run])
+        seconds_per_cost = (sum([t.runtime for t, c in run]) / total_cost
+            if total_cost else 0.0)
+        self._tranches = [{
+            "num_fires": len([f for f in t.fires if not f.get('is_dummy')]),
+            "cost": cost,
+            "predicted_runtime": cost * seconds_per_cost,
+            "runtime": t.runtime,
+            "attempts": t.attempts
+        } for t, cost in zip(tranches, tranche_costs)]
 
     def _run_process(self, fires, working_dir, tranche_num=None):
         hysplit_utils.ensure_tranch_has_dummy_fire(fires, self._model_start,
@@ -528,14 +560,19 @@ class HYSPLITDispersion(DispersionBase):
 
             if self.config('CONVERT_HYSPLIT2NETCDF'):
                 logging.info("Converting HYSPLIT output to NetCDF format: %s -> %s" % (output_conc_file, output_file))
-                io.SubprocessExecutor().execute(self.BINARIES['HYSPLIT2NETCDF'],
-                    "-I" + output_conc_file,
-                    "-O" + os.path.basename(output_file),
-                    "-X1000000.0",  # Scale factor to convert from grams to micrograms
-                    "-D1",  # Debug flag
-                    "-L-1",  # Lx is x layers. x=-1 for all layers...breaks KML output for multiple layers
-                    cwd=working_dir
-                )
+                if self.config('CONVERT_HYSPLIT2NETCDF_IN_PROCESS'):
+                    hysplit2netcdf.convert(output_conc_file, output_file,
+                        scale=1000000.0,  # Convert from grams to micrograms
+                        compression=self.config('HYSPLIT2NETCDF_COMPRESSION') or 0)
+                else:
+                    io.SubprocessExecutor().execute(self.BINARIES['HYSPLIT2NETCDF'],
+                        "-I" + output_conc_file,
+                        "-O" + os.path.basename(output_file),
+                        "-X1000000.0",  # Scale factor to convert from grams to micrograms
+                        "-D1",  # Debug flag
+                        "-L-1",  # Lx is x layers. x=-1 for all layers...breaks KML output for multiple layers
+                        cwd=working_dir
+                    )
 
                 if not os.path.exists(output_file):
                     msg = "Unable to convert HYSPLIT concentration file to NetCDF format"
@@ -589,54 +626,57 @@ class HYSPLITDispersion(DispersionBase):
 
         minutes_per_interval = int(60/self._SERI)
 
+        # Each sub-hour interval's minute and duration (default hourly)
+        min_dur_strs = ["{:0>2}".format(icount*minutes_per_interval) + " 00"+"{:0>2}".format(minutes_per_interval)
+            for icount in range(self._SERI)]
+        if self._SERI == 1:
+            min_dur_strs = ["00 0100"]
+
+        # Get some properties from the fire locations
+        lat_lon_strs = ["%8.4f %9.4f" % (fire.latitude, fire.longitude)
+            for fire in fires]
+
+        row_fmt = " %6.0f %7.2f %7.2f %15.2f\n"
+
+        num_fires = len(fires)
+        #num_heights = 21 # 20 quantile gaps, plus ground level
+        num_heights = self.num_output_quantiles + 1
+        num_sources = num_fires * num_heights * self._SERI
+
+        # TODO: What is this and what does it do?
+        # A reasonable guess would be that it means a time increment of 1 hour
+        qinc = 1
+
+        dts = [self._model_start + datetime.timedelta(hours=hour)
+            for hour in range(self._num_hours)]
+
         with open(emissions_file, "w") as emis:
             # HYSPLIT skips past the first two records, so these are for comment purposes only
             emis.write("emissions group header: YYYY MM DD HH QINC NUMBER\n")
             emis.write("each emission's source: YYYY MM DD HH MM DUR_HHMM LAT LON HT RATE AREA HEAT\n")
 
-            # Loop through the timesteps
-            for hour in range(self._num_hours):
-                dt = self._model_start + datetime.timedelta(hours=hour)
+            # Loop through the timesteps, with all fires' emissions rows
+            # for each computed at once
+            for hour, (dt, rows, num_rows, dummy) in enumerate(iter_emissions_rows_data(
+                    fires, dts, self.config, self._reduction_factor)):
                 dt_str = dt.strftime("%y %m %d %H")
 
-                num_fires = len(fires)
-                #num_heights = 21 # 20 quantile gaps, plus ground level
-                num_heights = self.num_output_quantiles + 1
-                num_sources = num_fires * num_heights * self._SERI
-
-                # TODO: What is this and what does it do?
-                # A reasonable guess would be that it means a time increment of 1 hour
-                qinc = 1
-
                 # Write the header line for this timestep
                 emis.write("%s %02d %04d\n" % (dt_str, qinc, num_sources))
 
-                self._fires_wo_emissions = 0
+                rows = rows.tolist()
+                num_rows = num_rows.tolist()
 
                 # Loop through the fire locations
-                for fire in fires:
-
-                  # loop over sub-hour interval (default hourly)
-                  icount = 0
-                  for interval in range(self._SERI):
-                    min_dur_str = "{:0>2}".format(icount*minutes_per_interval) + " 00"+"{:0>2}".format(minutes_per_interval)
-                    if self._SERI == 1:
-                        min_dur_str = "00 0100"
-                    icount += 1
-
-                    # Get some properties from the fire location
-                    lat = fire.latitude
-                    lon = fire.longitude
-
-                    record_fmt = "%s %s %8.4f %9.4f %6.0f %7.2f %7.2f %15.2f\n"
-                    rows, dummy  = get_emissions_rows_data(fire, dt, self.config, self._reduction_factor)
-                    for height, pm25, area, heat in rows:
-                        emis.write(record_fmt % (dt_str, min_dur_str, lat, lon,
-                            height, pm25, area, heat))
-                    if dummy:
-                        self._fires_wo_emissions += 1
-
-
+                for i in range(num_fires):
+                    # Rows are the same for each sub-hour interval
+                    row_strs = [row_fmt % tuple(r) for r in rows[i][:num_rows[i]]]
+                    # loop over sub-hour interval (default hourly)
+                    for min_dur_str in min_dur_strs:
+                        prefix = "%s %s %s" % (dt_str, min_dur_str, lat_lon_strs[i])
+                        emis.write(''.join([prefix + r for r in row_strs]))
+
+                self._fires_wo_emissions = int(dummy.sum())
                 if self._fires_wo_emissions > 0:
                     logging.debug("%d of %d fires had no emissions for hour %d",
                         self._fires_wo_emissions, num_fires, hour)
@@ -666,38 +706,16 @@ class HYSPLITDispersion(DispersionBase):
         self._grid_params = hysplit_utils.get_grid_params(
             met_info=self._met_info, fires=self._fires)
 
-    def _write_control_file(self, fires, control_file, concFile):
-
-        num_fires = len(fires)
-        num_heights = self.num_output_quantiles + 1  # number of quantiles used, plus ground level
-        num_sources = num_fires * num_heights * self._SERI
-
-        # An arbitrary height value.  Used for the default source height
-        # in the CONTROL file.  This can be anything we want, because
-        # the actual source heights are overridden in the EMISS.CFG file.
-        sourceHeight = 15.0
-
-        verticalMethod = self._get_vertical_method()
-
-        # Height of the top of the model domain
-        modelTop = self.config("TOP_OF_MODEL_DOMAIN")
+    ##
+    ## CONTROL and SETUP.CFG
+    ##
 
-        #modelEnd = self._model_start + datetime.timedelta(hours=self._num_hours)
+    # An arbitrary height value.  Used for the default source height
+    # in the CONTROL file.  This can be anything we want, because
+    # the actual source heights are overridden in the EMISS.CFG file.
+    SOURCE_HEIGHT = 15.0
 
-        # Build the vertical Levels string
-        levels = self.config("VERTICAL_LEVELS")
-        numLevels = len(levels)
-        verticalLevels = " ".join(str(x) for x in levels)
-
-        # Warn about multiple sampling grid levels and KML/PNG image generation
-        if numLevels > 1:
-            logging.warning("KML and PNG images will be empty since more than 1 vertical level is selected")
-
-        # To minimize change in the following code, set aliases
-        centerLat =  self._grid_params["center_latitude"]
-        centerLon = self._grid_params["center_longitude"]
-        widthLon = self._grid_params["width_longitude"]
-        heightLat = self._grid_params["height_latitude"]
+    def _get_grid_spacing(self, num_fires):
         spacingLon = self._grid_params["spacing_longitude"]
         spacingLat = self._grid_params["spacing_latitude"]
 
@@ -748,139 +766,195 @@ class HYSPLITDispersion(DispersionBase):
                 logging.debug("Lon,Lat grid spacing for interval %d adjusted to %f,%f" % (interval,spacingLon,spacingLat))
             logging.info("Lon/Lat grid spacing for %d fires will be %f,%f" % (num_fires,spacingLon,spacingLat))
 
+        return spacingLat, spacingLon
+
+    def _get_control_file_template(self):
+        """Returns CONTROL file template, creating it on first call.
+
+        The template has fields 'num_sources', 'source_locations',
+        'grid_spacing' (which, with OPTIMIZE_GRID_RESOLUTION, depends on
+        the number of fires), and 'conc_file'.  Everything else only
+        depends on the config, met, grid, and dispersion window, which
+        are the same for all processes in the run.
+        """
+        # Note: if tranches' threads both create the template, they'll
+        #   create the same one, so there's no need to lock
+        if self._control_file_template:
+            return self._control_file_template
+
+        verticalMethod = self._get_vertical_method()
+
+        # Height of the top of the model domain
+        modelTop = self.config("TOP_OF_MODEL_DOMAIN")
+
+        # Build the vertical Levels string
+        levels = self.config("VERTICAL_LEVELS")
+        numLevels = len(levels)
+        verticalLevels = " ".join(str(x) for x in levels)
+
+        # Warn about multiple sampling grid levels and KML/PNG image generation
+        if numLevels > 1:
+            logging.warning("KML and PNG images will be empty since more than 1 vertical level is selected")
+
+        # To minimize change in the following code, set aliases
+        centerLat =  self._grid_params["center_latitude"]
+        centerLon = self._grid_params["center_longitude"]
+        widthLon = self._grid_params["width_longitude"]
+        heightLat = self._grid_params["height_latitude"]
+
         # Note: Due to differences in projections, the dimensions of this
         #       output grid are conservatively large.
         logging.info("HYSPLIT grid CENTER_LATITUDE = %s" % centerLat)
         logging.info("HYSPLIT grid CENTER_LONGITUDE = %s" % centerLon)
         logging.info("HYSPLIT grid HEIGHT_LATITUDE = %s" % heightLat)
         logging.info("HYSPLIT grid WIDTH_LONGITUDE = %s" % widthLon)
-        logging.info("HYSPLIT grid SPACING_LATITUDE = %s" % spacingLat)
-        logging.info("HYSPLIT grid SPACING_LONGITUDE = %s" % spacingLon)
-
-        with open(control_file, "w") as f:
-            # Starting time (year, month, day hour)
-            f.write(self._model_start.strftime("%y %m %d %H") + "\n")
-
-            # Number of sources
-            f.write("%d\n" % num_sources)
-
-            # Source locations
-            for fire in fires:
-                for height in range(num_heights):
-                  for intervals in range(self._SERI):
-                    f.write("%9.3f %9.3f %9.3f\n" % (fire.latitude, fire.longitude, sourceHeight))
-
-            # Total run time (hours)
-            f.write("%04d\n" % self._num_hours)
-
-            # Method to calculate vertical motion
-            f.write("%d\n" % verticalMethod)
-
-            # Top of model domain
-            f.write("%9.1f\n" % modelTop)
-
-            # Number of input data grids (met files)
-            f.write("%d\n" % len(self._met_info['files']))
-            # Directory for input data grid and met file name
-            for filename in sorted(self._met_info['files']):
-                f.write("./\n")
-                f.write("%s\n" % os.path.basename(filename))
-
-            # Number of pollutants = 1 (only modeling PM2.5 for now)
-            f.write("1\n")
-            # Pollutant ID (4 characters)
-            f.write("PM25\n")
-            # Emissions rate (per hour) (Ken's code says "Emissions source strength (mass per second)" -- which is right?)
-            f.write("{}\n".format(self.config("EMISSIONS_RATE")))
-            # Duration of emissions (hours)
-            f.write(" %9.3f\n" % self._num_hours)
-            # Source release start time (year, month, day, hour, minute)
-            f.write("%s\n" % self._model_start.strftime("%y %m %d %H %M"))
-
-            # Number of simultaneous concentration grids
-            f.write("1\n")
-
-            # Sampling grid center location (latitude, longitude)
-            f.write("%9.3f %9.3f\n" % (centerLat, centerLon))
-            # Sampling grid spacing (degrees latitude and longitude)
-            f.write("%9.3f %9.3f\n" % (spacingLat, spacingLon))
-            # Sampling grid span (degrees latitude and longitude)
-            f.write("%9.3f %9.3f\n" % (heightLat, widthLon))
-
-            # Directory of concentration output file
-            f.write("./\n")
-            # Filename of concentration output file
-            f.write("%s\n" % os.path.basename(concFile))
-
-            # Number of vertical concentration levels in output sampling grid
-            f.write("%d\n" % numLevels)
-            # Height of each sampling level in meters AGL
-            f.write("%s\n" % verticalLevels)
-
-            # Sampling start time (year month day hour minute)
-            f.write("%s\n" % self._model_start.strftime("%y %m %d %H %M"))
-
-            # Sampling stop time (year month day hour minute)
-            # The following would be the same as
-            # model_end = self._model_start + datetime.timedelta(
-            #     hours=self._num_hours)
-            model_end = self._model_start + datetime.timedelta(
-                hours=self._num_hours)
-            f.write("%s\n" % model_end.strftime("%y %m %d %H %M"))
-
-            # Sampling interval (type hour minute)
-            # A type of 0 gives an average over the interval.
-            sampling_interval_type = int(self.config("SAMPLING_INTERVAL_TYPE"))
-            sampling_interval_hour = int(self.config("SAMPLING_INTERVAL_HOUR"))
-            sampling_interval_min  = int(self.config("SAMPLING_INTERVAL_MIN"))
-            #f.write("0 1 00\n")
-            f.write("%d %d %d\n" % (sampling_interval_type, sampling_interval_hour, sampling_interval_min))
-
-            # Number of pollutants undergoing deposition
-            f.write("1\n") # only modeling PM2.5 for now
-
-            # Particle diameter (um), density (g/cc), shape
-            particle_diamater = self.config("PARTICLE_DIAMETER")
-            particle_density  = self.config("PARTICLE_DENSITY")
-            particle_shape    = self.config("PARTICLE_SHAPE")
-            #f.write("1.0 1.0 1.0\n")
-            f.write("%g %g %g\n" % ( particle_diamater, particle_density, particle_shape))
-
-
-            # Dry deposition:
-            #    deposition velocity (m/s),
-            #    molecular weight (g/mol),
-            #    surface reactivity ratio,
-            #    diffusivity ratio,
-            #    effective Henry's constant
-            dry_dep_velocity    = self.config("DRY_DEP_VELOCITY")
-            dry_dep_mol_weight  = self.config("DRY_DEP_MOL_WEIGHT")
-            dry_dep_reactivity  = self.config("DRY_DEP_REACTIVITY")
-            dry_dep_diffusivity = self.config("DRY_DEP_DIFFUSIVITY")
-            dry_dep_eff_henry   = self.config("DRY_DEP_EFF_HENRY")
-            #f.write("0.0 0.0 0.0 0.0 0.0\n")
-            f.write("%g %g %g %g %g\n" % ( dry_dep_velocity, dry_dep_mol_weight, dry_dep_reactivity, dry_dep_diffusivity, dry_dep_eff_henry))
-
-            # Wet deposition (gases):
-            #     actual Henry's constant (M/atm),
-            #     in-cloud scavenging ratio (L/L),
-            #     below-cloud scavenging coefficient (1/s)
-            wet_dep_actual_henry   = self.config("WET_DEP_ACTUAL_HENRY")
-            wet_dep_in_cloud_scav    = self.config("WET_DEP_IN_CLOUD_SCAV")
-            wet_dep_below_cloud_scav = self.config("WET_DEP_BELOW_CLOUD_SCAV")
-            #f.write("0.0 0.0 0.0\n")
-            f.write("%g %g %g\n" % ( wet_dep_actual_henry, wet_dep_in_cloud_scav, wet_dep_below_cloud_scav ))
-
-            # Radioactive decay half-life (days)
-            radioactive_half_life = self.config("RADIOACTIVE_HALF_LIVE")
-            #f.write("0.0\n")
-            f.write("%g\n" % radioactive_half_life)
-
-            # Pollutant deposition resuspension constant (1/m)
-            # non-zero requires the definition of a deposition grid
-            f.write("0.0\n")
+        if not self.config("OPTIMIZE_GRID_RESOLUTION"):
+            logging.info("HYSPLIT grid SPACING_LATITUDE = %s" % self._grid_params["spacing_latitude"])
+            logging.info("HYSPLIT grid SPACING_LONGITUDE = %s" % self._grid_params["spacing_longitude"])
+
+        t = FileTemplate()
+
+        # Starting time (year, month, day hour)
+        t.add(self._model_start.strftime("%y %m %d %H") + "\n")
+
+        # Number of sources
+        t.add_field('num_sources')
+
+        # Source locations
+        t.add_field('source_locations')
+
+        # Total run time (hours)
+        t.add("%04d\n" % self._num_hours)
+
+        # Method to calculate vertical motion
+        t.add("%d\n" % verticalMethod)
+
+        # Top of model domain
+        t.add("%9.1f\n" % modelTop)
+
+        # Number of input data grids (met files)
+        t.add("%d\n" % len(self._met_info['files']))
+        # Directory for input data grid and met file name
+        for filename in sorted(self._met_info['files']):
+            t.add("./\n")
+            t.add("%s\n" % os.path.basename(filename))
+
+        # Number of pollutants = 1 (only modeling PM2.5 for now)
+        t.add("1\n")
+        # Pollutant ID (4 characters)
+        t.add("PM25\n")
+        # Emissions rate (per hour) (Ken's code says "Emissions source strength (mass per second)" -- which is right?)
+        t.add("{}\n".format(self.config("EMISSIONS_RATE")))
+        # Duration of emissions (hours)
+        t.add(" %9.3f\n" % self._num_hours)
+        # Source release start time (year, month, day, hour, minute)
+        t.add("%s\n" % self._model_start.strftime("%y %m %d %H %M"))
+
+        # Number of simultaneous concentration grids
+        t.add("1\n")
+
+        # Sampling grid center location (latitude, longitude)
+        t.add("%9.3f %9.3f\n" % (centerLat, centerLon))
+        # Sampling grid spacing (degrees latitude and longitude)
+        t.add_field('grid_spacing')
+        # Sampling grid span (degrees latitude and longitude)
+        t.add("%9.3f %9.3f\n" % (heightLat, widthLon))
+
+        # Directory of concentration output file
+        t.add("./\n")
+        # Filename of concentration output file
+        t.add_field('conc_file')
+
+        # Number of vertical concentration levels in output sampling grid
+        t.add("%d\n" % numLevels)
+        # Height of each sampling level in meters AGL
+        t.add("%s\n" % verticalLevels)
+
+        # Sampling start time (year month day hour minute)
+        t.add("%s\n" % self._model_start.strftime("%y %m %d %H %M"))
+
+        # Sampling stop time (year month day hour minute)
+        model_end = self._model_start + datetime.timedelta(
+            hours=self._num_hours)
+        t.add("%s\n" % model_end.strftime("%y %m %d %H %M"))
+
+        # Sampling interval (type hour minute)
+        # A type of 0 gives an average over the interval.
+        sampling_interval_type = int(self.config("SAMPLING_INTERVAL_TYPE"))
+        sampling_interval_hour = int(self.config("SAMPLING_INTERVAL_HOUR"))
+        sampling_interval_min  = int(self.config("SAMPLING_INTERVAL_MIN"))
+        t.add("%d %d %d\n" % (sampling_interval_type, sampling_interval_hour, sampling_interval_min))
+
+        # Number of pollutants undergoing deposition
+        t.add("1\n") # only modeling PM2.5 for now
+
+        # Particle diameter (um), density (g/cc), shape
+        particle_diamater = self.config("PARTICLE_DIAMETER")
+        particle_density  = self.config("PARTICLE_DENSITY")
+        particle_shape    = self.config("PARTICLE_SHAPE")
+        t.add("%g %g %g\n" % ( particle_diamater, particle_density, particle_shape))
+
+        # Dry deposition:
+        #    deposition velocity (m/s),
+        #    molecular weight (g/mol),
+        #    surface reactivity ratio,
+        #    diffusivity ratio,
+        #    effective Henry's constant
+        dry_dep_velocity    = self.config("DRY_DEP_VELOCITY")
+        dry_dep_mol_weight  = self.config("DRY_DEP_MOL_WEIGHT")
+        dry_dep_reactivity  = self.config("DRY_DEP_REACTIVITY")
+        dry_dep_diffusivity = self.config("DRY_DEP_DIFFUSIVITY")
+        dry_dep_eff_henry   = self.config("DRY_DEP_EFF_HENRY")
+        t.add("%g %g %g %g %g\n" % ( dry_dep_velocity, dry_dep_mol_weight, dry_dep_reactivity, dry_dep_diffusivity, dry_dep_eff_henry))
+
+        # Wet deposition (gases):
+        #     actual Henry's constant (M/atm),
+        #     in-cloud scavenging ratio (L/L),
+        #     below-cloud scavenging coefficient (1/s)
+        wet_dep_actual_henry   = self.config("WET_DEP_ACTUAL_HENRY")
+        wet_dep_in_cloud_scav    = self.config("WET_DEP_IN_CLOUD_SCAV")
+        wet_dep_below_cloud_scav = self.config("WET_DEP_BELOW_CLOUD_SCAV")
+        t.add("%g %g %g\n" % ( wet_dep_actual_henry, wet_dep_in_cloud_scav, wet_dep_below_cloud_scav ))
+
+        # Radioactive decay half-life (days)
+        radioactive_half_life = self.config("RADIOACTIVE_HALF_LIVE")
+        t.add("%g\n" % radioactive_half_life)
+
+        # Pollutant deposition resuspension constant (1/m)
+        # non-zero requires the definition of a deposition grid
+        t.add("0.0\n")
+
+        self._control_file_template = t
+        return t
+
+    def _write_control_file(self, fires, control_file, concFile):
+        num_fires = len(fires)
+        num_heights = self.num_output_quantiles + 1  # number of quantiles used, plus ground level
+        num_sources = num_fires * num_heights * self._SERI
+
+        # Each fire's location is repeated for each height and interval
+        source_locations = ''.join([
+            ("%9.3f %9.3f %9.3f\n" % (fire.latitude, fire.longitude,
+                self.SOURCE_HEIGHT)) * (num_heights * self._SERI)
+            for fire in fires
+        ])
+
+        self._get_control_file_template().write(control_file,
+            num_sources="%d\n" % num_sources,
+            source_locations=source_locations,
+            grid_spacing="%9.3f %9.3f\n" % self._get_grid_spacing(num_fires),
+            conc_file="%s\n" % os.path.basename(concFile))
+
+    def _get_setup_file_template(self):
+        """Returns SETUP.CFG template, creating it on first call.
+
+        The template has fields 'maxpar' and 'numpar' (which may depend on
+        the number of fires and cpus), 'pinpf', 'ninit' and 'poutf'
+        (which depend on the process's particle files), and 'efile'.
+        """
+        if self._setup_file_template:
+            return self._setup_file_template
 
-    def _write_setup_file(self, fires, emissions_file, setup_file, ninit_val, ncpus, tranche_num):
         # Advanced setup options
         # adapted from Robert's HysplitGFS Perl script
 
@@ -889,7 +963,6 @@ class HYSPLITDispersion(DispersionBase):
         # pardump vars
         ndump_val = int(self.config("NDUMP"))
         ncycl_val = int(self.config("NCYCL"))
-        dump_datetime = self._model_start + datetime.timedelta(hours=ndump_val)
 
         # emission cycle time
         qcycle_val =self.config("QCYCLE")
@@ -901,6 +974,111 @@ class HYSPLITDispersion(DispersionBase):
         tratio_val = self.config("TRATIO")
         delt_val = self.config("DELT")
 
+        # conversion module
+        ichem_val = int(self.config("ICHEM"))
+
+        # minimum size in grid units of the meteorological sub-grid
+        mgmin_val = int(self.config("MGMIN"))
+
+        # Turbulence-Dispersion Computations
+        kblt_val  = int(self.config("KBLT"))
+        kdef_val  = int(self.config("KDEF"))
+        kbls_val  = int(self.config("KBLS"))
+        kzmix_val = int(self.config("KZMIX"))
+        tvmix_val = self.config("TVMIX")
+        kmixd_val = int(self.config("KMIXD"))
+        kmix0_val = int(self.config("KMIX0"))
+
+        t = FileTemplate()
+        t.add("&SETUP\n")
+
+        # conversion module
+        t.add("  ICHEM = %d,\n" % ichem_val)
+
+        # qcycle: the number of hours between emission start cycles
+        t.add("  QCYCLE = %f,\n" % qcycle_val)
+
+        # mgmin: default is 10 (from the hysplit user manual). however,
+        #        once a run complained and said i need to reaise this
+        #        variable to some value around what i have here
+        t.add("  MGMIN = %d,\n" % mgmin_val)
+
+        # maxpar: max number of particles that are allowed to be active at one time
+        t.add_field('maxpar')
+
+        # numpar: number of particles (or puffs) permited than can be released
+        #         during one time step
+        t.add_field('numpar')
+
+        # khmax: maximum particle duration in terms of hours after relase
+        t.add("  KHMAX = %d,\n" % khmax_val)
+
+        # delt: used to set time step integration interval (used along
+        #       with tratio
+        t.add("  DELT = %g,\n" % delt_val)
+        t.add("  TRATIO = %g,\n" % tratio_val)
+
+        # initd: # 0 - Horizontal and Vertical Particle
+        #          1 - Horizontal Gaussian Puff, Vertical Top Hat Puff
+        #          2 - Horizontal and Vertical Top Hat Puff
+        #          3 - Horizontal Gaussian Puff, Vertical Particle
+        #          4 - Horizontal Top-Hat Puff, Vertical Particle (default)
+        t.add("  INITD = %d,\n" % initd_val)
+
+        # make the 'smoke initizilaztion' files?
+        # pinfp: particle initialization file (see also ninit); only
+        #        written if ninit > 0
+        t.add_field('pinpf')
+
+        # ninit: (used along side parinit) sets the type of initialization...
+        #        0 - no initialzation (even if files are present)
+        #        1 = read parinit file only once at initialization time
+        #        2 = check each hour, if there is a match then read those
+        #            values in
+        #        3 = like '2' but replace emissions instead of adding to
+        #            existing particles
+        t.add_field('ninit')
+
+        if self.config("MAKE_INIT_FILE"):
+            # pardump: particle output/dump file
+            t.add_field('poutf')
+
+            # ndump: when/how often to dump a pardump file negative values
+            #        indicate to just one create just one 'restart' file at
+            #        abs(hours) after the model start
+            # NOTE: negative hours do no actually appear to be supported, rcs)
+            t.add("  NDUMP = %d,\n" % ndump_val)
+
+            # ncycl: set the interval at which time a pardump file is written
+            #        after the 1st file (which is first created at
+            #        T = ndump hours after the start of the model simulation
+            t.add("  NCYCL = %d,\n" % ncycl_val)
+
+        # efile: the name of the emissions info (used to vary emission rate etc (and
+        #        can also be used to change emissions time
+        t.add_field('efile')
+
+        # Turbulence-Dispersion Computation
+        t.add("  KBLT = %d,\n" % kblt_val)
+        t.add("  KDEF = %d,\n" % kdef_val)
+        t.add("  KBLS = %d,\n" % kbls_val)
+        t.add("  KZMIX = %d,\n" % kzmix_val)
+        t.add("  TVMIX = %g,\n" % tvmix_val)
+        t.add("  KMIXD = %d,\n" % kmixd_val)
+
+        # if kmix0_val < 0 don't write to the SETUP.CFG file. this allows
+        # for hysplit's default values (which can differ for dispersion vs
+        # trajectory runs) to be used; otherwise, use this value as the
+        # minimum value for the mixing depth
+        if ( kmix0_val > 0 ):
+          t.add("  KMIX0 = %d,\n" % kmix0_val)
+
+        t.add("&END\n")
+
+        self._setup_file_template = t
+        return t
+
+    def _write_setup_file(self, fires, emissions_file, setup_file, ninit_val, ncpus, tranche_num):
         # set numpar (if 0 then set to num_fires * num_heights)
         # else set to value given (hysplit default of 500)
         num_fires = len(fires)
@@ -924,7 +1102,6 @@ class HYSPLITDispersion(DispersionBase):
         if tranche_num is not None:
             parinit = parinit + '-' + str(tranche_num).zfill(2)
 
-
         # name of the particle output file (check for strftime strings)
         pardump = self.config("PARDUMP")
         if "%" in pardump:
@@ -932,113 +1109,25 @@ class HYSPLITDispersion(DispersionBase):
         if tranche_num is not None:
             pardump = pardump + '-' + str(tranche_num).zfill(2)
 
-        # conversion module
-        ichem_val = int(self.config("ICHEM"))
-
-        # minimum size in grid units of the meteorological sub-grid
-        mgmin_val = int(self.config("MGMIN"))
-
-        # Turbulence-Dispersion Computations
-        kblt_val  = int(self.config("KBLT"))
-        kdef_val  = int(self.config("KDEF"))
-        kbls_val  = int(self.config("KBLS"))
-        kzmix_val = int(self.config("KZMIX"))
-        tvmix_val = self.config("TVMIX")
-        kmixd_val = int(self.config("KMIXD"))
-        kmix0_val = int(self.config("KMIX0"))
-
-        with open(setup_file, "w") as f:
-            f.write("&SETUP\n")
-
-            # conversion module
-            f.write("  ICHEM = %d,\n" % ichem_val)
-
-            # qcycle: the number of hours between emission start cycles
-            f.write("  QCYCLE = %f,\n" % qcycle_val)
-
-            # mgmin: default is 10 (from the hysplit user manual). however,
-            #        once a run complained and said i need to reaise this
-            #        variable to some value around what i have here
-            f.write("  MGMIN = %d,\n" % mgmin_val)
-
-            # maxpar: max number of particles that are allowed to be active at one time
-            f.write("  MAXPAR = %d,\n" % max_particles)
-
-            # numpar: number of particles (or puffs) permited than can be released
-            #         during one time step
-            f.write("  NUMPAR = %d,\n" % num_sources)
-
-            # khmax: maximum particle duration in terms of hours after relase
-            f.write("  KHMAX = %d,\n" % khmax_val)
-
-            # delt: used to set time step integration interval (used along
-            #       with tratio
-            f.write("  DELT = %g,\n" % delt_val)
-            f.write("  TRATIO = %g,\n" % tratio_val)
-
-            # initd: # 0 - Horizontal and Vertical Particle
-            #          1 - Horizontal Gaussian Puff, Vertical Top Hat Puff
-            #          2 - Horizontal and Vertical Top Hat Puff
-            #          3 - Horizontal Gaussian Puff, Vertical Particle
-            #          4 - Horizontal Top-Hat Puff, Vertical Particle (default)
-            f.write("  INITD = %d,\n" % initd_val)
-
-            # make the 'smoke initizilaztion' files?
-            # pinfp: particle initialization file (see also ninit)
-            if ninit_val > 0:
-                f.write("  PINPF = \"%s\",\n" % parinit)
-
-            # ninit: (used along side parinit) sets the type of initialization...
-            #        0 - no initialzation (even if files are present)
-            #        1 = read parinit file only once at initialization time
-            #        2 = check each hour, if there is a match then read those
-            #            values in
-            #        3 = like '2' but replace emissions instead of adding to
-            #            existing particles
-            f.write("  NINIT = %d,\n" % ninit_val)
-
-            # pardump: particle output/dump file
-            if self.config("MAKE_INIT_FILE"):
-                pardump_dir = os.path.dirname(pardump)
-                if not os.path.isdir(pardump_dir):
-                    # Even though we check if the dir exists before calling
-                    # os.makedirs, set exist_ok=True in case of race
-                    # condition in multi-process mode.  (It's happened)
-                    os.makedirs(pardump_dir, exist_ok=True)
-
-                f.write("  POUTF = \"%s\",\n" % pardump)
-                logging.info("Dumping particles to %s starting at %s every %s hours" % (pardump, dump_datetime, ncycl_val))
-
-            # ndump: when/how often to dump a pardump file negative values
-            #        indicate to just one create just one 'restart' file at
-            #        abs(hours) after the model start
-            # NOTE: negative hours do no actually appear to be supported, rcs)
-            if self.config("MAKE_INIT_FILE"):
-                f.write("  NDUMP = %d,\n" % ndump_val)
-
-            # ncycl: set the interval at which time a pardump file is written
-            #        after the 1st file (which is first created at
-            #        T = ndump hours after the start of the model simulation
-            if self.config("MAKE_INIT_FILE"):
-                f.write("  NCYCL = %d,\n" % ncycl_val)
-
-            # efile: the name of the emissions info (used to vary emission rate etc (and
-            #        can also be used to change emissions time
-            f.write("  EFILE = \"%s\",\n" % os.path.basename(emissions_file))
-
-            # Turbulence-Dispersion Computation
-            f.write("  KBLT = %d,\n" % kblt_val)
-            f.write("  KDEF = %d,\n" % kdef_val)
-            f.write("  KBLS = %d,\n" % kbls_val)
-            f.write("  KZMIX = %d,\n" % kzmix_val)
-            f.write("  TVMIX = %g,\n" % tvmix_val)
-            f.write("  KMIXD = %d,\n" % kmixd_val)
-
-            # if kmix0_val < 0 don't write to the SETUP.CFG file. this allows
-            # for hysplit's default values (which can differ for dispersion vs
-            # trajectory runs) to be used; otherwise, use this value as the
-            # minimum value for the mixing depth
-            if ( kmix0_val > 0 ):
-              f.write("  KMIX0 = %d,\n" % kmix0_val)
-
-            f.write("&END\n")
+        poutf = ""
+        if self.config("MAKE_INIT_FILE"):
+            pardump_dir = os.path.dirname(pardump)
+            if not os.path.isdir(pardump_dir):
+                # Even though we check if the dir exists before calling
+                # os.makedirs, set exist_ok=True in case of race
+                # condition in multi-process mode.  (It's happened)
+                os.makedirs(pardump_dir, exist_ok=True)
+
+            poutf = "  POUTF = \"%s\",\n" % pardump
+            dump_datetime = self._model_start + datetime.timedelta(
+                hours=int(self.config("NDUMP")))
+            logging.info("Dumping particles to %s starting at %s every %s hours" % (
+                pardump, dump_datetime, int(self.config("NCYCL"))))
+
+        self._get_setup_file_template().write(setup_file,
+            maxpar="  MAXPAR = %d,\n" % max_particles,
+            numpar="  NUMPAR = %d,\n" % num_sources,
+            pinpf="  PINPF = \"%s\",\n" % parinit if ninit_val > 0 else "",
+            ninit="  NINIT = %d,\n" % ninit_val,
+            poutf=poutf,
+            efile="  EFILE = \"%s\",\n" % os.path.basename(emissions_file))
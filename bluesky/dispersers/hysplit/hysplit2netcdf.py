@@ -0,0 +1,335 @@
+"""bluesky.dispersers.hysplit.hysplit2netcdf
+
+Streaming conversion of HYSPLIT binary concentration output ('cdump')
+files to IOAPI formatted NetCDF, as an alternative to the hysplit2netcdf
+executable.  The cdump file is read one record (i.e. one pollutant at one
+level at one time step) at a time, and each is written to the NetCDF file
+as it's read, so that memory use is bounded by the size of one horizontal
+grid rather than by the size of the whole concentration field.
+
+The cdump format is described in the HYSPLIT user's guide.  It's a
+sequence of big-endian Fortran unformatted records:
+
+    1. met model id, met start time, # starting locations, packing flag
+    2. (one per starting location) release time, lat, lng, height
+    3. # lat and lng points, lat and lng spacing, lower left lat and lng
+    4. # levels, level heights
+    5. # pollutants, pollutant ids
+    For each sample:
+      6. sample start time
+      7. sample stop time
+      8. (one per pollutant per level) pollutant id, level height, and
+         either all concentrations or, if packed, the non-zero
+         concentrations with their grid indices
+"""
+
+__author__ = "Joel Dubowy"
+
+import concurrent.futures
+import datetime
+import logging
+import struct
+
+import netCDF4
+import numpy
+
+__all__ = [
+    'CdumpReader',
+    'convert',
+    'convert_files'
+]
+
+##
+## Reading
+##
+
+PACKED_DTYPE = numpy.dtype([('i', '>i2'), ('j', '>i2'), ('conc', '>f4')])
+
+def _parse_time(year, month, day, hour, minute=0):
+    # HYSPLIT writes two digit years
+    if year < 100:
+        year += 2000 if year < 40 else 1900
+    return datetime.datetime(year, month, day, hour, minute)
+
+class CdumpReader():
+    """Reads a HYSPLIT cdump file, record by record
+
+    Header information is read on instantiation.  Iterating yields
+    (sample_start, sample_stop, pollutant, level, concentrations) tuples,
+    concentrations being a lat x lng float32 array.
+    """
+
+    def __init__(self, f):
+        self._f = f
+
+        r = self._read_record()
+        self.met_model = r[:4].decode().strip()
+        year, month, day, hour, fhour, num_locations, packing = struct.unpack(
+            '>7i', r[4:32])
+        self.met_start = _parse_time(year, month, day, hour)
+        self.packed = packing == 1
+
+        self.starting_locations = []
+        for i in range(num_locations):
+            r = self._read_record()
+            year, month, day, hour = struct.unpack('>4i', r[:16])
+            lat, lng, height = struct.unpack('>3f', r[16:28])
+            minute = struct.unpack('>i', r[28:32])[0] if len(r) >= 32 else 0
+            self.starting_locations.append({
+                "release_start": _parse_time(year, month, day, hour, minute),
+                "latitude": lat, "longitude": lng, "height": height
+            })
+
+        r = self._read_record()
+        self.num_lats, self.num_lngs = struct.unpack('>2i', r[:8])
+        self.lat_spacing, self.lng_spacing, self.lower_left_lat, \
+            self.lower_left_lng = struct.unpack('>4f', r[8:24])
+
+        r = self._read_record()
+        num_levels = struct.unpack('>i', r[:4])[0]
+        self.levels = list(struct.unpack('>{}i'.format(num_levels),
+            r[4:4 + 4 * num_levels]))
+
+        r = self._read_record()
+        num_pollutants = struct.unpack('>i', r[:4])[0]
+        self.pollutants = [r[4 + 4 * i:8 + 4 * i].decode().strip()
+            for i in range(num_pollutants)]
+
+    def _read_record(self):
+        """Reads a Fortran unformatted sequential record, which may be
+        split into subrecords (indicated by negative lengths)
+        """
+        data = b''
+        while True:
+            marker = self._f.read(4)
+            if not marker:
+                if data:
+                    raise ValueError("Truncated cdump file")
+                return None
+            length = struct.unpack('>i', marker)[0]
+            data += self._f.read(abs(length))
+            self._f.read(4)
+            if length >= 0:
+                return data
+
+    def _read_time(self):
+        r = self._read_record()
+        if r is None:
+            return None
+        year, month, day, hour, minute, fhour = struct.unpack('>6i', r[:24])
+        return _parse_time(year, month, day, hour, minute)
+
+    def _parse_concentrations(self, r):
+        if self.packed:
+            num = struct.unpack('>i', r[8:12])[0]
+            packed = numpy.frombuffer(r, dtype=PACKED_DTYPE, count=num,
+                offset=12)
+            conc = numpy.zeros((self.num_lats, self.num_lngs), dtype=numpy.float32)
+            conc[packed['j'] - 1, packed['i'] - 1] = packed['conc']
+            return conc
+        # Fortran order, with longitude varying fastest
+        return numpy.frombuffer(r, dtype='>f4', count=self.num_lats * self.num_lngs,
+            offset=8).reshape(self.num_lats, self.num_lngs).astype(numpy.float32)
+
+    def __iter__(self):
+        num_records = len(self.pollutants) * len(self.levels)
+        while True:
+            sample_start = self._read_time()
+            if sample_start is None:
+                return
+            sample_stop = self._read_time()
+            for i in range(num_records):
+                r = self._read_record()
+                if r is None:
+                    raise ValueError("Truncated cdump file")
+                pollutant = r[:4].decode().strip()
+                level = struct.unpack('>i', r[4:8])[0]
+                yield (sample_start, sample_stop, pollutant, level,
+                    self._parse_concentrations(r))
+
+
+##
+## Writing
+##
+
+IOAPI_VERSION = "$Id: @(#) ioapi library version 3.0 $"
+EXEC_ID = "????????????????"
+GDNAM = "HYSPLIT CONC"
+UPNAM = "hysplit2netCDF"
+FILEDESC = ["Hysplit Concentration Model Output", "lat-lon coordinate system"]
+# IOAPI file description is 60 lines of 80 characters
+MXDLEN = 80
+MXDESC = 60
+NAMLEN = 16
+# IOAPI codes
+GRDDED3 = 1
+LATGRD3 = 1
+VGZVAL3 = 5
+BADVAL3 = -9999.0
+
+def _yyyyddd(dt):
+    return int(dt.strftime('%Y%j'))
+
+def _hhmmss(dt):
+    return int(dt.strftime('%H%M%S'))
+
+def _duration_hhmmss(td):
+    seconds = int(td.total_seconds())
+    return (seconds // 3600) * 10000 + (seconds % 3600 // 60) * 100 + seconds % 60
+
+class _NetCDFWriter():
+
+    def __init__(self, output_file, reader, first_sample, scale, compression):
+        self._reader = reader
+        self._scale = numpy.float32(scale)
+        self._levels = {l: k for k, l in enumerate(reader.levels)}
+        now = datetime.datetime.now(datetime.timezone.utc)
+        start, stop = first_sample
+
+        self._ds = netCDF4.Dataset(output_file, 'w',
+            format='NETCDF4_CLASSIC' if compression else 'NETCDF3_CLASSIC')
+        ds = self._ds
+        ds.set_auto_maskandscale(False)
+        ds.setncatts({
+            "IOAPI_VERSION": IOAPI_VERSION.ljust(MXDLEN),
+            "EXEC_ID": EXEC_ID.ljust(MXDLEN),
+            "FTYPE": numpy.int32(GRDDED3),
+            "CDATE": numpy.int32(_yyyyddd(now)),
+            "CTIME": numpy.int32(_hhmmss(now)),
+            "WDATE": numpy.int32(_yyyyddd(now)),
+            "WTIME": numpy.int32(_hhmmss(now)),
+            "SDATE": numpy.int32(_yyyyddd(stop)),
+            "STIME": numpy.int32(_hhmmss(stop)),
+            "TSTEP": numpy.int32(_duration_hhmmss(stop - start)),
+            "NTHIK": numpy.int32(1),
+            "NCOLS": numpy.int32(reader.num_lngs),
+            "NROWS": numpy.int32(reader.num_lats),
+            "NLAYS": numpy.int32(len(reader.levels)),
+            "NVARS": numpy.int32(len(reader.pollutants)),
+            "GDTYP": numpy.int32(LATGRD3),
+            "P_ALP": numpy.float64(0.0),
+            "P_BET": numpy.float64(0.0),
+            "P_GAM": numpy.float64(0.0),
+            "XCENT": numpy.float64(reader.lower_left_lng
+                + (reader.num_lngs - 1) * reader.lng_spacing / 2),
+            "YCENT": numpy.float64(reader.lower_left_lat
+                + (reader.num_lats - 1) * reader.lat_spacing / 2),
+            "XORIG": numpy.float64(reader.lower_left_lng),
+            "YORIG": numpy.float64(reader.lower_left_lat),
+            "XCELL": numpy.float64(reader.lng_spacing),
+            "YCELL": numpy.float64(reader.lat_spacing),
+            "VGTYP": numpy.int32(VGZVAL3),
+            "VGTOP": numpy.float32(BADVAL3),
+            "VGLVLS": numpy.array(reader.levels + [0], dtype=numpy.float32),
+            "GDNAM": GDNAM.ljust(NAMLEN),
+            "UPNAM": UPNAM.ljust(NAMLEN),
+            "VAR-LIST": ''.join([p.ljust(NAMLEN) for p in reader.pollutants]),
+            "FILEDESC": ''.join([l.ljust(MXDLEN) for l in FILEDESC]).ljust(
+                MXDLEN * MXDESC),
+            "HISTORY": ""
+        })
+
+        ds.createDimension('TSTEP', None)
+        ds.createDimension('DATE-TIME', 2)
+        ds.createDimension('LAY', len(reader.levels))
+        ds.createDimension('VAR', len(reader.pollutants))
+        ds.createDimension('ROW', reader.num_lats)
+        ds.createDimension('COL', reader.num_lngs)
+
+        v = ds.createVariable('TFLAG', 'i4', ('TSTEP', 'VAR', 'DATE-TIME'))
+        v.setncatts({
+            "units": "<YYYYDDD,HHMMSS>",
+            "long_name": "TFLAG".ljust(NAMLEN),
+            "var_desc": "Timestep-valid flags:  (1) YYYYDDD or (2) HHMMSS".ljust(MXDLEN)
+        })
+
+        compression_kwargs = {}
+        if compression:
+            # Chunked by horizontal grid, matching how records are written
+            compression_kwargs = dict(zlib=True, complevel=compression,
+                chunksizes=(1, 1, reader.num_lats, reader.num_lngs))
+        for p in reader.pollutants:
+            v = ds.createVariable(p, 'f4', ('TSTEP', 'LAY', 'ROW', 'COL'),
+                **compression_kwargs)
+            v.setncatts({
+                "long_name": p.ljust(NAMLEN),
+                "units": "ug/m^3".ljust(NAMLEN),
+                "var_desc": p.ljust(MXDLEN)
+            })
+
+        self._num_steps = 0
+        self._sample_stop = None
+
+    def write(self, sample_stop, pollutant, level, conc):
+        if sample_stop != self._sample_stop:
+            self._sample_stop = sample_stop
+            self._num_steps += 1
+            self._ds['TFLAG'][self._num_steps - 1] = numpy.array(
+                [[_yyyyddd(sample_stop), _hhmmss(sample_stop)]]
+                * len(self._reader.pollutants), dtype=numpy.int32)
+        self._ds[pollutant][self._num_steps - 1, self._levels[level]] = (
+            conc * self._scale)
+
+    def close(self):
+        self._ds.close()
+        return self._num_steps
+
+def convert(input_file, output_file, scale=1.0, compression=0):
+    """Converts a HYSPLIT cdump file to IOAPI formatted NetCDF
+
+    args:
+     - input_file -- HYSPLIT concentration (i.e. cdump) file
+     - output_file -- NetCDF file to write
+
+    kwargs:
+     - scale -- factor by which to multiply concentrations (e.g. 1000000
+       to convert from grams to micrograms)
+     - compression -- zlib compression level, 0 (no compression; writes
+       NETCDF3_CLASSIC, like hysplit2netcdf) through 9; compressed output
+       is NETCDF4_CLASSIC
+
+    Returns number of time steps written
+    """
+    with open(input_file, 'rb') as f:
+        reader = CdumpReader(f)
+        writer = None
+        try:
+            for sample_start, sample_stop, pollutant, level, conc in reader:
+                # The file is created once the first sample's times are
+                # known, since they determine its header
+                if writer is None:
+                    writer = _NetCDFWriter(output_file, reader,
+                        (sample_start, sample_stop), scale, compression)
+                writer.write(sample_stop, pollutant, level, conc)
+        finally:
+            num_steps = writer.close() if writer else 0
+
+    if not num_steps:
+        raise ValueError("No concentration data in {}".format(input_file))
+    logging.debug("Converted %s to %s (%d time steps)", input_file,
+        output_file, num_steps)
+    return num_steps
+
+def _convert(args):
+    input_file, output_file, kwargs = args
+    return convert(input_file, output_file, **kwargs)
+
+def convert_files(files, num_processes=1, **kwargs):
+    """Converts multiple cdump files, optionally in parallel
+
+    args:
+     - files -- list of (input_file, output_file) tuples
+
+    kwargs:
+     - num_processes -- number of files to convert at once, each in its
+       own process
+     - any of convert's kwargs
+
+    Returns list of number of time steps written to each output file
+    """
+    args = [(i, o, kwargs) for i, o in files]
+    if num_processes > 1 and len(files) > 1:
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=min(num_processes, len(files))) as executor:
+            return list(executor.map(_convert, args))
+    return [_convert(a) for a in args]
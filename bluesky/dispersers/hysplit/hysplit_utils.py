@@ -8,6 +8,7 @@ TODO: refactor this as a class
 __author__ = "Joel Dubowy and Sonoma Technology, Inc."
 
 import datetime
+import heapq
 import logging
 import math
 from functools import reduce
@@ -15,10 +16,13 @@ from functools import reduce
 from bluesky.exceptions import BlueSkyConfigurationError
 from bluesky.models.fires import Fire
 from .. import PHASES
+from ..dispersioninput import HourlyEmissions
 from bluesky.config import Config
 
 __all__ = [
     'create_fire_sets',
+    'estimate_fire_set_costs',
+    'assign_tranches',
     'create_fire_tranches',
     'compute_num_processes',
     'ensure_tranch_has_dummy_fire',
@@ -47,18 +51,115 @@ def create_fire_sets(fires):
     """
     return  [[f] for f in fires]
 
+# Relative weights of the components of a fire's estimated HYSPLIT cost:
+#  - location_hours -- hours with emissions within the dispersion window
+#  - source_hours -- emitting sources (i.e. plume levels plus the
+#    smoldering level) per hour; HYSPLIT releases a fixed number of
+#    particles per source per hour, regardless of emissions
+#  - pm25_tons -- total PM2.5 emitted within the dispersion window
+TRANCHE_COST_WEIGHTS = {
+    "location_hours": 1.0,
+    "source_hours": 1.0,
+    "pm25_tons": 0.01
+}
+
+HOUR_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+def _estimate_fire_cost(fire, model_start, num_hours, num_levels, weights):
+    emissions = fire.get('timeprofiled_emissions')
+    if not emissions:
+        return 0.0
+
+    # Keys are local time, which can be compared as strings
+    utc_offset = datetime.timedelta(hours=fire.get('utc_offset') or 0)
+    first_hour = (model_start + utc_offset).strftime(HOUR_FORMAT)
+    end_hour = (model_start + utc_offset
+        + datetime.timedelta(hours=num_hours)).strftime(HOUR_FORMAT)
+
+    if isinstance(emissions, HourlyEmissions):
+        hourly_pm25 = emissions.species_items('PM2.5')
+    else:
+        hourly_pm25 = [(hr, e and e.get('PM2.5')) for hr, e in emissions.items()]
+
+    location_hours = 0
+    pm25 = 0.0
+    for hr, e in hourly_pm25:
+        if first_hour <= hr < end_hour and e:
+            location_hours += 1
+            pm25 += e
+
+    return (weights['location_hours'] * location_hours
+        + weights['source_hours'] * location_hours * num_levels
+        + weights['pm25_tons'] * pm25)
+
+def estimate_fire_set_costs(fire_sets, model_start, num_hours, num_levels,
+        weights=None):
+    """Estimates the relative HYSPLIT cost of each set of fires
+
+    args:
+     - fire_sets -- list of lists of fires
+     - model_start -- UTC start of dispersion window
+     - num_hours -- number of hours in dispersion window
+     - num_levels -- number of emissions sources per fire per hour (i.e.
+       the number of vertical levels, plus one for smoldering emissions)
+
+    kwargs:
+     - weights -- dict of cost component weights, overriding those in
+       TRANCHE_COST_WEIGHTS
+    """
+    weights = dict(TRANCHE_COST_WEIGHTS, **(weights or {}))
+    return [sum([_estimate_fire_cost(f, model_start, num_hours,
+        num_levels, weights) for f in fire_set]) for fire_set in fire_sets]
+
+def assign_tranches(costs, num_processes):
+    """Assigns items to tranches using the longest processing time (LPT)
+    rule; items are taken in decreasing order of cost, and each is
+    assigned to the tranche with the lowest total cost so far.
+
+    Returns list of lists of item indices, each in increasing order.  Ties
+    in cost are broken by number of items, so that zero cost items are
+    spread across tranches and no tranche is empty if there are at least
+    as many items as tranches, and then by item and tranche order, so
+    that assignment is deterministic.
+    """
+    tranches = [[] for i in range(num_processes)]
+    loads = [(0.0, 0, i) for i in range(num_processes)]
+    for idx in sorted(range(len(costs)), key=lambda i: (-costs[i], i)):
+        load, num_items, nproc = heapq.heappop(loads)
+        tranches[nproc].append(idx)
+        heapq.heappush(loads, (load + costs[idx], num_items + 1, nproc))
+    return [sorted(t) for t in tranches]
+
 def create_fire_tranches(fire_sets, num_processes, model_start, num_hours,
-        grid_params):
+        grid_params, costs=None):
     """Creates tranches of FireLocationData, each tranche to be processed by its
     own HYSPLIT process.
 
-    @todo: More sophisticated tranching (e.g. taking into account acreage,
-    location, etc.; to keep the number of fires in each tranche as close
-    as possible to to # fires / # tranches).
+    If costs (i.e. the estimated cost of each fire set) are given, fire
+    sets are assigned with assign_tranches so that the tranches' total
+    costs are as close as possible.  Otherwise, tranches get contiguous
+    fire sets, with the number of fire sets in each as close as possible
+    to # fire sets / # tranches.
     """
     fill_in_dummy_fires(fire_sets, num_processes, model_start, num_hours,
         grid_params)
     n_sets = len(fire_sets)
+
+    if costs is not None:
+        # dummy fires' costs are negligible
+        costs = list(costs) + [0.0] * (n_sets - len(costs))
+        tranche_idxs = assign_tranches(costs, num_processes)
+        logging.info("Running %d HYSPLIT Dispersion model processes "
+            "on %d fires (i.e. events), balanced by estimated cost" % (
+            num_processes, n_sets))
+        fire_tranches = []
+        for nproc, idxs in enumerate(tranche_idxs):
+            logging.debug("Process %d:  %d fire sets, cost %.1f" % (
+                nproc, len(idxs), sum([costs[i] for i in idxs])))
+            fire_tranches.append(reduce(lambda x,y: x + y,
+                [fire_sets[i] for i in idxs], []))
+        return fire_tranches
+
     #num_processes = min(n_sets, num_processes)  # just to be sure
     min_n_fire_sets_per_process = n_sets // num_processes
     extra_fire_cutoff = n_sets % num_processes
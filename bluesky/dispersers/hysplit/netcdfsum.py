@@ -0,0 +1,126 @@
+"""bluesky.dispersers.hysplit.netcdfsum
+
+Sums HYSPLIT tranche netCDF outputs in process, as an alternative to
+running ncea and ncks.  Tranche files are added to a running total as each
+tranche finishes, while other tranches are still running, and are read
+in chunks along the first (i.e. time) dimension, so that memory use is
+bounded by the chunk size rather than by the size of the grid.
+"""
+
+__author__ = "Joel Dubowy"
+
+import logging
+import os
+import threading
+
+import netCDF4
+import numpy
+
+__all__ = [
+    'NetCDFSummer'
+]
+
+# Max number of grid values to read at once (~32Mb of float64 values)
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+
+def _chunks(shape, chunk_size):
+    """Yields slices along the first dimension, each covering at most
+    chunk_size values (but at least one index of the first dimension)
+    """
+    if not shape:
+        yield ()
+        return
+    n = max(1, chunk_size // max(1, int(numpy.prod(shape[1:]))))
+    for i in range(0, shape[0], n):
+        yield slice(i, min(i + n, shape[0]))
+
+
+class NetCDFSummer():
+    """Sums variables across netCDF files with the same structure
+
+    The output file has the summed variables, plus variables copied from
+    the first file added (e.g. TFLAG, which is the same in each tranche's
+    output and mustn't be summed), along with the first file's dimensions
+    and global attributes.
+
+    args:
+     - output_file -- pathname of file to write
+
+    kwargs:
+     - sum_variables -- names of variables to sum
+     - copy_variables -- names of variables to copy from the first file
+     - chunk_size -- max number of values of each variable to read at once
+    """
+
+    def __init__(self, output_file, sum_variables=('PM25',),
+            copy_variables=('TFLAG',), chunk_size=DEFAULT_CHUNK_SIZE):
+        self._output_file = output_file
+        self._sum_variables = list(sum_variables)
+        self._copy_variables = list(copy_variables)
+        self._chunk_size = chunk_size
+        self._first_file = None
+        self._totals = {}
+        self._lock = threading.Lock()
+        self.num_files = 0
+
+    def _totals_file(self, var):
+        return '{}.{}.sum'.format(self._output_file, var)
+
+    def add(self, nc_file):
+        """Adds the file's variables to the running totals"""
+        with self._lock, netCDF4.Dataset(nc_file) as src:
+            src.set_auto_maskandscale(False)
+            if self._first_file is None:
+                self._first_file = nc_file
+                # Running totals are kept in float64 memory mapped files
+                # so that only the chunk being added is held in memory
+                for var in self._sum_variables:
+                    self._totals[var] = numpy.memmap(self._totals_file(var),
+                        dtype=numpy.float64, mode='w+',
+                        shape=src.variables[var].shape)
+
+            for var in self._sum_variables:
+                src_var = src.variables[var]
+                if src_var.shape != self._totals[var].shape:
+                    raise ValueError("Shape of {} in {} ({}) differs from that "
+                        "in {} ({})".format(var, nc_file, src_var.shape,
+                        self._first_file, self._totals[var].shape))
+                for s in _chunks(src_var.shape, self._chunk_size):
+                    self._totals[var][s] += src_var[s]
+
+            self.num_files += 1
+            logging.debug("Added %s to %s (%d files)", nc_file,
+                self._output_file, self.num_files)
+
+    def write(self):
+        """Writes the output file, with the summed and copied variables"""
+        if self._first_file is None:
+            raise ValueError("No netCDF files to sum")
+
+        with netCDF4.Dataset(self._first_file) as src, netCDF4.Dataset(
+                self._output_file, 'w', format=src.data_model) as dst:
+            src.set_auto_maskandscale(False)
+            dst.set_auto_maskandscale(False)
+            dst.setncatts({a: src.getncattr(a) for a in src.ncattrs()})
+            for name, dim in src.dimensions.items():
+                dst.createDimension(name, None if dim.isunlimited() else len(dim))
+
+            for var in self._sum_variables + self._copy_variables:
+                src_var = src.variables[var]
+                attrs = {a: src_var.getncattr(a) for a in src_var.ncattrs()}
+                dst_var = dst.createVariable(var, src_var.dtype,
+                    src_var.dimensions, fill_value=attrs.pop('_FillValue', None))
+                dst_var.setncatts(attrs)
+                data = self._totals.get(var, src_var)
+                for s in _chunks(src_var.shape, self._chunk_size):
+                    dst_var[s] = numpy.asarray(data[s]).astype(src_var.dtype)
+
+        self.close()
+        logging.info("Summed %d netCDF files into %s", self.num_files,
+            self._output_file)
+
+    def close(self):
+        """Removes running totals' files"""
+        for var in list(self._totals):
+            del self._totals[var]
+            os.remove(self._totals_file(var))
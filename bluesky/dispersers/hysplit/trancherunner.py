@@ -0,0 +1,193 @@
+"""bluesky.dispersers.hysplit.trancherunner
+
+Runs HYSPLIT tranches on a bounded pool of worker threads.  Each worker
+waits on its own HYSPLIT subprocess, so the number of workers is the
+number of concurrent HYSPLIT processes.  That number is capped by the
+number of cores and, optionally, by available memory, so that runs with
+many tranches don't oversubscribe the node.
+"""
+
+__author__ = "Joel Dubowy"
+
+import collections
+import concurrent.futures
+import logging
+import os
+import time
+
+from bluesky.config import Config
+
+__all__ = [
+    'Tranche',
+    'TrancheRunner'
+]
+
+# How often to check available memory when waiting to start a tranche
+MEMORY_POLL_SECONDS = 5
+
+def get_available_memory_mb():
+    """Returns available memory, in MB, or None if it can't be determined
+    (i.e. on systems without /proc/meminfo)
+    """
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class Tranche():
+
+    def __init__(self, tranche_num, fires, working_dir):
+        self.tranche_num = tranche_num
+        self.fires = fires
+        self.working_dir = working_dir
+        self.attempts = 0
+        self.runtime = None
+        self.exc = None
+
+
+class TrancheRunner():
+    """Runs tranches with at most max_concurrency at a time, retrying
+    failed tranches up to max_retries times
+
+    args:
+     - run_func -- called with (fires, working_dir, tranche_num) for each
+       tranche
+
+    kwargs:
+     - max_concurrency -- max number of tranches to run at once; defaults
+       to the number of cores divided by cpus_per_tranche
+     - cpus_per_tranche -- number of cores used by each tranche (e.g.
+       with MPI); default 1
+     - memory_mb -- estimated memory used by each tranche; if specified,
+       the number of concurrent tranches is limited to what fits in
+       available memory, and each tranche after the first waits until
+       there's enough available memory to start it
+     - max_retries -- number of times to retry each failed tranche
+     - on_complete -- called, in the calling thread, with each tranche
+       that completes successfully, while other tranches are running
+    """
+
+    def __init__(self, run_func, max_concurrency=None, cpus_per_tranche=1,
+            memory_mb=None, max_retries=0, on_complete=None):
+        self._run_func = run_func
+        self._max_concurrency = max_concurrency
+        self._cpus_per_tranche = max(int(cpus_per_tranche or 1), 1)
+        self._memory_mb = memory_mb
+        self._max_retries = max(int(max_retries or 0), 0)
+        self._on_complete = on_complete
+
+    def _compute_concurrency(self, num_tranches):
+        concurrency = self._max_concurrency
+        if not concurrency or concurrency < 1:
+            concurrency = max((os.cpu_count() or 1) // self._cpus_per_tranche, 1)
+
+        if self._memory_mb:
+            available = get_available_memory_mb()
+            if available is not None:
+                concurrency = min(concurrency,
+                    max(int(available // self._memory_mb), 1))
+
+        return max(min(concurrency, num_tranches), 1)
+
+    def _can_start(self, num_running):
+        if not self._memory_mb or num_running == 0:
+            return True
+        available = get_available_memory_mb()
+        return available is None or available >= self._memory_mb
+
+    def _init_worker(self, config):
+        Config().set(config)
+
+    def _run_tranche(self, tranche):
+        if not os.path.exists(tranche.working_dir):
+            os.makedirs(tranche.working_dir)
+        t = time.time()
+        try:
+            self._run_func(tranche.fires, tranche.working_dir,
+                tranche.tranche_num)
+        finally:
+            tranche.runtime = time.time() - t
+
+    def run(self, tranches):
+        """Runs the tranches, returning after all have completed or, in
+        the case of a tranche failing after all retries, after those
+        already started have completed.  Exceptions are recorded in each
+        tranche's 'exc' attribute.  Exceptions raised by on_complete are
+        raised after all tranches already started have completed.
+        """
+        self.concurrency = self._compute_concurrency(len(tranches))
+        logging.info("Running %d HYSPLIT processes, at most %d at a time",
+            len(tranches), self.concurrency)
+
+        pending = collections.deque(tranches)
+        running = {}
+        completed = []
+        on_complete_exc = None
+        num_complete = 0
+        failed = False
+
+        # Worker threads need the config loaded in the main thread.
+        # Otherwise, they'll just be using defaults
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.concurrency, thread_name_prefix='hysplit',
+                initializer=self._init_worker, initargs=(Config().get(),)) as pool:
+            while running or completed or (pending and not failed):
+                while (pending and not failed and len(running) < self.concurrency
+                        and self._can_start(len(running))):
+                    tranche = pending.popleft()
+                    tranche.attempts += 1
+                    logging.info("Starting HYSPLIT process %d on %d fires "
+                        "(attempt %d)", tranche.tranche_num, len(tranche.fires),
+                        tranche.attempts)
+                    running[pool.submit(self._run_tranche, tranche)] = tranche
+
+                # Handled after starting queued tranches, so that they
+                # run in the meantime
+                while completed and not failed:
+                    try:
+                        self._on_complete(completed.pop(0))
+                    except Exception as e:
+                        on_complete_exc = e
+                        failed = True
+
+                if not running:
+                    break
+
+                # If waiting on memory, wake up periodically to check again
+                timeout = (MEMORY_POLL_SECONDS if pending and not failed
+                    and len(running) < self.concurrency else None)
+                done, _ = concurrent.futures.wait(running, timeout=timeout,
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for future in done:
+                    tranche = running.pop(future)
+                    tranche.exc = future.exception()
+                    if tranche.exc and tranche.attempts <= self._max_retries:
+                        logging.warning("HYSPLIT process %d failed (%s); "
+                            "retrying", tranche.tranche_num, tranche.exc)
+                        pending.appendleft(tranche)
+                    elif tranche.exc:
+                        logging.error("HYSPLIT process %d failed after %d "
+                            "attempt(s): %s", tranche.tranche_num,
+                            tranche.attempts, tranche.exc)
+                        failed = True
+                    else:
+                        num_complete += 1
+                        logging.info("HYSPLIT process %d completed in %.1fs "
+                            "(%d of %d complete)", tranche.tranche_num,
+                            tranche.runtime, num_complete, len(tranches))
+                        if self._on_complete:
+                            completed.append(tranche)
+
+        if failed and pending:
+            logging.error("Skipped %d HYSPLIT processes after failure",
+                len(pending))
+        if on_complete_exc:
+            raise on_complete_exc
+
+        return tranches
@@ -9,25 +9,32 @@ __author__ = "Joel Dubowy and Sonoma Technology, Inc."
 
 __version__ = "0.1.0"
 
+import collections
+import concurrent.futures
 import json
 import logging
 import math
 import os
 import zipfile
 import shutil
+import tempfile
 from datetime import timedelta
 
 from afdatetime import parsing as datetime_parsing
 
 from bluesky import io
+from bluesky.config import Config
 from bluesky.datetimeutils import parse_utc_offset
 
 from .. import (
     DispersionBase, TONS_PER_HR_TO_GRAMS_PER_SEC, BTU_TO_MW, PHASES
 )
+from ..dispersioninput import get_hourly_emissions
 
 __all__ = [
-    'VSMOKEDispersion'
+    'VSMOKEDispersion',
+    'VSMOKEJobRunner',
+    'KMZWriter'
 ]
 
 class VSMOKEDispersion(DispersionBase):
@@ -42,6 +49,8 @@ class VSMOKEDispersion(DispersionBase):
         'VSMOKEGIS': 'vsmkgs'
     }
 
+    REQUIRED_SPECIES = ('PM2.5', 'CO')
+
     def __init__(self, met_info, **config):
         super(VSMOKEDispersion, self).__init__(met_info, **config)
         self._create_json = self.config("CREATE_JSON")
@@ -52,15 +61,10 @@ class VSMOKEDispersion(DispersionBase):
     def _required_activity_fields(self):
         return ('timeprofile', ) # this is supposed to return a tuple
 
-    def _set_input_file_vars(self, wdir):
-        self._input_file = os.path.join(wdir, "VSMOKE.IPT")
-        self._iso_input_file = os.path.join(wdir, "vsmkgs.ipt")
-
     def _set_kml_vars(self, wdir):
         # Define variables to make KML and KMZ files
         doc_kml = os.path.join(wdir, "doc.kml")
         logging.debug("Fire kmz = %s" % doc_kml)
-        self._kmz_files = [doc_kml]
 
         self._kmz_filename = os.path.join(self._run_output_dir,
             self.config("KMZ_FILE"))
@@ -71,87 +75,50 @@ class VSMOKEDispersion(DispersionBase):
 
         # Make KMZ object for fire
         self._legend_image = self.config("LEGEND_IMAGE")
-        self._my_kmz = KMZAnimation(doc_kml, self.config("OVERLAY_TITLE"),
-            self._legend_image)
+        self._my_kmz = KMZWriter(self._kmz_filename, doc_kml,
+            self.config("OVERLAY_TITLE"), self._legend_image)
+
+    def _set_geo_json_vars(self):
+        self._geo_json = None
+        if self._create_json:
+            # The GeoJSON is written directly to the run output dir, as
+            # each fire's output is completed
+            self._json_filename = os.path.join(self._run_output_dir,
+                self.config('JSON_FILE'))
+            self._geo_json = GeoJSON(self._json_filename)
 
     def _compute_local_dt(self, fire, hr):
-        dt = self._model_start + timedelta(hours=hr)
-        local_dt = dt + timedelta(hours=fire.utc_offset)
+        # The dispersion input's local hour strings, computed once per
+        # utc offset, are the keys of the fire's hourly data
         # TODO: will fire.timeprofiled_emissions always have string value keys
-        return local_dt.strftime('%Y-%m-%dT%H:%M:%S')
+        return self._dispersion_input.local_hours(fire.utc_offset)[hr]
 
     def _run(self, wdir):
         """Runs vsmoke
 
+        VSMOKEGIS, for each fire and hour, and VSMOKE, for each fire, are
+        run on a pool of at most NUM_WORKERS worker threads, each job in
+        its own scratch directory under the working dir.  Input files are
+        written, and outputs added to the KMZ and GeoJSON, in the main
+        thread, in fire and hour order, regardless of the order in which
+        jobs complete.  Fire-hour KML files and the GeoJSON file are written
+        as outputs are added, and the KMZ file is assembled from the KML
+        files at the end, so that only the current fire's output is held
+        in memory.
+
         args:
          - wdir -- working directory
         """
-        self._set_input_file_vars(wdir)
         self._set_kml_vars(wdir)
+        self._set_geo_json_vars()
 
-        # For each fire run VSMOKE and VSMOKEGIS
-        for fire in self._fires:
-            # TODO: check to make sure start+num_hours is within fire's
-            #   activity windows
-            in_var = INPUTVariables(fire)
-
-            # TODO: remove following line nad just use fire.utc_offset
-            #  instead of 'timezone' in all subsequent code
-            timezone = fire.utc_offset
-
-            # Get emissions for fire
-            if not fire.timeprofiled_emissions or not fire.consumption:
-                continue
-
-            logging.debug("%d hour run time for fireID %s",
-                self._num_hours, fire["id"])
-
-            # Run VSMOKE GIS for each hour
-            for hr in range(self._num_hours):
-                local_dt = self._compute_local_dt(fire, hr)
-                self._write_iso_input(fire, local_dt, in_var)
-
-                io.SubprocessExecutor().execute(self.BINARIES['VSMOKEGIS'], cwd=wdir)
-
-                # TODO: replace 'hr' with 'local_dt'
-                suffix = "{}_hour{}".format(fire.id, str(hr+1))
-                self._archive_file("vsmkgs.iso", src_dir=wdir, suffix=suffix)
-                self._archive_file("vsmkgs.opt", src_dir=wdir, suffix=suffix)
-                self._archive_file("vsmkgs.ipt", src_dir=wdir, suffix=suffix)
-
-                iso_file = os.path.join(wdir, "vsmkgs.iso")
-
-                # Make KML file
-                kml_name = in_var.fireID + "_" + str(hr+1) + ".kml"
-                kml_path = os.path.join(wdir, kml_name)
-                self._build_kml(kml_path, in_var, iso_file)
-                self._kmz_files.append(kml_path)
-                self._my_kmz.add_kml(kml_name, fire, hr)
-
-                pm25 = fire.timeprofiled_emissions[local_dt]['PM2.5']
-
-                self._add_geo_json(in_var, iso_file, fire['id'], timezone, hr, pm25)
-
-            # Write input files
-            self._write_input(fire, in_var)
-            # Run VSMOKE for fire
-            io.SubprocessExecutor().execute(self.BINARIES['VSMOKE'], cwd=wdir)
-
-            # Rename input and output files and archive
-            self._archive_file("VSMOKE.IPT", src_dir=wdir, suffix=fire.id)
-            self._archive_file("VSMOKE.OUT", src_dir=wdir, suffix=fire.id)
-
-        # Make KMZ file
-        self._my_kmz.write()
-        z = zipfile.ZipFile(self._kmz_filename, 'w', zipfile.ZIP_DEFLATED)
-        for kml in self._kmz_files:
-            if os.path.exists(kml):
-                z.write(kml, os.path.basename(kml))
-            else:
-                logging.error('Failure while trying to write KMZ file -- KML file does not exist')
-                logging.debug('File "%s" does not exist', kml)
-        z.write(self._legend_image, os.path.basename(self._legend_image))
-        z.close()
+        try:
+            self._run_jobs(wdir)
+        finally:
+            # Finish writing the KMZ and GeoJSON files, even if a job
+            # failed, so that they're valid and include completed fires
+            self._my_kmz.close()
+            json_file_name = self._create_geo_json(wdir)
 
         r = {
             "output": {
@@ -159,13 +126,123 @@ class VSMOKEDispersion(DispersionBase):
             }
         }
 
-        json_file_name = self._create_geo_json(wdir)
         if json_file_name:
             r['output']['json_file_name'] = json_file_name
         # TODO: anytheing else to include in response
         return r
 
-    def _write_input(self, fire, in_var):
+    def _run_jobs(self, wdir):
+        fire_dirs = []
+        with VSMOKEJobRunner(self.config("NUM_WORKERS")) as runner:
+            # For each fire run VSMOKE and VSMOKEGIS
+            for i, fire in enumerate(self._fires):
+                # TODO: check to make sure start+num_hours is within fire's
+                #   activity windows
+                in_var = INPUTVariables(fire)
+
+                # Get emissions for fire
+                if not fire.timeprofiled_emissions or not fire.consumption:
+                    continue
+
+                logging.debug("%d hour run time for fireID %s",
+                    self._num_hours, fire["id"])
+
+                fire_dir = os.path.join(wdir, "fire-{}".format(i))
+                fire_dirs.append(fire_dir)
+
+                # Run VSMOKE GIS for each hour
+                for hr in range(self._num_hours):
+                    job_dir = self._create_job_dir(fire_dir,
+                        "hour{}".format(hr+1))
+                    local_dt = self._compute_local_dt(fire, hr)
+                    self._write_iso_input(os.path.join(job_dir, "vsmkgs.ipt"),
+                        fire, local_dt, in_var)
+                    runner.submit(self._run_vsmokegis, job_dir, wdir,
+                        fire, hr, in_var)
+
+                # Write input files
+                job_dir = self._create_job_dir(fire_dir, "vsmoke")
+                self._write_input(os.path.join(job_dir, "VSMOKE.IPT"),
+                    fire, in_var)
+                # Run VSMOKE for fire
+                runner.submit(self._run_vsmoke, job_dir, fire)
+
+                # Add output of jobs that have already completed, so that
+                # results don't accumulate while the remaining jobs run
+                for r in runner.completed():
+                    self._add_hour_output(r)
+
+            for r in runner.completed(wait=True):
+                self._add_hour_output(r)
+
+        # Each job removes its own dir, leaving the fire dirs empty
+        for fire_dir in fire_dirs:
+            os.rmdir(fire_dir)
+
+    def _create_job_dir(self, fire_dir, name):
+        job_dir = os.path.join(fire_dir, name)
+        os.makedirs(job_dir, exist_ok=True)
+        return job_dir
+
+    ##
+    ## Jobs
+    ##
+
+    # The following are run in worker threads.  They only read
+    # fire and in_var, and write to their own job dir and to uniquely
+    # named files in the working and output dirs.  Once its files are
+    # archived, each job removes its dir, so that scratch dirs don't
+    # accumulate over the run.  (A failed job's dir is left in place.)
+
+    def _run_vsmokegis(self, job_dir, wdir, fire, hr, in_var):
+        io.SubprocessExecutor().execute(self.BINARIES['VSMOKEGIS'], cwd=job_dir)
+
+        iso_file = os.path.join(job_dir, "vsmkgs.iso")
+
+        # Make KML file
+        kml_path = os.path.join(wdir, in_var.fireID + "_" + str(hr+1) + ".kml")
+        self._build_kml(kml_path, in_var, iso_file)
+
+        isopleths = (self._build_isopleths(in_var, iso_file)
+            if self._create_json else None)
+
+        # TODO: replace 'hr' with 'local_dt'
+        suffix = "{}_hour{}".format(fire.id, str(hr+1))
+        for f in ("vsmkgs.iso", "vsmkgs.opt", "vsmkgs.ipt"):
+            self._archive_file(f, src_dir=job_dir, suffix=suffix, move=True)
+        shutil.rmtree(job_dir)
+
+        return fire, hr, kml_path, isopleths
+
+    def _run_vsmoke(self, job_dir, fire):
+        io.SubprocessExecutor().execute(self.BINARIES['VSMOKE'], cwd=job_dir)
+
+        # Rename input and output files and archive
+        self._archive_file("VSMOKE.IPT", src_dir=job_dir, suffix=fire.id,
+            move=True)
+        self._archive_file("VSMOKE.OUT", src_dir=job_dir, suffix=fire.id,
+            move=True)
+        shutil.rmtree(job_dir)
+
+    ##
+    ## Output
+    ##
+
+    def _add_hour_output(self, result):
+        # VSMOKE jobs don't return anything
+        if not result:
+            return
+
+        fire, hr, kml_path, isopleths = result
+        self._my_kmz.add_kml(kml_path, fire, hr)
+
+        if isopleths is not None:
+            local_dt = self._compute_local_dt(fire, hr)
+            pm25 = get_hourly_emissions(fire.timeprofiled_emissions,
+                local_dt, 'PM2.5')
+            self._add_geo_json(isopleths, fire['id'], fire.utc_offset, hr, pm25)
+
+    def _write_input(self, input_file, fire, in_var):
         """
         This function will create the input file needed to run VSMOKE.
         These parameters are fixed or are not used since user should provide stability.
@@ -222,7 +299,7 @@ class VSMOKEDispersion(DispersionBase):
         if warn:
             logging.warning("For fire " + in_var.fireID + ", used default values for the parameters: " + ', '.join(warn))
 
-        with open(self._input_file, "w") as f:
+        with open(input_file, "w") as f:
             f.write("60\n")
             f.write("%s\n" % in_var.title)
             f.write("%f %f %f %d %d %d %d %f %f %s %s %s %f %s\n" % (
@@ -250,14 +327,16 @@ class VSMOKEDispersion(DispersionBase):
                 heat = fire.get('heat', 0.0)
                 emtqh = (heat) / 3414425.94972     # Btu to MW
 
-                emtqpm = (fire.timeprofiled_emissions[local_dt]['PM2.5']
+                emtqpm = (get_hourly_emissions(fire.timeprofiled_emissions,
+                    local_dt, 'PM2.5')
                     * TONS_PER_HR_TO_GRAMS_PER_SEC)  # tons/hr to g/s
-                emtqco = (fire.timeprofiled_emissions[local_dt]['CO']
+                emtqco = (get_hourly_emissions(fire.timeprofiled_emissions,
+                    local_dt, 'CO')
                     * TONS_PER_HR_TO_GRAMS_PER_SEC)    # tons/hr to g/s
                 f.write("%d %f %f %f %f\n" % (
                     hour + 1, emtqpm, emtqco, emtqh, emtqr))
 
-    def _write_iso_input(self, fire, local_dt, in_var):
+    def _write_iso_input(self, input_file, fire, local_dt, in_var):
         """ Create the input file needed to run VSMOKEGIS. """
         # Plume rise characteristics
         grad_rise = self.config("GRAD_RISE")
@@ -303,11 +382,12 @@ class VSMOKEDispersion(DispersionBase):
             logging.warning("For fire " + in_var.fireID +
                 ", used default values for these parameters: " + ', '.join(warn))
 
-        with open(self._iso_input_file, "w") as f:
+        with open(input_file, "w") as f:
             heat = fire.get('heat', 0.0)
             emtqh = (heat) / 3414425.94972     # Btu to MW
 
-            emtqpm = (fire.timeprofiled_emissions[local_dt]['PM2.5']
+            emtqpm = (get_hourly_emissions(fire.timeprofiled_emissions,
+                local_dt, 'PM2.5')
                 * TONS_PER_HR_TO_GRAMS_PER_SEC)  # tons/hr to g/s
 
             f.write("%s\n" % in_var.title)
@@ -375,41 +455,94 @@ class VSMOKEDispersion(DispersionBase):
         mykml.close()
         mykml.write()
 
-    def _add_geo_json(self, in_var, iso_file, fire_id, timezone, hr, pm25):
-        if not self._create_json:
+    def _add_geo_json(self, isopleths, fire_id, timezone, hr, pm25):
+        if not self._geo_json:
             return
 
-        if not hasattr(self, '_geo_json'):
-            self._geo_json = GeoJSON()
-
-        isopleths = self._build_isopleths(in_var, iso_file)
-
         for c, interval in enumerate(self.ISOPLETHS):
             name = str(interval)
             self._geo_json.add_linestring(fire_id, self.ISONAMES[c], self.ISOCOLORS[c], hr, isopleths[name], timezone, pm25)
 
     def _create_geo_json(self, wdir):
-        if self._create_json and self._geo_json:
-            # TODO: remove commented out lines once I confirm that
-            #   writing directly to run output dir works
-            #temp_json = os.path.join(wdir, self.config('JSON_FILE'))
-            #self._geo_json.write(temp_json)
-            final_json = os.path.join(self._run_output_dir,
-                self.config('JSON_FILE'))
-            #shutil.copy(temp_json, final_json)
-            self._geo_json.write(final_json)
-            return final_json
+        if self._geo_json:
+            self._geo_json.close()
+            return self._json_filename
+
+class VSMOKEJobRunner():
+    """Runs VSMOKE and VSMOKEGIS jobs on a pool of at most num_workers
+    worker threads, and returns their results in the order in which they
+    were submitted
+
+    With one worker, jobs are run as they're submitted, in the main
+    thread, as they always have been.
+    """
+
+    def __init__(self, num_workers):
+        self.num_workers = max(int(num_workers or 1), 1)
+        self._pool = None
+        self._pending = collections.deque()
+
+    def __enter__(self):
+        if self.num_workers > 1:
+            # Worker threads need the config loaded in the main thread.
+            # Otherwise, they'll just be using defaults
+            self._pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.num_workers, thread_name_prefix='vsmoke',
+                initializer=self._init_worker, initargs=(Config().get(),))
+        return self
+
+    def _init_worker(self, config):
+        Config().set(config)
+
+    def __exit__(self, e_type, value, tb):
+        if self._pool:
+            # If a job failed, don't start any that haven't already been
+            # started, but wait for running ones to finish
+            for future in self._pending:
+                future.cancel()
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        self._pending.clear()
+
+    def submit(self, func, *args):
+        if self._pool:
+            self._pending.append(self._pool.submit(func, *args))
+        else:
+            future = concurrent.futures.Future()
+            future.set_result(func(*args))
+            self._pending.append(future)
+
+    def completed(self, wait=False):
+        """Yields results of submitted jobs, in the order submitted, up to
+        the first that hasn't completed, or all of them if wait is True.
+        A failed job's exception is raised when its result is reached.
+        """
+        while self._pending and (wait or self._pending[0].done()):
+            yield self._pending.popleft().result()
+
 
 class GeoJSON():
-    """ Used to create GeoJSON outputs """
+    """Used to create GeoJSON outputs
 
-    def __init__(self):
+    The GeoJSON object for each fire is written to the output file once
+    all of the fire's plume rings have been added, which is when a ring
+    for another fire is added, or the file is closed.  So, the output file
+    includes completed fires while a run is in progress, and only the
+    current fire's rings are held in memory.  Each fire's rings are expected
+    to be added consecutively.
+    """
+
+    def __init__(self, filepath):
         self.plume_rings = {}
+        self._num_fires = 0
+        self._f = open(filepath, 'w')
+        self._f.write('{"fires": [')
 
     def add_linestring(self, fire_id, aqi, color, hr, pts, timezone, pm25):
         """ For a particular fire, at a particular time,
         add a new rint of points to the GeoJSON. """
         if fire_id not in self.plume_rings:
+            self._write_fires()
             self.plume_rings[fire_id] = {}
         if aqi not in self.plume_rings[fire_id]:
             self.plume_rings[fire_id][aqi] = {}
@@ -426,67 +559,66 @@ class GeoJSON():
         for p in pts:
             self.plume_rings[fire_id][aqi][hr].append(p)
 
-    def write(self, filepath):
-        """ Write the JSON to an output file. """
-        f = open(filepath, 'w')
-        f.write(self.__str__())
-        f.close()
-
-    def __str__(self):
-        """Build a string of a single GeoJSON object for each fire,
-        inside a great JSON object.
+    def close(self):
+        """ Write the remaining fire and close the output file. """
+        self._write_fires()
+        self._f.write(']}')
+        self._f.close()
+
+    def _write_fires(self):
+        """Write a single GeoJSON object for each fire in self.plume_rings,
+        in the master JSON object's list of fires.
         """
-        # create a master JSON object
-
-        fires = []
-        # for each fire, create a GeoJSON object
         for fire_id in self.plume_rings:
-            fire_obj = {
-                "fire_id": fire_id,
-                "geo_json": {
-                    "type": "FeatureCollection",
-                    "features":[]
-                }
+            if self._num_fires:
+                self._f.write(', ')
+            self._f.write(json.dumps(self._fire_obj(fire_id)))
+            self._num_fires += 1
+        self.plume_rings = {}
+        self._f.flush()
+
+    def _fire_obj(self, fire_id):
+        fire_obj = {
+            "fire_id": fire_id,
+            "geo_json": {
+                "type": "FeatureCollection",
+                "features":[]
             }
-            # Note: the way the code is written,
-            #   self.plume_rings[fire_id][aqi]['pm25'] is the same for each aqi;
-            #   So, we can compute max_pm25_hour using the first aqi
-            pm25 = list(self.plume_rings[fire_id].values())[0]['pm25']
-            fire_obj['max_pm25_hour'] = max(pm25, key=lambda x: pm25[x])
-            for aqi in self.plume_rings[fire_id]:
-                # add a plume ring for each hour of the fire
-                hrs = sorted([h for h in self.plume_rings[fire_id][aqi].keys()
-                    if h not in ('color', 'timezone', 'pm25')])
-                for hr in hrs:
-                    # we need at least 4 points to guarantee our inputs are valid rings
-                    if len(self.plume_rings[fire_id][aqi][hr]) <= 3:
-                        continue
-
-                    new_feature = {
-                        "type": "Feature",
-                        "geometry": {
-                            "type": "LineString",
-                            "coordinates": []
-                        },
-                        "properties": {
-                            "AQI": aqi,
-                            "color": self.plume_rings[fire_id][aqi]['color'],
-                            "timezone": self.plume_rings[fire_id][aqi]['timezone'],
-                            "hour": hr
-                        }
+        }
+        # Note: the way the code is written,
+        #   self.plume_rings[fire_id][aqi]['pm25'] is the same for each aqi;
+        #   So, we can compute max_pm25_hour using the first aqi
+        pm25 = list(self.plume_rings[fire_id].values())[0]['pm25']
+        fire_obj['max_pm25_hour'] = max(pm25, key=lambda x: pm25[x])
+        for aqi in self.plume_rings[fire_id]:
+            # add a plume ring for each hour of the fire
+            hrs = sorted([h for h in self.plume_rings[fire_id][aqi].keys()
+                if h not in ('color', 'timezone', 'pm25')])
+            for hr in hrs:
+                # we need at least 4 points to guarantee our inputs are valid rings
+                if len(self.plume_rings[fire_id][aqi][hr]) <= 3:
+                    continue
+
+                new_feature = {
+                    "type": "Feature",
+                    "geometry": {
+                        "type": "LineString",
+                        "coordinates": []
+                    },
+                    "properties": {
+                        "AQI": aqi,
+                        "color": self.plume_rings[fire_id][aqi]['color'],
+                        "timezone": self.plume_rings[fire_id][aqi]['timezone'],
+                        "hour": hr
                     }
+                }
 
-                    for pt in self.plume_rings[fire_id][aqi][hr]:
-                        new_feature['geometry']['coordinates'].append(pt)
-
-                    fire_obj['geo_json']['features'].append(new_feature)
-
-            fires.append(fire_obj)
+                for pt in self.plume_rings[fire_id][aqi][hr]:
+                    new_feature['geometry']['coordinates'].append(pt)
 
-        return json.dumps({"fires": fires})
+                fire_obj['geo_json']['features'].append(new_feature)
 
-    def __repr__(self):
-        return self.__str__()
+        return fire_obj
 
 
 class KMLFile():
@@ -527,19 +659,28 @@ class KMLFile():
 
 
 class KMZAnimation():
-    """For creating a KMZ file used for Google Earth"""
+    """For creating the doc.kml file of a KMZ file used for Google Earth
+
+    A fire's NetworkLinks are held in memory only until a link for another
+    fire is added, at which point the fire's folder is written to a
+    temporary file.  Since the doc.kml header includes the time span of
+    all fires' links, doc.kml is written from that temporary file at the
+    end.  Each fire's links are expected to be added consecutively.
+    """
 
     def __init__(self, filename='doc.kml', overlay_title=" ", legend_image=" "):
         self.name = filename
-        self.fires = {}
+        self.fire_id = None
+        self.links = []
         self.overlay_title = overlay_title
         self.legend_image = legend_image
         self.min_time = ''
         self.max_time = ''
-        self.content = ''
+        self._folders = tempfile.TemporaryFile('w+',
+            dir=os.path.dirname(os.path.abspath(filename)))
 
-    def _add_header(self):
-        self.content = '''<?xml version="1.0" encoding="UTF-8"?>
+    def _add_header(self, output):
+        output.write('''<?xml version="1.0" encoding="UTF-8"?>
         <kml xmlns="http://earth.google.com/kml/2.2">
             <Document>
                 <name>%s</name>
@@ -556,11 +697,13 @@ class KMZAnimation():
                     <color>e0ffffff</color>
                     <Icon>%s</Icon>
                 </ScreenOverlay>
-        ''' % (self.overlay_title, self.min_time.isoformat(), self.max_time.isoformat(), self.legend_image)
+        ''' % (self.overlay_title, self.min_time and self.min_time.isoformat(),
+            self.max_time and self.max_time.isoformat(), self.legend_image))
 
     def add_kml(self, kmlfile, fire, hour):
-        if fire['id'] not in self.fires:
-            self.fires[fire['id']] = []
+        if fire['id'] != self.fire_id:
+            self._write_folder()
+            self.fire_id = fire['id']
 
         # TODO: pass in and use model start time instead ?
         fire_dt = datetime_parsing.parse(fire['start'])
@@ -580,41 +723,76 @@ class KMZAnimation():
             </NetworkLink>
             ''' % (fire['id'], dt.strftime('Hour %HZ'), dt.isoformat(), (dt + hour_delta).isoformat(), kmlfile)
 
-        self.fires[fire['id']].append(content)
+        self.links.append(content)
 
         if self.min_time == '' or dt < self.min_time:
             self.min_time = dt
         if self.max_time == '' or (dt + hour_delta) > self.max_time:
             self.max_time = dt
 
-    def _add_footer(self):
-        self.content += '''
-            </Document>
-        </kml>
-        '''
-
-    def _fill_content(self):
-        self.content = ''
-        self._add_header()
-
-        for _id in self.fires:
-            self.content += """
+    def _write_folder(self):
+        if self.links:
+            self._folders.write("""
             <Folder>
                 <name>%s</name>
-            """ % _id
+            """ % self.fire_id)
 
-            self.content += '\n'.join(self.fires[_id])
+            self._folders.write('\n'.join(self.links))
 
-            self.content += """
-            </Folder>"""
+            self._folders.write("""
+            </Folder>""")
+        self.links = []
 
-        self._add_footer()
+    def _add_footer(self, output):
+        output.write('''
+            </Document>
+        </kml>
+        ''')
 
     def write(self):
-        self._fill_content()
-        output = open(self.name, 'w')
-        output.write(self.content)
-        output.close()
+        """Writes doc.kml.  No more KML files can be added afterwards."""
+        self._write_folder()
+        self._folders.seek(0)
+        with open(self.name, 'w') as output:
+            self._add_header(output)
+            shutil.copyfileobj(self._folders, output)
+            self._add_footer(output)
+        self._folders.close()
+
+
+class KMZWriter():
+    """Writes a KMZ file from fire-hour KML files staged on disk
+
+    Each fire-hour's KML file stays in the working dir, where it's
+    available as soon as it's written, and only its path is held in
+    memory.  Google Earth reads the first KML file in a KMZ file, and
+    doc.kml, which links to the others, can't be written until all have
+    been added, so the KMZ file is written when closed, with doc.kml
+    first, followed by the fire-hour KML files, in the order added, and
+    the legend image.
+    """
+
+    def __init__(self, filename, doc_kml='doc.kml', overlay_title=" ",
+            legend_image=" "):
+        self.name = filename
+        self.legend_image = legend_image
+        self.animation = KMZAnimation(doc_kml, overlay_title, legend_image)
+        self._kml_files = []
+
+    def add_kml(self, kml_file, fire, hour):
+        self.animation.add_kml(os.path.basename(kml_file), fire, hour)
+        self._kml_files.append(kml_file)
+
+    def close(self):
+        self.animation.write()
+        with zipfile.ZipFile(self.name, 'w', zipfile.ZIP_DEFLATED) as z:
+            for kml in [self.animation.name] + self._kml_files:
+                if os.path.exists(kml):
+                    z.write(kml, os.path.basename(kml))
+                else:
+                    logging.error('Failure while trying to write KMZ file -- KML file does not exist')
+                    logging.debug('File "%s" does not exist', kml)
+            z.write(self.legend_image, os.path.basename(self.legend_image))
 
 
 class INPUTVariables():
@@ -5,6 +5,8 @@ __author__ = "Joel Dubowy"
 import datetime
 import logging
 
+import numpy
+
 from bluesky.config import Config
 from bluesky.datetimeutils import to_datetime, parse_utc_offset
 from bluesky.locationutils import LatLng
@@ -12,6 +14,86 @@ from bluesky.locationutils import LatLng
 from . import FiresActionBase
 
 
+class ActiveAreaTable():
+    """Columnar view of fires' active areas, for evaluating filters in bulk
+
+    Rows are in fire, activity collection, active area order.  Columns
+    are extracted only for the filters that need them, and only for rows
+    not already removed by preceding filters.
+    """
+
+    def __init__(self, fires):
+        self.fires = fires
+        self.rows = [(fire, aa) for fire in fires
+            for ac in fire.get('activity', [])
+            for aa in ac.get('active_areas', [])]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def column(self, extract, missing=None, active=None):
+        """Returns tuple containing list of values, one per row, and a
+        dict of FilterErrors, keyed by row index, for rows whose values
+        couldn't be determined
+
+        args
+         - extract -- function taking fire and active area and returning
+            value; may raise FireActivityFilter.FilterError
+        kwargs
+         - missing -- value to use for rows where extraction fails or
+            that are skipped
+         - active -- boolean array indicating which rows to evaluate;
+            defaults to all rows
+        """
+        values = []
+        errors = {}
+        for idx, (fire, aa) in enumerate(self.rows):
+            if active is not None and not active[idx]:
+                values.append(missing)
+                continue
+            try:
+                values.append(extract(fire, aa))
+            except FireActivityFilter.FilterError as e:
+                values.append(missing)
+                errors[idx] = e
+
+        return values, errors
+
+    def apply_mask(self, keep):
+        """Removes active areas not flagged in `keep`, along with any
+        activity collections left without active areas, rebuilding
+        each fire's lists only once.
+
+        Returns list of fires left with no activity.
+
+        args
+         - keep -- boolean array, with one element per row
+        """
+        # slicing lists is faster than slicing numpy arrays
+        keep = keep.tolist()
+        idx = 0
+        emptied = []
+        for fire in self.fires:
+            activity = fire.get('activity', [])
+            for ac in activity:
+                active_areas = ac.get('active_areas', [])
+                n = len(active_areas)
+                if not all(keep[idx:idx+n]):
+                    active_areas[:] = [aa for aa, k
+                        in zip(active_areas, keep[idx:idx+n]) if k]
+                    logging.debug('Filtered fire %s (%s)', fire.id,
+                        fire._private_id)
+                idx += n
+
+            if any([not ac.get('active_areas') for ac in activity]):
+                activity[:] = [ac for ac in activity if ac.get('active_areas')]
+
+            if len(activity) == 0:
+                emptied.append(fire)
+
+        return emptied
+
+
 class FireActivityFilter(FiresActionBase):
     """Class for filtering fire activity windows by various criteria.
 
@@ -55,13 +137,19 @@ class FireActivityFilter(FiresActionBase):
     NO_FILTERS_MSG = "No filters specified"
     def filter(self):
         """Runs all secified filtered
+
+        All filters are compiled first, and then evaluated together in
+        a single pass over a columnar view of all fires' active areas.
+        Fire activity lists are rebuilt once, at the end.
         """
+        filter_funcs = []
         for filter_field in self._filter_fields:
-            logging.debug('About to run %s filter', filter_field)
+            logging.debug('Compiling %s filter', filter_field)
 
             # get filter function
             try:
-                filter_func = self._get_filter_func(filter_field)
+                filter_funcs.append(
+                    (filter_field, self._get_filter_func(filter_field)))
 
             except self.FilterError as e:
                 if self._skip_failures:
@@ -71,10 +159,9 @@ class FireActivityFilter(FiresActionBase):
                 else:
                     raise
 
-            # run filter
-            self._filter(filter_func)
-            logging.info("Number of fires after running %s filter: %d",
-                filter_field, self._fires_manager.num_fires)
+        # run filters
+        if filter_funcs:
+            self._filter(filter_funcs)
 
     INVALID_FILTER_MSG = "Invalid filter"
     MISSING_FILTER_CONFIG_MSG = "Specify config for each filter"
@@ -96,47 +183,41 @@ class FireActivityFilter(FiresActionBase):
         kwargs.update(filter_field=filter_field)
         return filter_getter(**kwargs)
 
-    def _filter(self, filter_func):
-        """Filter by given filter func
+    def _filter(self, filter_funcs):
+        """Filter by given filter funcs
 
         args:
-         - filter_func -- function that takes fire and active area object
-            and returns boolean value indicating whether or not to remove
-            active area object.
+         - filter_funcs -- list of (filter field, filter func) tuples, where
+            each filter func takes an ActiveAreaTable and a boolean array
+            indicating which rows to evaluate, and returns a tuple
+            containing a boolean array indicating which active areas to
+            remove and a dict of FilterErrors, keyed by table row, for
+            active areas that couldn't be evaluated
+
+        Filters are applied in order.  Active areas removed by one filter
+        aren't evaluated by the ones that follow.  Fires are modified only
+        after all filters have been evaluated, so that they're left as is
+        if any filter fails.
         """
-        for fire in self._fires_manager.fires:
-            i = 0
-            while i < len(fire.get('activity', [])):
-                j = 0
-                while j < len(fire['activity'][i].get('active_areas', [])):
-                    try:
-                        if filter_func(fire, fire['activity'][i]['active_areas'][j]):
-                            fire['activity'][i]['active_areas'].pop(j)
-                            logging.debug('Filtered fire %s (%s)', fire.id,
-                                fire._private_id)
-                            # Note: if that was the last active area, then
-                            #    `j` must equal zero, and while loop will
-                            #    terminate
-                        else:
-                            j += 1
-
-                    except self.FilterError as e:
-                        if self._skip_failures:
-                            j += 1
-                            # str(e) is already detailed
-                            logging.warning(str(e))
-                            continue
-                        else:
-                            raise
-
-                if len(fire['activity'][i].get('active_areas', [])) == 0:
-                    fire['activity'].pop(i)
-
-                else:
-                    i += 1
-
-            if len(fire.get('activity', [])) == 0:
-                self._remove_fire(fire)
+        table = ActiveAreaTable(self._fires_manager.fires)
+        remove = numpy.zeros(len(table), dtype=bool)
+        for filter_field, filter_func in filter_funcs:
+            logging.debug('About to run %s filter', filter_field)
+            f_remove, f_errors = filter_func(table, ~remove)
+            for idx in sorted(f_errors):
+                if not self._skip_failures:
+                    raise f_errors[idx]
+                # str(e) is already detailed
+                logging.warning(str(f_errors[idx]))
+
+            # rows already removed shouldn't be counted again
+            f_remove &= ~remove
+            logging.info("Number of active areas removed by %s filter: %d",
+                filter_field, numpy.count_nonzero(f_remove))
+            remove |= f_remove
+
+        for fire in table.apply_mask(~remove):
+            self._remove_fire(fire)
 
     def _remove_fire(self, fire):
         """Removes fire from fires manager's `fires` list, and adds it
@@ -183,7 +264,7 @@ class FireActivityFilter(FiresActionBase):
             # This will never happen if called internally
             raise self.FilterError(self.SPECIFY_FILTER_FIELD_MSG)
 
-        def _filter(fire, active_area):
+        def _filter_active_area(fire, active_area):
             vals = set([active_area.get(filter_field)] if scope == 'active_area'
                 else [l.get(filter_field) for l in active_area.locations])
             if inclusion_list:
@@ -191,6 +272,10 @@ class FireActivityFilter(FiresActionBase):
             else:
                 return tolerance_func([v and v in exclusion_list for v in vals])
 
+        def _filter(table, active):
+            remove, errors = table.column(_filter_active_area, False, active)
+            return numpy.array(remove, dtype=bool), errors
+
         return _filter
 
 
@@ -230,23 +315,34 @@ class FireActivityFilter(FiresActionBase):
                 any([b['ne'][k] < b['sw'][k] for k in ['lat','lng']])):
             raise self.FilterError(self.INVALID_BOUNDARY_MSG)
 
-        def _filter(fire, active_area):
-            if not isinstance(active_area, dict):
-                self._fail_fire(fire, self.MISSING_FIRE_LOCATION_INFO_MSG)
-            try:
-                latlng = LatLng(active_area)
-                lat = latlng.latitude
-                lng = latlng.longitude
-            except ValueError as e:
-                self._fail_fire(fire, self.MISSING_FIRE_LOCATION_INFO_MSG)
-            if not lat or not lng:
-                self._fail_fire(fire, self.MISSING_FIRE_LOCATION_INFO_MSG)
+        def _filter(table, active):
+            latlngs, errors = table.column(self._get_latlng,
+                (numpy.nan, numpy.nan), active)
+            lat = numpy.array([ll[0] for ll in latlngs], dtype=float)
+            lng = numpy.array([ll[1] for ll in latlngs], dtype=float)
 
-            return (lat < b['sw']['lat'] or lat > b['ne']['lat'] or
-                lng < b['sw']['lng'] or lng > b['ne']['lng'])
+            # Note: NaN values, for rows that failed or were skipped,
+            # are never removed
+            remove = ((lat < b['sw']['lat']) | (lat > b['ne']['lat']) |
+                (lng < b['sw']['lng']) | (lng > b['ne']['lng']))
+            return remove, errors
 
         return _filter
 
+    def _get_latlng(self, fire, active_area):
+        if not isinstance(active_area, dict):
+            self._fail_fire(fire, self.MISSING_FIRE_LOCATION_INFO_MSG)
+        try:
+            latlng = LatLng(active_area)
+            lat = latlng.latitude
+            lng = latlng.longitude
+        except ValueError as e:
+            self._fail_fire(fire, self.MISSING_FIRE_LOCATION_INFO_MSG)
+        if not lat or not lng:
+            self._fail_fire(fire, self.MISSING_FIRE_LOCATION_INFO_MSG)
+
+        return (lat, lng)
+
     SPECIFY_MIN_OR_MAX_MSG = "Specify min and/or max area for filtering"
     INVALID_MIN_MAX_MUST_BE_POS_MSG = "Min and max areas must be positive for filtering"
     INVALID_MIN_MUST_BE_LTE_MAX_MSG = "Min area must be LTE max if both are specified"
@@ -267,20 +363,31 @@ class FireActivityFilter(FiresActionBase):
                 min_area > max_area):
             raise self.FilterError(self.INVALID_MIN_MUST_BE_LTE_MAX_MSG)
 
-        def _filter(fire, active_area):
-            try:
-                total_active_area = active_area.total_area
-            except:
-                self._fail_fire(fire, self.MISSING_ACTIVITY_AREA_MSG)
-
-            if total_active_area < 0.0:
-                self._fail_fire(fire, self.NEGATIVE_ACTIVITY_AREA_MSG)
+        def _filter(table, active):
+            areas, errors = table.column(self._get_total_area, numpy.nan,
+                active)
+            areas = numpy.array(areas, dtype=float)
 
-            return ((min_area is not None and total_active_area < min_area) or
-                (max_area is not None and total_active_area > max_area))
+            remove = numpy.zeros(len(areas), dtype=bool)
+            if min_area is not None:
+                remove |= areas < min_area
+            if max_area is not None:
+                remove |= areas > max_area
+            return remove, errors
 
         return _filter
 
+    def _get_total_area(self, fire, active_area):
+        try:
+            total_active_area = active_area.total_area
+        except:
+            self._fail_fire(fire, self.MISSING_ACTIVITY_AREA_MSG)
+
+        if total_active_area < 0.0:
+            self._fail_fire(fire, self.NEGATIVE_ACTIVITY_AREA_MSG)
+
+        return total_active_area
+
 
 
     SPECIFY_TIME_START_AND_OR_END_MSG = "Specify start and/or end to filter by time"
@@ -314,27 +421,53 @@ class FireActivityFilter(FiresActionBase):
         if s and e and s > e:
             raise self.FilterError(self.INVALID_START_AFTER_END)
 
-        def _filter(fire, active_area):
-            if not isinstance(active_area, dict):
-                self._fail_fire(fire, self.MISSING_FIRE_LOCATION_INFO_MSG)
-            elif not active_area.get('start') or not active_area.get('end'):
-                self._fail_fire(fire, self.MISSING_FIRE_LOCATION_INFO_MSG)
-
-            utc_offset = datetime.timedelta(hours=parse_utc_offset(
-                active_area.get('utc_offset') or 0))
+        def _filter(table, active):
+            windows, errors = table.column(self._get_window,
+                (numpy.nan, numpy.nan, numpy.nan), active)
+            # Note: NaN values, for rows that failed or were skipped,
+            # are never removed
+            aa_s = numpy.array([w[0] for w in windows], dtype=float)
+            aa_e = numpy.array([w[1] for w in windows], dtype=float)
+            utc_offsets = numpy.array([w[2] for w in windows], dtype=float)
 
-            aa_s = to_datetime(active_area['start'])
             # check if e_is_local, since we're comparing aa_s against e
             if not e_is_local:
-                aa_s = aa_s - utc_offset
-
-            aa_e = to_datetime(active_area['end'])
+                aa_s = aa_s - utc_offsets
             # same thing, but s_is_local
             if not s_is_local:
-                aa_e = aa_e - utc_offset
+                aa_e = aa_e - utc_offsets
 
             # note that this filters if aa's start/end matches cutoff
             # (e.g. if aa's start and filter's end are both 2019-01-01T00:00:00)
-            return (s and aa_e <= s) or (e and aa_s >= e)
+            remove = numpy.zeros(len(windows), dtype=bool)
+            if s:
+                remove |= aa_e <= self._to_seconds(s)
+            if e:
+                remove |= aa_s >= self._to_seconds(e)
+            return remove, errors
 
         return _filter
+
+    EPOCH = datetime.datetime(1970, 1, 1)
+    ONE_SECOND = datetime.timedelta(seconds=1)
+
+    def _to_seconds(self, dt):
+        return (dt - self.EPOCH) / self.ONE_SECOND
+
+    def _get_window(self, fire, active_area):
+        """Returns active area's local start and end, and its utc offset,
+        all in seconds (with start and end relative to the unix epoch)
+        """
+        if not isinstance(active_area, dict):
+            self._fail_fire(fire, self.MISSING_FIRE_LOCATION_INFO_MSG)
+        elif not active_area.get('start') or not active_area.get('end'):
+            self._fail_fire(fire, self.MISSING_FIRE_LOCATION_INFO_MSG)
+
+        utc_offset = 3600 * parse_utc_offset(
+            active_area.get('utc_offset') or 0)
+
+        # ActiveArea objects cache their parsed start and end
+        aa_s = getattr(active_area, 'start', None) or to_datetime(active_area['start'])
+        aa_e = getattr(active_area, 'end', None) or to_datetime(active_area['end'])
+
+        return (self._to_seconds(aa_s), self._to_seconds(aa_e), utc_offset)
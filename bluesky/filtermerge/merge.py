@@ -58,77 +58,88 @@ class FiresMerger(FiresActionBase):
         worth the hit to performance to check every pair of fires for
         mergeability.
 
-        TODO: refactor inner loop logic into submethods
+        Each fire is checked against the first merged fire, whose fields
+        (other than activity) the combined fire inherits, and has its
+        activity copied once.  The combined fire is built, and the merged
+        fires removed, only at the end, so that merging is linear in the
+        number of fires.
         """
-        combined_fire = None
+        merged_fires = []
+        merged_activity = []
         for fire in self._fires_manager._fires[fire_id]:
+            first_fire = merged_fires[0] if merged_fires else None
             try:
                 # TODO: iterate through and call all methods starting
                 #   with '_check_'; would need to change _check_keys'
                 #   signature to match the others
                 self._check_keys(fire)
-                self._check_activity_windows(fire, combined_fire)
-                self._check_event_of(fire, combined_fire)
-                self._check_fire_and_fuel_types(fire, combined_fire)
+                self._check_activity_windows(fire, first_fire)
+                self._check_event_of(fire, first_fire)
+                self._check_fire_and_fuel_types(fire, first_fire)
 
-                combined_fire = self._merge_into_combined_fire(fire,
-                    combined_fire)
+                if first_fire:
+                    merged_activity.extend(self._copy_activity(fire,
+                        first_fire))
+                merged_fires.append(fire)
 
             except FiresMerger.MergeError as e:
                 if not self._skip_failures:
-                    if combined_fire:
-                        # add back what was merge in progress
-                        self._fires_manager.add_fire(combined_fire)
+                    # add back what was merge in progress
+                    self._replace_with_combined_fire(merged_fires,
+                        merged_activity)
                     logging.debug(traceback.format_exc())
                     raise ValueError(str(e))
                 # else, just log str(e) (which is detailed enough)
                 logging.warning(str(e))
 
-        if combined_fire:
-            # add_fire will take care of creating new list
-            # and adding fire id in the case where all fires
-            # were combined and thus all removed
-            self._fires_manager.add_fire(combined_fire)
+        self._replace_with_combined_fire(merged_fires, merged_activity)
 
-    def _merge_into_combined_fire(self, fire, combined_fire):
-        """Merges fires into in-progress combined fire
+    def _copy_activity(self, fire, first_fire):
+        """Returns copy of fire's activity, to be merged into combined fire
 
         args:
          - fire -- fire to merge
-         - combined_fire -- in-progress combined fire (which could be None)
+         - first_fire -- first of the fires being merged
+        """
+        # remember, at this point, activity will be defined for none
+        # or all of the fires to be merged
+        if not first_fire.get('activity'):
+            return []
+
+        try:
+            # TOOD: should we sort each activity object's active
+            #   areas list by start timess, and then sort the activity
+            #   list by the first (and earliest) start time of each
+            #   activity object's active areas?  The complication is
+            #   that there could be undefined 'start' values that we'd
+            #   need to handle
+            return copy.deepcopy(fire.activity)
+
+        except Exception as e:
+            self._fail_fire(fire, e)
+
+    def _replace_with_combined_fire(self, merged_fires, merged_activity):
+        """Builds combined fire and swaps it in for the merged fires
+
+        args:
+         - merged_fires -- fires that were merged, in order
+         - merged_activity -- copied activity of all but the first merged fire
         """
-        if not combined_fire:
+        if merged_fires:
             # We need to instantiate a dict from fire in order to deepcopy it.
             # We need to deepcopy so that that modifications to
-            # new_combined_fire don't modify fire
-            new_combined_fire = self._fire_class(copy.deepcopy(dict(fire)))
-            self._fires_manager.remove_fire(fire)
+            # combined_fire don't modify the first fire
+            combined_fire = self._fire_class(copy.deepcopy(dict(merged_fires[0])))
+            if combined_fire.get('activity'):
+                combined_fire.activity.extend(merged_activity)
 
-        else:
-            # See note, above, regarding instantiating dict and then deep copying
-            new_combined_fire = self._fire_class(copy.deepcopy(dict(combined_fire)))
-            try:
-                # merge activity; remember, at this point, activity will be
-                # defined for none or all of the fires to be merged
-                if new_combined_fire.get('activity'):
-                    new_combined_fire.activity.extend(copy.deepcopy(fire.activity))
-                    # TOOD: should we sort each activity object's active
-                    #   areas list by start timess, and then sort the activity
-                    #   list by the first (and earliest) start time of each
-                    #   activity object's active areas?  The complication is
-                    #   that there could be undefined 'start' values that we'd
-                    #   need to handle
-                    #new_combined_fire.activity.sort(key=lambda a: __min_start__(a))
-
-                # TODO: merge anything else?
-
-                # if remove_fire fails, combined_fire won't be updated
-                self._fires_manager.remove_fire(fire)
-
-            except Exception as e:
-                self._fail_fire(fire, e)
-
-        return new_combined_fire
+            # TODO: merge anything else?
+
+            self._fires_manager.remove_fires(merged_fires)
+            # add_fire will take care of creating new list
+            # and adding fire id in the case where all fires
+            # were combined and thus all removed
+            self._fires_manager.add_fire(combined_fire)
 
     ##
     ## Validation / Check Methods
@@ -51,18 +51,39 @@ def get_defaults(fire, loc):
 
 ONE_HOUR = datetime.timedelta(hours=1)
 
+# Hourly index of each activity window, shared by all locations with the
+# same window, so that the window is parsed and enumerated only once
+_HOURS = {}
+MAX_NUM_WINDOWS = 1000
+
+def _get_hours(start, end):
+    key = (start, end)
+    if key not in _HOURS:
+        if len(_HOURS) >= MAX_NUM_WINDOWS:
+            _HOURS.clear()
+        start = parse_datetime(start)
+        end = parse_datetime(end)
+        num_hours = max(0, -((start - end) // ONE_HOUR))
+        _HOURS[key] = [(start + i * ONE_HOUR).strftime('%Y-%m-%dT%H:%M:%S')
+            for i in range(num_hours)]
+    return _HOURS[key]
+
 def fill_in_defaults(fire, aa, loc):
     defaults = get_defaults(fire, loc)
     loc['fuelmoisture'] = loc.get('fuelmoisture', {})
+    fm = loc['fuelmoisture']
 
-    hr = parse_datetime(aa['start'])
-    while hr < parse_datetime(aa['end']):
-        hr_str = hr.strftime('%Y-%m-%dT%H:%M:%S')
-        if not loc['fuelmoisture'].get(hr_str):
-            loc['fuelmoisture'][hr_str] = defaults
+    hours = _get_hours(aa['start'], aa['end'])
 
-        else:
-            for k, v in defaults.items():
-                if loc['fuelmoisture'][hr_str].get(k) is None:
-                    loc['fuelmoisture'][hr_str][k] = v
-        hr += ONE_HOUR
+    # Hours without any fuel moisture data get the defaults profile itself
+    missing = [hr_str for hr_str in hours if not fm.get(hr_str)]
+    fm.update(dict.fromkeys(missing, defaults))
+
+    if len(missing) < len(hours):
+        missing = set(missing)
+        for hr_str in hours:
+            if hr_str not in missing:
+                hr_fm = fm[hr_str]
+                for k, v in defaults.items():
+                    if hr_fm.get(k) is None:
+                        hr_fm[k] = v
@@ -5,11 +5,14 @@ fm_1_10 written by asbova17
 
 import logging
 
+import numpy
 
 __version__ = '0.1.0'
 
 __all__ = [
-    'NfdrsFuelMoisture'
+    'NfdrsFuelMoisture',
+    'fm_1_10',
+    'fm_1_10_batch'
 ]
 
 
@@ -80,21 +83,31 @@ class NfdrsFuelMoisture():
         if not location.get('localmet'):
             logging.warning("Localmet data are needed by the NFDRS fuel moisture model.")
 
-        for hr, met in location.get('localmet', {}).items():
-            fm_1_10_args = {}
+        hours = list(location.get('localmet', {}).keys())
+        if not hours:
+            return
+
+        # Collect inputs for all hours, and compute them in one call
+        fm_1_10_args = {k: [] for k in FM_1_10_DEFAULTS}
+        for hr in hours:
+            met = location['localmet'][hr]
+            hr_args = {}
             # The profiler code says that TEMP is in Kelvin, but
             # the data appear to be in Celsius
-            self._set_first_value(met, 'TEMP', 'temp', fm_1_10_args)
-            self._set_first_value(met, 'RELH', 'rh', fm_1_10_args)
+            self._set_first_value(met, 'TEMP', 'temp', hr_args)
+            self._set_first_value(met, 'RELH', 'rh', hr_args)
             # cloud cover is 'TCLD', we need it to compute 'sow', but
-            self._set_first_value(met, 'TCLD', 'sow', fm_1_10_args,
+            self._set_first_value(met, 'TCLD', 'sow', hr_args,
                 process_func=self._convert_tcld_to_sow)
-            self._set_rain(met, fm_1_10_args)
+            self._set_rain(met, hr_args)
+            for k, v in FM_1_10_DEFAULTS.items():
+                fm_1_10_args[k].append(hr_args.get(k, v))
 
-            fm_1hr, fm_10hr = fm_1_10(**fm_1_10_args)
+        fm_1hr, fm_10hr = fm_1_10_batch(**fm_1_10_args)
+        for hr, fm_1, fm_10 in zip(hours, fm_1hr.tolist(), fm_10hr.tolist()):
             location['fuelmoisture'][hr] = location['fuelmoisture'].get(hr, {})
-            location['fuelmoisture'][hr]['1_hr'] = fm_1hr
-            location['fuelmoisture'][hr]['10_hr'] = fm_10hr
+            location['fuelmoisture'][hr]['1_hr'] = fm_1
+            location['fuelmoisture'][hr]['10_hr'] = fm_10
 
 
 
@@ -148,3 +161,71 @@ def fm_1_10(temp=20, rh=30, rain=0, sow=0, units='SI'):
         fm_1hr = 1.03 * emc
 
     return fm_1hr, fm_10hr
+
+
+FM_1_10_DEFAULTS = {
+    'temp': 20,
+    'rh': 30,
+    'rain': 0,
+    'sow': 0
+}
+
+def _to_float_array(name, values):
+    a = numpy.asarray(values)
+    # numpy converts None to NaN when creating float arrays
+    if a.dtype == object and any(v is None for v in a.flat):
+        raise TypeError("fm_1_10 '{}' values can't be None".format(name))
+    return a.astype(float)
+
+_python_square = numpy.frompyfunc(lambda v: float(v) ** 2, 1, 1)
+
+def fm_1_10_batch(temp, rh, rain, sow, units='SI'):
+    """Vectorized fm_1_10, computing 1 and 10 hour fuel moistures for
+    any number of locations and hours in one call
+
+    Args are arrays (or array-likes) of the same shape, or broadcastable
+    to it, with the same meanings and units as fm_1_10's.  The operations
+    are the same as fm_1_10's, in the same order, and rh is squared with
+    python's ** operator, as in fm_1_10, so results are identical.
+
+    Returns tuple of 1 hour and 10 hour fuel moisture arrays
+
+    Raises TypeError if any value is None, as fm_1_10 does, rather than
+    letting it become NaN.  Missing values should be replaced with
+    defaults (FM_1_10_DEFAULTS) beforehand, as NfdrsFuelMoisture does.
+    """
+    temp, rh, rain, sow = numpy.broadcast_arrays(
+        *[_to_float_array(k, a) for k, a in
+            (('temp', temp), ('rh', rh), ('rain', rain), ('sow', sow))])
+
+    # convert rh if fraction instead of percent (assumes no rh < 1 %)
+    rh = numpy.where(rh < 1, rh * 100., rh)
+
+    if units == 'SI':
+        temp = 1.8 * temp + 32.
+        rain = 0.039370 * rain
+
+    sow = numpy.minimum(sow, 3)
+    t_cor = numpy.round(-6.7 * sow + 25.3, 0)
+    rh_cor = numpy.rint(100*(0.084 * sow + 0.749))/100
+
+    temp = temp + t_cor
+    rh = rh * rh_cor
+
+    # fm_1_10 squares rh with python's ** operator, i.e. with libm's pow,
+    # which can differ in the last ULP from numpy's exact squaring; so
+    # square it the same way, as python floats
+    rh_sq = numpy.asarray(_python_square(rh), dtype=float)
+
+    emc = numpy.where(rh > 50.,
+        21.0606 + 0.005565 * rh_sq - 0.00035 * rh * temp - 0.483199 * rh,
+        numpy.where(rh <= 10.,
+            0.03229 + 0.281073 * rh - 0.000578 * rh * temp,
+            2.22749 + 0.160107 * rh - 0.014784 * temp))
+
+    # if rain > 0.1 in., set fm to 35%
+    rained = rain >= 0.1
+    fm_10hr = numpy.where(rained, 0.35, 1.28 * emc)
+    fm_1hr = numpy.where(rained, 0.35, 1.03 * emc)
+
+    return fm_1hr, fm_10hr
@@ -1,59 +1,369 @@
 """bluesky.fuelmoisture.wims
 
 This is a rewrite of the WIMS fuel moisture module from BSF
+
+Daily WIMS fire danger rating observations are kept in a local store,
+one file per day in 'data_dir', and are downloaded from 'url' only if
+not already there.  Each day's observations are parsed once per run into
+a WimsStations index, with which the nearest stations to any number of
+locations are found in a single vectorized query.
 """
 
-__version__ = '0.1.0'
+__author__ = "Joel Dubowy"
+__version__ = '0.2.0'
 
+import datetime
+import logging
 import os
+import tempfile
 import urllib.request
-from math import radians, cos, sin, asin, sqrt
-#from fuel_moisture import DefaultFuelMoisture, MOISTURE_PROFILES
+from collections import defaultdict
+
+import numpy
+
+from bluesky.config import Config
+from bluesky.fuelmoisture import _get_hours
+from bluesky.locationutils import LatLng
 
 __all__ = [
+    'parse_wims_data',
+    'WimsStations',
+    'WimsDataCache',
     'WimsFuelMoisture'
 ]
 
-class WimsFuelMoisture():
+# From BSF
+EARTH_RADIUS_KM = 6367.0
 
-    def __init__(self):
-        raise NotImplementedError("WIMS fuel moisture module is not yet implemented")
+# Fixed width columns of fdr_obs.dat data lines, from BSF
+STATION_ID_COLUMNS = (0, 6)
+LAT_COLUMNS = (30, 35)
+LNG_COLUMNS = (35, 41)
+FM_COLUMNS = {
+    '10_hr': (99, 105),
+    '100_hr': (87, 93),
+    '1000_hr': (93, 99)
+}
 
-        self.url = Config('fuelmoisture', 'wims','url')
-        self.data_dir = Config('fuelmoisture', 'wims','data_dir')
-        self.wims_data = {}
+def _parse_fm(val):
+    try:
+        val = float(val)
+    except ValueError:
+        return numpy.nan
+    # WIMS uses negative values for missing observations
+    return val if val >= 0 else numpy.nan
 
-    def set_fuel_moisture(self, aa, location):
-        """Extracts the closest WIMS data. Assigns default fuel moisture
-         values if no WIMS data is found
+def parse_wims_data(lines):
+    """Parses WIMS fdr_obs.dat data, returning a WimsStations object
+
+    args:
+     - lines -- iterable of lines, as str or bytes (e.g. an open file)
+    """
+    station_ids = []
+    lats = []
+    lngs = []
+    fuel_moisture = {k: [] for k in FM_COLUMNS}
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('latin-1')
+
+        station_id = line[slice(*STATION_ID_COLUMNS)].strip()
+        if not station_id.isdigit():
+            # header or blank line
+            continue
+
+        try:
+            lat = float(line[slice(*LAT_COLUMNS)])
+            lng = float(line[slice(*LNG_COLUMNS)])
+        except ValueError:
+            logging.debug("Skipping WIMS station %s without valid "
+                "coordinates", station_id)
+            continue
+
+        station_ids.append(station_id)
+        lats.append(lat)
+        # Longitudes are recorded as degrees west
+        lngs.append(-abs(lng))
+        for k, cols in FM_COLUMNS.items():
+            fuel_moisture[k].append(_parse_fm(line[slice(*cols)]))
+
+    return WimsStations(station_ids, lats, lngs, fuel_moisture)
+
+
+##
+## Spatial index
+##
+
+# Maximum number of location-to-station distances to hold in memory at once
+MAX_NUM_DISTANCES = 1000000
+
+class WimsStations():
+    """Spatial index of one day's WIMS station observations
+
+    Station coordinates are converted to radians once, so that distances
+    from any number of locations to all stations are computed with a
+    handful of numpy operations.
+    """
+
+    def __init__(self, station_ids, lats, lngs, fuel_moisture):
+        self.station_ids = list(station_ids)
+        self._lat = numpy.radians(numpy.asarray(lats, dtype=float))
+        self._lng = numpy.radians(numpy.asarray(lngs, dtype=float))
+        self._cos_lat = numpy.cos(self._lat)
+        self.fuel_moisture = {k: numpy.asarray(v, dtype=float)
+            for k, v in fuel_moisture.items()}
+
+    def __len__(self):
+        return len(self.station_ids)
+
+    def _distances(self, lat, lng):
+        """Returns haversine distances, in km, from each of the given
+        locations (in radians) to each station, as location x station array
+        """
+        dlat = self._lat - lat[:, None]
+        dlng = self._lng - lng[:, None]
+        a = (numpy.sin(dlat / 2) ** 2 + numpy.cos(lat)[:, None]
+            * self._cos_lat * numpy.sin(dlng / 2) ** 2)
+        return 2 * EARTH_RADIUS_KM * numpy.arcsin(numpy.sqrt(numpy.clip(a, 0, 1)))
+
+    def nearest(self, lats, lngs, num_stations=1):
+        """Finds the nearest stations to each location
+
+        args:
+         - lats -- array of location latitudes
+         - lngs -- array of location longitudes
+
+        kwargs:
+         - num_stations -- number of stations to find for each location
+
+        Returns (indices, distances) tuple of location x station arrays,
+        ordered by distance, in km
         """
-        self.download_data(aa.start)
-
-    def download_data(start):
-        if start in self.wims_data:
-            return self.wims_data
-
-        wims_url = start.strftime(self.url)
-        with osutils.create_working_dir(working_dir=self.data_dir) as data_dir:
-            wims_file = os.path.join(data_dir,
-                start.strftime("%Y-%m-%d_fdr_obs.dat"))
-            if os.path.isfile(wims_file):
-                # file was cached by another run
-                with open(wims_file) as f:
-                    pass
+        if not len(self):
+            raise ValueError("No WIMS stations to search")
+
+        lat = numpy.radians(numpy.asarray(lats, dtype=float)).reshape(-1)
+        lng = numpy.radians(numpy.asarray(lngs, dtype=float)).reshape(-1)
+        k = min(num_stations, len(self))
+        indices = numpy.empty((len(lat), k), dtype=int)
+        distances = numpy.empty((len(lat), k))
+
+        chunk_size = max(1, MAX_NUM_DISTANCES // len(self))
+        for i in range(0, len(lat), chunk_size):
+            j = i + chunk_size
+            d = self._distances(lat[i:j], lng[i:j])
+            if k == 1:
+                idx = numpy.argmin(d, axis=1)[:, None]
+            elif k < len(self):
+                idx = numpy.argpartition(d, k - 1, axis=1)[:, :k]
             else:
-                # TODO: download file
-                # check for success, raise RuntimeError if failed
-                pass
+                idx = numpy.broadcast_to(numpy.arange(k), d.shape)
+            order = numpy.argsort(numpy.take_along_axis(d, idx, axis=1),
+                axis=1, kind='stable')
+            indices[i:j] = numpy.take_along_axis(idx, order, axis=1)
+            distances[i:j] = numpy.take_along_axis(d, indices[i:j], axis=1)
+
+        return indices, distances
+
+    def interpolate(self, lats, lngs, num_stations=1, max_distance_km=None):
+        """Computes fuel moisture at each location from the nearest stations
 
-            # TODO: load data
-            # TODO: save in self.wims_data[start]
-            # TODO: return self.wims_data[start]
+        With one station, the nearest station's values are used; with
+        more, values are inverse distance squared weighted averages of
+        the nearest stations' values.  Stations further than
+        max_distance_km, and stations' missing values, are ignored.
 
+        Returns dict of arrays of fuel moisture values, keyed by fuel
+        moisture type, with nan where undefined
+        """
+        indices, distances = self.nearest(lats, lngs, num_stations=num_stations)
+        within = (distances <= max_distance_km if max_distance_km is not None
+            else numpy.ones(distances.shape, dtype=bool))
+
+        if indices.shape[1] == 1:
+            return {k: numpy.where(within[:, 0], v[indices[:, 0]], numpy.nan)
+                for k, v in self.fuel_moisture.items()}
 
+        # Locations at a station take that station's values
+        at_station = distances == 0
+        with numpy.errstate(divide='ignore'):
+            weights = numpy.where(at_station.any(axis=1)[:, None],
+                at_station.astype(float), 1 / distances ** 2)
+        weights = numpy.where(within, weights, 0.0)
 
+        fuel_moisture = {}
+        for k, v in self.fuel_moisture.items():
+            values = v[indices]
+            w = numpy.where(numpy.isnan(values), 0.0, weights)
+            total = w.sum(axis=1)
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                fuel_moisture[k] = numpy.where(total > 0,
+                    (w * numpy.nan_to_num(values)).sum(axis=1) / total, numpy.nan)
+        return fuel_moisture
 
 
+##
+## Data store
+##
+
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), 'bluesky-wims')
+DEFAULT_DOWNLOAD_TIMEOUT = 30
+
+class WimsDataCache():
+    """File backed store of daily WIMS observations
+
+    Each day's data are read (and downloaded, if necessary) and indexed
+    at most once.  Days without data are remembered as well, so that
+    they're not downloaded again.
+    """
+
+    def __init__(self, url=None, data_dir=None, download_timeout=None):
+        self._url = url
+        self._data_dir = data_dir or DEFAULT_DATA_DIR
+        # So that a stalled server doesn't hang the run
+        self._download_timeout = download_timeout or DEFAULT_DOWNLOAD_TIMEOUT
+        self._stations = {}
+
+    def get(self, date):
+        """Returns WimsStations for the given date, or None if there are
+        no data for that date
+        """
+        if date not in self._stations:
+            self._stations[date] = self._load(date)
+        return self._stations[date]
+
+    def _load(self, date):
+        wims_file = os.path.join(self._data_dir,
+            date.strftime("%Y%m%d_fdr_obs.dat"))
+        if os.path.isfile(wims_file):
+            logging.debug("Reading WIMS data from %s", wims_file)
+        elif not self._download(date, wims_file):
+            logging.warning("There are no WIMS data for %s", date)
+            return None
+
+        with open(wims_file, 'rb') as f:
+            stations = parse_wims_data(f)
+        if not len(stations):
+            logging.warning("WIMS data for %s are empty", date)
+            return None
+        return stations
+
+    def _download(self, date, wims_file):
+        if not self._url:
+            return False
+
+        url = date.strftime(self._url)
+        # The WIMS files for some days end with .dat, others with .txt
+        urls = [url]
+        for a, b in (('.txt', '.dat'), ('.dat', '.txt')):
+            if url.endswith(a):
+                urls.append(url[:-len(a)] + b)
+
+        for url in urls:
+            try:
+                logging.debug("Downloading WIMS data from %s", url)
+                content = urllib.request.urlopen(url,
+                    timeout=self._download_timeout).read()
+            except Exception as e:
+                logging.debug("Failed to download %s: %s", url, e)
+                continue
+
+            # Write to a temp file and rename, so that concurrent runs
+            # sharing the data dir never read a partial file
+            os.makedirs(self._data_dir, exist_ok=True)
+            tmp_file = '{}.{}.tmp'.format(wims_file, os.getpid())
+            with open(tmp_file, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_file, wims_file)
+            return True
+
+        return False
+
+
+##
+## Fuel moisture model
+##
+
+def _get_date(hr_str):
+    return datetime.date(int(hr_str[:4]), int(hr_str[5:7]), int(hr_str[8:10]))
+
+class WimsFuelMoisture():
+
+    def __init__(self):
+        config = Config().get('fuelmoisture', 'wims')
+        self._cache = WimsDataCache(config.get('url'), config.get('data_dir'),
+            config.get('download_timeout'))
+        self._num_stations = config.get('num_stations') or 1
+        self._max_distance_km = config.get('max_distance_km')
+        # Fuel moisture by (date, (lat, lng))
+        self._fuel_moisture = {}
+
+    def prepare(self, fires):
+        """Looks up fuel moisture for all locations of the given fires,
+        with one query per day
+        """
+        latlngs_by_date = defaultdict(set)
+        for fire in fires:
+            try:
+                active_areas = fire.active_areas
+            except Exception:
+                # Invalid fires are reported by the fire failure handler
+                # when fuel moisture is set for them
+                continue
+            for aa in active_areas:
+                try:
+                    latlngs = [self._get_latlng(loc) for loc in aa.locations]
+                    dates = self._get_dates(aa)
+                except Exception:
+                    # Invalid locations and active areas (e.g. without
+                    # start or end) are reported when fuel moisture is
+                    # set for them
+                    continue
+                for date in dates:
+                    latlngs_by_date[date].update(latlngs)
+
+        for date, latlngs in latlngs_by_date.items():
+            self._query(date, latlngs)
+
+    def _get_dates(self, aa):
+        days = set([hr_str[:10] for hr_str in _get_hours(aa['start'], aa['end'])])
+        return [_get_date(d) for d in sorted(days)]
+
+    def _get_latlng(self, loc):
+        latlng = LatLng(loc)
+        return (latlng.latitude, latlng.longitude)
+
+    def _query(self, date, latlngs):
+        latlngs = [ll for ll in latlngs if (date, ll) not in self._fuel_moisture]
+        if not latlngs:
+            return
+
+        stations = self._cache.get(date)
+        if stations is None:
+            self._fuel_moisture.update({(date, ll): {} for ll in latlngs})
+            return
+
+        fuel_moisture = stations.interpolate([ll[0] for ll in latlngs],
+            [ll[1] for ll in latlngs], num_stations=self._num_stations,
+            max_distance_km=self._max_distance_km)
+        fuel_moisture = {k: v.tolist() for k, v in fuel_moisture.items()}
+        for i, ll in enumerate(latlngs):
+            self._fuel_moisture[(date, ll)] = {k: v[i]
+                for k, v in fuel_moisture.items() if not numpy.isnan(v[i])}
+
+    def set_fuel_moisture(self, aa, location):
+        """Sets 10, 100, and 1000 hour fuel moisture from the nearest WIMS
+        stations' observations.  Values are left undefined for days
+        without WIMS data and for locations without stations nearby.
+        """
+        latlng = self._get_latlng(location)
+        for hr_str in _get_hours(aa['start'], aa['end']):
+            key = (_get_date(hr_str), latlng)
+            if key not in self._fuel_moisture:
+                self._query(key[0], [latlng])
+            if self._fuel_moisture[key]:
+                location['fuelmoisture'][hr_str] = location['fuelmoisture'].get(hr_str, {})
+                location['fuelmoisture'][hr_str].update(self._fuel_moisture[key])
 
 
 ##
@@ -13,6 +13,7 @@ from afdatetime.parsing import parse as parse_dt
 from bluesky import datautils
 from bluesky.exceptions import BlueSkyConfigurationError
 from bluesky.config import Config
+from bluesky.models.timeprofile import HourlyTimeProfile
 from . import GrowerBase, to_date
 
 
@@ -61,6 +62,7 @@ class Grower(GrowerBase):
         self._days_to_persist = 1
         self._daily_percentages = [100]
         self._truncate = False
+        self._copy_on_write = False
 
         # Find first matching set of config params
         for c in configs:
@@ -95,6 +97,7 @@ class Grower(GrowerBase):
                     self._daily_percentages = [100 for i in range(self._days_to_persist)]
 
                 self._truncate = not not c.get('truncate')
+                self._copy_on_write = not not c.get('copy_on_write')
 
                 return
 
@@ -166,14 +169,17 @@ class Grower(GrowerBase):
                 (not self._truncate and last_start > self._date_to_persist)):
             return
 
+        # The original activity collections are no longer referenced
+        # anywhere else once fire['activity'] is replaced, below, so
+        # there's no need to copy them
         before_activity = []
         date_to_persist_activity = []
         for a in fire['activity']:
             a_start = to_date(a["active_areas"][0]['start'])
             if a_start < self._date_to_persist:
-                before_activity.append(copy.deepcopy(a))
+                before_activity.append(a)
             elif a_start == self._date_to_persist:
-                date_to_persist_activity.append(copy.deepcopy(a))
+                date_to_persist_activity.append(a)
             else:
                 # stop processing
                 break
@@ -183,13 +189,22 @@ class Grower(GrowerBase):
 
     ONE_DAY = datetime.timedelta(days=1)
 
+    HOURLY_FIELDS = ('timeprofile', 'plumerise', 'hourly_frp')
+
     def _persist(self, date_to_persist_activity):
         if not date_to_persist_activity:
             return []
 
+        # hourly keys are the same for every persisted day, so they're
+        # parsed and shifted once each, rather than once per location per day
+        self._shifted_keys = {}
+
         persisted_activity = []
         for i in range(self._days_to_persist):
-            activity = copy.deepcopy(date_to_persist_activity)
+            reduce = self._daily_percentages[i] < 100
+            memo = (self._get_shared_data_memo(date_to_persist_activity, reduce)
+                if self._copy_on_write else {})
+            activity = copy.deepcopy(date_to_persist_activity, memo)
             t_diff = (i + 1) * self.ONE_DAY
             for a in activity:
                 a['persisted'] = True
@@ -198,31 +213,72 @@ class Grower(GrowerBase):
                     aa['end'] = parse_dt(aa['end']) + t_diff
                     self._add_time_diff_to_keys(aa, t_diff, ('timeprofile',))
                     for l in aa.locations:
-                        self._add_time_diff_to_keys(l, t_diff, ('plumerise',))
-                        self._add_time_diff_to_keys(l, t_diff, ('timeprofile',))
-                        self._add_time_diff_to_keys(l, t_diff, ('hourly_frp',))
+                        self._add_time_diff_to_keys(l, t_diff, self.HOURLY_FIELDS)
 
-                if self._daily_percentages[i] < 100:
+                if reduce:
                     self._reduce_activity(a, self._daily_percentages[i])
 
                 persisted_activity.append(a)
 
         return persisted_activity
 
+    def _get_shared_data_memo(self, activity, reduce):
+        """Returns a deepcopy memo that maps nested data that won't be
+        modified by persistence to itself, so that it is shared by the
+        persisted activity rather than copied.
+
+        Containers that are modified - activity collections, active areas,
+        locations, and the hourly dicts whose keys are shifted - are still
+        copied.  Values that are reduced by 'daily_percentages' are copied
+        if `reduce` is true.
+        """
+        not_shared = set(['specified_points', 'perimeter'])
+        if reduce:
+            not_shared.update(self.NESTED_FIELDS_TO_REDUCE + ['fuelbeds'])
+
+        memo = {}
+        def _share(d):
+            # dict.items avoids Location's fallback to the active area
+            for k, v in dict.items(d):
+                if k in self.HOURLY_FIELDS and isinstance(v, dict):
+                    memo.update({id(hv): hv for hv in v.values()})
+                elif k not in not_shared:
+                    memo[id(v)] = v
+
+        for a in activity:
+            for aa in a['active_areas']:
+                _share(aa)
+                for loc in aa.locations:
+                    _share(loc)
+
+        return memo
+
     def _add_time_diff_to_keys(self, d, t_diff, fields):
-        # instantiate list from timeprofile's and plumerise's keys
-        # to avoid unexpected behavior when popping and replacing
-        # keys within for loop
+        # Only look at d's own fields (i.e. not a location's fallback to
+        # its active area), and build new dicts rather than popping and
+        # replacing keys in place, which could clobber values if the
+        # hourly data spans more than a day
         for f in fields:
-            for k in list(d.get(f, {})):
-                new_k = (parse_dt(k) + t_diff)
-
-                # if string, keep as string; if datetime.date object
-                # (which includes datetime.datetime), keep as datetime.date
-                if not isinstance(k, datetime.date):
-                    new_k = new_k.strftime('%Y-%m-%dT%H:%M:%S')
-
-                d[f][new_k] = d[f].pop(k)
+            hourly = dict.get(d, f)
+            if isinstance(hourly, HourlyTimeProfile):
+                d[f] = hourly.shift(t_diff)
+            elif hourly:
+                d[f] = {self._shift_key(k, t_diff): v
+                    for k, v in hourly.items()}
+
+    def _shift_key(self, k, t_diff):
+        cache_key = (k, t_diff)
+        if cache_key not in self._shifted_keys:
+            new_k = (parse_dt(k) + t_diff)
+
+            # if string, keep as string; if datetime.date object
+            # (which includes datetime.datetime), keep as datetime.date
+            if not isinstance(k, datetime.date):
+                new_k = new_k.strftime('%Y-%m-%dT%H:%M:%S')
+
+            self._shifted_keys[cache_key] = new_k
+
+        return self._shifted_keys[cache_key]
 
     SCALAR_FIELDS_TO_REDUCE = ["area", "frp"]
     NESTED_FIELDS_TO_REDUCE = ["emissions", "consumption", "heat"]
@@ -2,9 +2,11 @@
 
 __author__ = "Joel Dubowy"
 
+import datetime
 import itertools
 import logging
 
+from bluesky import datetimeutils
 from bluesky.locationutils import load_perimeter_geometry_from_shapefile
 
 REQUIRED_LOCATION_FIELDS = {
@@ -103,6 +105,57 @@ class ActiveArea(dict):
         #self.locations
 
 
+    ## Start and end times
+
+    @property
+    def start(self):
+        """Returns parsed 'start' datetime, or None if not defined
+        """
+        return self._get_parsed_datetime('start')
+
+    @property
+    def end(self):
+        """Returns parsed 'end' datetime, or None if not defined
+        """
+        return self._get_parsed_datetime('end')
+
+    @property
+    def utc_offset_hours(self):
+        """Returns utc offset in hours, assuming zero if not defined
+        """
+        return datetimeutils.parse_utc_offset(self.get('utc_offset') or 0)
+
+    @property
+    def start_utc(self):
+        start = self.start
+        if start:
+            return start - datetime.timedelta(hours=self.utc_offset_hours)
+
+    @property
+    def end_utc(self):
+        end = self.end
+        if end:
+            return end - datetime.timedelta(hours=self.utc_offset_hours)
+
+    def _get_parsed_datetime(self, key):
+        """Parses and caches datetime value.
+
+        The cached value is keyed by the raw value, so that the datetime
+        is re-parsed if the active area's start or end is modified mid-run.
+        """
+        cache = self.__dict__.setdefault('_parsed_datetimes', {})
+        raw = self.get(key)
+        if not raw:
+            return None
+
+        cached = cache.get(key)
+        if cached is None or cached[0] != raw:
+            cached = (raw, datetimeutils.parse_datetime(raw, key))
+            cache[key] = cached
+        return cached[1]
+
+    ## Locations
+
     MISSING_LOCATION_INFO_MSG = ("Each active area must contain "
         "'specified_points' or 'perimeter'")
 
@@ -28,6 +28,7 @@ from bluesky.filtermerge.merge import FiresMerger
 from bluesky.statuslogging import StatusLogger
 
 from .activity import ActiveArea, ActivityCollection
+from .timeprofile import HourlyTimeProfile
 
 __all__ = [
     'Fire',
@@ -105,16 +106,15 @@ class Fire(dict):
     def start(self):
         """Returns start of initial activity window
 
-        Doesn't memoize, in case activity windows are added/removed/modified
+        Active area start times are parsed only once, and the fire's time
+        bounds are recomputed only if activity windows are
+        added/removed/modified
         """
-        # consider only activie areas with start times
-        active_areas = [a for a in self.active_areas if a.get('start')]
-        if active_areas:
-            active_areas = sorted(active_areas, key=lambda a: a['start'])
-            # record utc offset of initial active area, in case
-            # start_utc is being called
-            self.__utc_offset = active_areas[0].get('utc_offset')
-            return datetimeutils.parse_datetime(active_areas[0]['start'], 'start')
+        time_bounds = self._get_time_bounds()
+        # record utc offset of initial active area, in case
+        # start_utc is being called
+        self.__utc_offset = time_bounds['start_utc_offset']
+        return time_bounds['start']
 
     @property
     def start_utc(self):
@@ -124,26 +124,59 @@ class Fire(dict):
     def end(self):
         """Returns end of final activity window
 
-        Doesn't memoize, in case activity windows are added/removed/modified
+        Like `start`, this is recomputed only if activity windows are
+        added/removed/modified
 
         TODO: take into account possibility of activity objects having different
           utc offsets.  (It's an extreme edge case where one start/end string
           is gt/lt another when utc offset is ignored but not when utc offset
           is considered, so this isn't a high priority)
         """
-        # consider only activie areas with end times
-        active_areas = [a for a in self.active_areas if a.get('end')]
-        if active_areas:
-            active_areas = sorted(active_areas, key=lambda a: a['end'])
-            # record utc offset of initial active area, in case
-            # start_utc is being called
-            self.__utc_offset = active_areas[-1].get('utc_offset')
-            return datetimeutils.parse_datetime(active_areas[-1]['end'], 'end')
+        time_bounds = self._get_time_bounds()
+        # record utc offset of final active area, in case
+        # end_utc is being called
+        self.__utc_offset = time_bounds['end_utc_offset']
+        return time_bounds['end']
 
     @property
     def end_utc(self):
         return self._to_utc(self.end)
 
+    def _get_time_bounds(self):
+        """Returns fire's start and end, along with the utc offsets of the
+        active areas that define them.
+
+        The bounds are cached along with the raw start, end, and utc_offset
+        values that they were computed from, so that they're recomputed
+        only if those values change.
+        """
+        active_areas = self.active_areas
+        key = [(a.get('start'), a.get('end'), a.get('utc_offset'))
+            for a in active_areas]
+        cached = self.__dict__.get('_time_bounds')
+        if cached and cached[0] == key:
+            return cached[1]
+
+        time_bounds = {
+            'start': None, 'start_utc_offset': None,
+            'end': None, 'end_utc_offset': None
+        }
+        for a in active_areas:
+            if not isinstance(a, ActiveArea):
+                a = ActiveArea(a)
+            start = a.start
+            # on ties, use the first active area
+            if start and (not time_bounds['start'] or start < time_bounds['start']):
+                time_bounds.update(start=start,
+                    start_utc_offset=a.get('utc_offset'))
+            end = a.end
+            # on ties, use the last active area
+            if end and (not time_bounds['end'] or end >= time_bounds['end']):
+                time_bounds.update(end=end, end_utc_offset=a.get('utc_offset'))
+
+        self._time_bounds = (key, time_bounds)
+        return time_bounds
+
     def _to_utc(self, dt):
         if dt:
             if self.__utc_offset:
@@ -210,7 +243,9 @@ class Fire(dict):
 
 class FireEncoder(json.JSONEncoder):
     def default(self, obj):
-        if hasattr(obj, 'tolist'):
+        if isinstance(obj, HourlyTimeProfile):
+            return obj.to_dict()
+        elif hasattr(obj, 'tolist'):
             return obj.tolist()
         elif isinstance(obj, datetime.date):
             return obj.isoformat()
@@ -254,14 +289,25 @@ class FiresManager():
 
     def remove_fire(self, fire):
         # TODO: raise exception if fire doesn't exist ?
-        if fire.id in self._fires:
-            _n = len(self._fires[fire.id])
-            self._fires[fire.id] = [f for f in self._fires[fire.id]
-                if f._private_id != fire._private_id]
-            self._num_fires -= (_n - len(self._fires[fire.id]))
-            if len(self._fires[fire.id]) == 0:
-                # that was last fire with that id
-                self._fires.pop(fire.id)
+        self.remove_fires([fire])
+
+    def remove_fires(self, fires):
+        """Removes multiple fires, filtering each affected fire id's list
+        only once
+        """
+        private_ids = {}
+        for fire in fires:
+            private_ids.setdefault(fire.id, set()).add(fire._private_id)
+
+        for fire_id, fire_private_ids in private_ids.items():
+            if fire_id in self._fires:
+                _n = len(self._fires[fire_id])
+                self._fires[fire_id] = [f for f in self._fires[fire_id]
+                    if f._private_id not in fire_private_ids]
+                self._num_fires -= (_n - len(self._fires[fire_id]))
+                if len(self._fires[fire_id]) == 0:
+                    # that was last fire with that id
+                    self._fires.pop(fire_id)
 
     ##
     ## Merging Fires
@@ -0,0 +1,144 @@
+"""bluesky.models.timeprofile"""
+
+__author__ = "Joel Dubowy"
+
+import datetime
+from collections.abc import Mapping
+
+import numpy
+
+from bluesky import datetimeutils
+
+__all__ = [
+    'HourlyTimeProfile'
+]
+
+class HourlyTimeProfile(Mapping):
+    """Columnar representation of an active area's time profile
+
+    Rather than a dict of per-hour dicts keyed by timestamp, this stores
+    the first hour plus an array of hourly values for each fraction
+    (e.g. 'area_fraction', 'flaming', 'smoldering', 'residual').  It
+    supports the read-only dict interface of the former, keyed by
+    isoformatted local hour strings, so that existing consumers work
+    as is, and it's converted to that dict form when serialized.
+    """
+
+    ONE_HOUR = datetime.timedelta(hours=1)
+
+    def __init__(self, start, hourly_fractions):
+        """Constructor
+
+        args:
+         - start -- datetime.datetime object of first local hour
+         - hourly_fractions -- dict of arrays of hourly values, keyed
+            by fraction name; all arrays must have the same length
+        """
+        self._start = start
+        self._fractions = {}
+        for p, v in hourly_fractions.items():
+            a = numpy.array(v, dtype=float)
+            a.flags.writeable = False
+            self._fractions[p] = a
+
+        lengths = set([len(a) for a in self._fractions.values()])
+        if len(lengths) > 1:
+            raise ValueError("Hourly fractions must all be the same length")
+        self._num_hours = lengths.pop() if lengths else 0
+
+        self._index = None
+        self._values = None
+
+    @classmethod
+    def from_dict(cls, timeprofile):
+        """Creates a HourlyTimeProfile from the dict representation
+
+        Raises ValueError if the hours aren't contiguous or if the
+        hours don't all have the same fraction names.
+        """
+        hours = sorted([(datetimeutils.parse_datetime(k, 'timeprofile'), v)
+            for k, v in timeprofile.items()], key=lambda e: e[0])
+        if not hours:
+            raise ValueError("Empty timeprofile")
+
+        fields = list(hours[0][1].keys())
+        hourly_fractions = {p: [] for p in fields}
+        for i, (hr, v) in enumerate(hours):
+            if hr != hours[0][0] + i * cls.ONE_HOUR:
+                raise ValueError("Timeprofile hours aren't contiguous")
+            if set(v.keys()) != set(fields):
+                raise ValueError("Timeprofile hours don't all define"
+                    " the same fractions")
+            for p in fields:
+                hourly_fractions[p].append(v[p])
+
+        return cls(hours[0][0], hourly_fractions)
+
+    ##
+    ## Columnar access
+    ##
+
+    @property
+    def start(self):
+        return self._start
+
+    @property
+    def end(self):
+        """The start of the hour after the last hour"""
+        return self._start + self._num_hours * self.ONE_HOUR
+
+    @property
+    def hours(self):
+        return [self._start + i * self.ONE_HOUR
+            for i in range(self._num_hours)]
+
+    @property
+    def fields(self):
+        return list(self._fractions.keys())
+
+    @property
+    def fractions(self):
+        """dict of read-only numpy arrays, keyed by fraction name"""
+        return dict(self._fractions)
+
+    def shift(self, t_diff):
+        """Returns a copy starting `t_diff` later, sharing hourly values"""
+        return HourlyTimeProfile(self._start + t_diff, self._fractions)
+
+    def to_dict(self):
+        """Returns the dict representation, keyed by hour string"""
+        return {k: self[k] for k in self}
+
+    ##
+    ## Mapping interface
+    ##
+
+    def _get_index(self):
+        if self._index is None:
+            self._index = {h.isoformat(): i
+                for i, h in enumerate(self.hours)}
+        return self._index
+
+    def __getitem__(self, key):
+        if isinstance(key, datetime.datetime):
+            key = key.isoformat()
+
+        i = self._get_index()[key]
+        if self._values is None:
+            self._values = {p: a.tolist() for p, a in self._fractions.items()}
+        return {p: v[i] for p, v in self._values.items()}
+
+    def __iter__(self):
+        return iter(self._get_index())
+
+    def __len__(self):
+        return self._num_hours
+
+    def __contains__(self, key):
+        if isinstance(key, datetime.datetime):
+            key = key.isoformat()
+        return key in self._get_index()
+
+    def __repr__(self):
+        return "HourlyTimeProfile({}, {})".format(self._start.isoformat(),
+            {p: a.tolist() for p, a in self._fractions.items()})
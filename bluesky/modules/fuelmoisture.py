@@ -43,6 +43,12 @@ def run(fires_manager):
     logging.debug('Using fuel moisture model(s) %s', ','.join(models))
     fms = [MODELS[m]() for m in models]
 
+    # Models that support bulk lookups (i.e. wims) compute fuel moisture
+    # for all locations up front
+    for fm in fms:
+        if hasattr(fm, 'prepare'):
+            fm.prepare(fires_manager.fires)
+
     use_defaults = Config().get('fuelmoisture', 'use_defaults')
     logging.debug('Use default values for any undefined fuel '
         'moisture fields: %s', fill_in_defaults)
@@ -6,17 +6,21 @@ Requires time profiled emissions and localmet data.
 __author__ = "Joel Dubowy"
 
 import abc
+import concurrent.futures
 import copy
 import datetime
+import itertools
 import logging
 import os
 import csv
+import threading
+import time
 
 from plumerise import sev, feps, __version__ as plumerise_version
-from pyairfire import sun, osutils
+from pyairfire import osutils
 import numpy
 
-from bluesky import datautils, datetimeutils, locationutils
+from bluesky import datautils, datetimeutils, locationutils, suntimes
 from bluesky.config import Config
 from bluesky.exceptions import BlueSkyConfigurationError
 
@@ -33,21 +37,47 @@ def run(fires_manager):
     Args:
      - fires_manager -- bluesky.models.fires.FiresManager object
     """
+    sun_times = suntimes.stats()
     compute_func = ComputeFunction(fires_manager)
+    executor = PlumeriseExecutor(compute_func,
+        Config().get('plumerise', 'num_workers'))
 
     working_dir = Config().get('plumerise', 'working_dir')
     delete_if_no_error = Config().get('plumerise', 'delete_working_dir_if_no_error')
 
-    with osutils.create_working_dir(working_dir=working_dir,
-            delete_if_no_error=delete_if_no_error) as working_dir:
-        for fire in fires_manager.fires:
-            with fires_manager.fire_failure_handler(fire):
-                if 'activity' not in fire:
-                    raise ValueError(NO_ACTIVITY_ERROR_MSG)
-
-                for aa in fire.active_areas:
-                    for loc in aa.locations:
-                        compute_func(fire, aa, loc, working_dir=working_dir)
+    try:
+        with osutils.create_working_dir(working_dir=working_dir,
+                delete_if_no_error=delete_if_no_error) as working_dir:
+            executor.start(working_dir)
+            try:
+                fires = []
+                for fire in fires_manager.fires:
+                    with fires_manager.fire_failure_handler(fire):
+                        if 'activity' not in fire:
+                            raise ValueError(NO_ACTIVITY_ERROR_MSG)
+
+                        # just calling fire.locations will trigger missing
+                        # area exception if any are missing area
+                        fire.locations
+
+                        fires.append(fire)
+                        for aa in fire.active_areas:
+                            for loc in aa.locations:
+                                executor.submit(fire, aa, loc)
+
+                # Failures are handled in the original fire order,
+                # regardless of the order in which locations complete
+                for fire in fires:
+                    with fires_manager.fire_failure_handler(fire):
+                        executor.wait(fire)
+            finally:
+                executor.shutdown()
+
+    finally:
+        fires_manager.processed(__name__, __version__,
+            plumerise_version=plumerise_version, model=compute_func.model,
+            num_workers=executor.num_workers, timing=executor.timing,
+            sun_times=suntimes.stats(since=sun_times))
 
     # Make sure to distribute the heat if it was loaded here.
     if compute_func.config.get("load_heat"):
@@ -79,8 +109,7 @@ def _get_fire_working_dir(fire, model, working_dir):
 class ComputeFunction():
     def __init__(self, fires_manager):
         model = Config().get('plumerise', 'model').lower()
-        fires_manager.processed(__name__, __version__,
-            plumerise_version=plumerise_version, model=model)
+        self.model = model
 
         logging.debug('Generating %s plumerise compution function', model)
         generator = globals().get('{}Compute'.format(model.replace('-', '').upper()), None)
@@ -91,7 +120,9 @@ class ComputeFunction():
         # config is accessed by client code
         self.config = Config().get('plumerise', model)
 
+        self._generator = generator
         self._compute_func = generator()
+        self._worker_data = threading.local()
 
         if Config().get('plumerise', 'working_dir'):
             fires_manager.plumerise = {
@@ -105,11 +136,114 @@ class ComputeFunction():
         # exception if any are missing area
         fire.locations
 
-        self._compute_func(fire, aa, loc, working_dir)
+        compute_func = getattr(self._worker_data, 'compute_func',
+            self._compute_func)
+        compute_func(fire, aa, loc, working_dir)
+
+    def init_worker(self):
+        """Gives the calling worker thread its own compute function
+
+        The plumerise package's FEPSPlumeRise and SEVPlumeRise objects
+        aren't documented as thread safe, so they're not shared across
+        threads.  Must be called after the worker's config is set.
+        """
+        self._worker_data.compute_func = self._generator()
 
     ## compute function generators
 
 
+class PlumeriseExecutor():
+    """Runs the plumerise compute function on each location, distributing
+    locations across a pool of worker threads if num_workers > 1
+
+    Each worker has its own compute function and writes to its own scratch
+    directory under the working dir, so that FEPS runs for locations of
+    the same fire don't collide. With
+    one worker, locations are computed as they're submitted, in the main
+    thread, and output is written directly under the working dir, as it
+    always has been.
+    """
+
+    def __init__(self, compute_func, num_workers):
+        self._compute_func = compute_func
+        self.num_workers = max(int(num_workers or 1), 1)
+        self._pool = None
+        self._futures = {}
+        self._times = []
+        self._fire_ids = []
+
+    def start(self, working_dir):
+        self._working_dir = working_dir
+        if self.num_workers > 1:
+            # Worker threads need the config loaded in the main thread.
+            # Otherwise, they'll just be using defaults
+            self._worker_ids = itertools.count()
+            self._worker_data = threading.local()
+            self._pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.num_workers,
+                thread_name_prefix='plumerise',
+                initializer=self._init_worker, initargs=(Config().get(),))
+
+    def _init_worker(self, config):
+        Config().set(config)
+        self._compute_func.init_worker()
+        self._worker_data.working_dir = os.path.join(self._working_dir,
+            "worker-{}".format(next(self._worker_ids)))
+
+    def _compute(self, fire, aa, loc, i):
+        working_dir = (self._worker_data.working_dir if self._pool
+            else self._working_dir)
+        t = time.time()
+        self._compute_func(fire, aa, loc, working_dir=working_dir)
+        t = time.time() - t
+        logging.debug("Computed plumerise for fire %s location %s in %0.3fs",
+            fire.id, i, t)
+        self._times[i] = t
+
+    def submit(self, fire, aa, loc):
+        i = len(self._times)
+        self._times.append(None)
+        self._fire_ids.append(fire.id)
+        if self._pool:
+            self._futures.setdefault(id(fire), []).append(
+                self._pool.submit(self._compute, fire, aa, loc, i))
+        else:
+            self._compute(fire, aa, loc, i)
+
+    def wait(self, fire):
+        """Waits for all of the fire's locations to be computed, raising
+        the first (in location order) exception, if any
+        """
+        for f in self._futures.pop(id(fire), []):
+            f.result()
+
+    def shutdown(self):
+        if self._pool:
+            # Cancel any locations not yet started (in the case of failure)
+            for futures in self._futures.values():
+                for f in futures:
+                    f.cancel()
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    @property
+    def timing(self):
+        """Returns summary of location compute times, along with each
+        location's time, keyed by fire id, in location order; locations
+        not computed (e.g. in the case of failure) have time None
+        """
+        times = [t for t in self._times if t is not None]
+        locations = {}
+        for fire_id, t in zip(self._fire_ids, self._times):
+            locations.setdefault(fire_id, []).append(t)
+        return {
+            "num_locations": len(times),
+            "total_seconds": sum(times),
+            "max_seconds": max(times) if times else 0.0,
+            "locations": locations
+        }
+
+
 class PlumeComputeBase():
 
     def __init__(self):
@@ -161,13 +295,13 @@ class PlumeComputeBase():
             utc_offset = datetimeutils.parse_utc_offset(
                 loc.get('utc_offset', 0.0))
 
-            # Use NOAA-standard sunrise/sunset calculations
+            # Use NOAA-standard sunrise/sunset calculations, cached
+            # for nearby locations on the same day
             latlng = locationutils.LatLng(loc)
-            s = sun.Sun(lat=latlng.latitude, lng=latlng.longitude)
-            d = start.date()
             # just set them both, even if one is already set
-            loc["sunrise_hour"] = s.sunrise_hr(d, utc_offset)
-            loc["sunset_hour"] = s.sunset_hr(d, utc_offset)
+            loc["sunrise_hour"], loc["sunset_hour"] = (
+                suntimes.get_sunrise_sunset_hours(latlng.latitude,
+                    latlng.longitude, start.date(), utc_offset))
 
         fire_working_dir = _get_fire_working_dir(fire, 'feps', working_dir)
 
@@ -184,7 +318,8 @@ class PlumeComputeBase():
         # if avbailable)
         loc_info = dict(loc, **met_info)
 
-        plumerise_data = self._feps_pr.compute(aa['timeprofile'],
+        # convert columnar timeprofile to the dict form plumerise expects
+        plumerise_data = self._feps_pr.compute(dict(aa['timeprofile']),
             loc['consumption']['summary'], loc_info,
             working_dir=fire_working_dir)
         loc['plumerise'] = plumerise_data['hours']
@@ -15,11 +15,14 @@ from timeprofile.static import (
 )
 from timeprofile.feps import FepsTimeProfiler, FireType
 
+from bluesky import suntimes
 from bluesky.config import Config
 from bluesky.datetimeutils import parse_datetimes, parse_datetime
 from bluesky.exceptions import BlueSkyConfigurationError
+from bluesky.models.timeprofile import HourlyTimeProfile
 
 from bluesky.timeprofilers import ubcbsffeps
+from bluesky.timeprofilers.cache import TimeProfileCache
 
 __all__ = [
     'run'
@@ -34,23 +37,29 @@ def run(fires_manager):
     """
     hourly_fractions = Config().get('timeprofile', 'hourly_fractions')
 
-    fires_manager.processed(__name__, __version__,
-        timeprofile_version=timeprofile_version)
-    for fire in fires_manager.fires:
-        with fires_manager.fire_failure_handler(fire):
-            try:
-                _run_fire(hourly_fractions, fire)
-            except InvalidHourlyFractionsError as e:
-                raise BlueSkyConfigurationError(
-                    "Invalid timeprofile hourly fractions: '{}'".format(str(e)))
-            except InvalidStartEndTimesError as e:
-                raise BlueSkyConfigurationError(
-                    "Invalid timeprofile start end times: '{}'".format(str(e)))
+    cache = TimeProfileCache()
+    sun_times = suntimes.stats()
+    try:
+        for fire in fires_manager.fires:
+            with fires_manager.fire_failure_handler(fire):
+                try:
+                    _run_fire(hourly_fractions, fire, cache=cache)
+                except InvalidHourlyFractionsError as e:
+                    raise BlueSkyConfigurationError(
+                        "Invalid timeprofile hourly fractions: '{}'".format(str(e)))
+                except InvalidStartEndTimesError as e:
+                    raise BlueSkyConfigurationError(
+                        "Invalid timeprofile start end times: '{}'".format(str(e)))
+    finally:
+        fires_manager.processed(__name__, __version__,
+            timeprofile_version=timeprofile_version, cache=cache.stats,
+            sun_times=suntimes.stats(since=sun_times))
 
 NOT_24_HOURLY_FRACTIONS_W_MULTIPLE_ACTIVE_AREAS_MSG = ("Only 24-hour repeatable"
     " time profiles supported for fires with multiple activity windows")
 
-def _run_fire(hourly_fractions, fire):
+def _run_fire(hourly_fractions, fire, cache=None):
+    cache = cache or TimeProfileCache()
     active_areas =  fire.active_areas
     if (hourly_fractions and len(active_areas) > 1 and
             set([len(e) for p,e in hourly_fractions.items()]) != set([24])):
@@ -63,15 +72,38 @@ def _run_fire(hourly_fractions, fire):
 
     _validate_fire(fire)
     for a in active_areas:
-        profiler = _get_profiler(hourly_fractions, fire, a)
+        # Profiles are read-only, so active areas with the same profiler
+        # inputs can share the same one
+        a['timeprofile'] = cache.get(_get_cache_key(hourly_fractions, fire, a),
+            lambda: _compute_timeprofile(hourly_fractions, fire, a))
 
-        # convert timeprofile to dict with dt keys
-        a['timeprofile'] = {}
-        fields = list(profiler.hourly_fractions.keys())
-        for i in range(len(list(profiler.hourly_fractions.values())[0])): # each phase should have same len
-            hr = profiler.start_hour + (i * profiler.ONE_HOUR)
-            a['timeprofile'][hr.isoformat()] = {
-                p: profiler.hourly_fractions[p][i] for p in fields }
+def _compute_timeprofile(hourly_fractions, fire, active_area):
+    profiler = _get_profiler(hourly_fractions, fire, active_area)
+
+    # Store columnar, rather than as a dict of hourly dicts; it's
+    # converted to the latter form when the fires are serialized
+    return HourlyTimeProfile(profiler.start_hour, profiler.hourly_fractions)
+
+def _get_cache_key(hourly_fractions, fire, active_area):
+    """Returns a key of the inputs that determine the active area's profile
+
+    hourly_fractions are the same for the entire run, so they're not
+    included. Returns None for ubc-bsf-feps, which depends on the active
+    area's consumption and location data, and so isn't cached.
+    """
+    tw = parse_datetimes(active_area, 'start', 'end')
+    if fire.type == 'rx' and not hourly_fractions:
+        ig_start = active_area.get('ignition_start') and parse_datetime(
+            active_area['ignition_start'], k='ignition_start')
+        ig_end = active_area.get('ignition_end') and parse_datetime(
+            active_area['ignition_end'], k='ignition_end')
+        return ('feps', tw['start'], tw['end'], ig_start, ig_end)
+
+    elif Config().get("timeprofile", "model").lower() == "ubc-bsf-feps":
+        return None
+
+    else:
+        return ('static', tw['start'], tw['end'])
 
 def _get_profiler(hourly_fractions, fire, active_area):
     tw = parse_datetimes(active_area, 'start', 'end')
@@ -103,6 +135,10 @@ def _get_profiler(hourly_fractions, fire, active_area):
         model_name = Config().get("timeprofile", "model").lower()
         if model_name == "ubc-bsf-feps":
             wfrtConfig = Config().get('timeprofile', 'ubc-bsf-feps')
+            if wfrtConfig.get('in_process'):
+                return ubcbsffeps.UbcBsfFEPSTimeProfiler(active_area,
+                    None, wfrtConfig)
+
             working_dir = wfrtConfig.get('working_dir')
             delete_if_no_error = wfrtConfig.get(
                 'delete_working_dir_if_no_error')
@@ -0,0 +1,61 @@
+"""bluesky.numpyutils
+
+Helpers for numpy implementations of code originally written with
+python builtins, which need to produce identical values.
+"""
+
+__author__ = "Joel Dubowy"
+
+import sys
+
+import numpy
+
+__all__ = [
+    'SequentialSum'
+]
+
+# Starting with python 3.12, sum() uses Neumaier compensated summation
+# of floats
+COMPENSATED_SUM = sys.version_info >= (3, 12)
+
+
+class SequentialSum():
+    """Elementwise sums of arrays of values, added one array at a time, in
+    order, the same way as by python's builtin sum(), rather than with
+    numpy.sum, so that each element's total is identical to summing its
+    values individually with sum()
+    """
+
+    def __init__(self, shape, dtype=float):
+        self._totals = numpy.zeros(shape, dtype=dtype)
+        self._compensation = (numpy.zeros(shape, dtype=dtype)
+            if COMPENSATED_SUM else None)
+
+    def add(self, values, index=Ellipsis):
+        """Adds values to the totals selected by index
+
+        args:
+         - values -- array of values, of the shape of the selected totals
+
+        kwargs:
+         - index -- basic or integer array index of the totals to which to
+           add values; an integer array index must not repeat any element
+        """
+        prev = self._totals[index]
+        t = prev + values
+        if self._compensation is not None:
+            # Compensation is NaN for infinite values, but isn't applied
+            with numpy.errstate(invalid='ignore'):
+                self._compensation[index] += numpy.where(
+                    numpy.abs(prev) >= numpy.abs(values),
+                    (prev - t) + values, (values - t) + prev)
+        self._totals[index] = t
+
+    def totals(self):
+        """Returns array of totals"""
+        totals = self._totals.copy()
+        if self._compensation is not None:
+            # As in sum(), compensation isn't applied if it's not finite
+            add = (self._compensation != 0) & numpy.isfinite(self._compensation)
+            totals[add] += self._compensation[add]
+        return totals
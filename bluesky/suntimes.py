@@ -0,0 +1,101 @@
+"""bluesky.suntimes
+
+Cached sunrise and sunset hours
+"""
+
+__author__ = "Joel Dubowy"
+
+import threading
+
+from pyairfire import sun
+
+__all__ = [
+    'SunTimesCache',
+    'get_sunrise_sunset_hours',
+    'stats'
+]
+
+# Two decimal places is roughly 1km, over which sunrise and sunset
+# vary by a few seconds
+LATLNG_PRECISION = 2
+MAX_CACHE_SIZE = 100000
+
+class SunTimesCache():
+    """Memoizes sunrise and sunset hours, keyed by rounded lat/lng, date
+    (or datetime), and utc offset
+
+    Nearby locations on the same day get essentially the same sunrise and
+    sunset, so each is computed once, at the rounded lat/lng.
+
+    The cache may be used from multiple threads (e.g. plumerise workers).
+    """
+
+    def __init__(self, precision=LATLNG_PRECISION, max_size=MAX_CACHE_SIZE):
+        self._precision = precision
+        self._max_size = max_size
+        self._sun_times = {}
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, lat, lng, when, utc_offset):
+        """Returns (sunrise_hour, sunset_hour) tuple, as returned by
+        pyairfire.sun.Sun's sunrise_hr and sunset_hr
+
+        Exceptions raised by pyairfire.sun (e.g. near the poles) are
+        propagated and not cached.
+        """
+        key = (round(float(lat), self._precision),
+            round(float(lng), self._precision), when, utc_offset)
+        with self._lock:
+            sun_times = self._sun_times.get(key)
+            if sun_times is not None:
+                self._hits += 1
+                return sun_times
+            self._misses += 1
+
+        # Computed outside of the lock, so that other lookups aren't
+        # blocked; threads missing on the same key both compute it
+        s = sun.Sun(lat=key[0], lng=key[1])
+        sun_times = (s.sunrise_hr(when, utc_offset),
+            s.sunset_hr(when, utc_offset))
+
+        with self._lock:
+            if len(self._sun_times) >= self._max_size:
+                self._sun_times.clear()
+            self._sun_times[key] = sun_times
+        return sun_times
+
+    @property
+    def stats(self):
+        with self._lock:
+            return _stats(self._hits, self._misses)
+
+def _stats(hits, misses):
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": (hits / total) if total else 0.0
+    }
+
+_cache = SunTimesCache()
+
+def get_sunrise_sunset_hours(lat, lng, when, utc_offset):
+    """Returns (sunrise_hour, sunset_hour) tuple from the shared cache"""
+    return _cache.get(lat, lng, when, utc_offset)
+
+
+def stats(since=None):
+    """Returns the shared cache's hit and miss counts, accumulated over
+    all lookups made so far in the run
+
+    kwargs
+     - since -- stats returned by an earlier call; if specified, only
+       lookups made since then are counted (e.g. to report those made by
+       one module)
+    """
+    s = _cache.stats
+    if since:
+        s = _stats(s["hits"] - since["hits"], s["misses"] - since["misses"])
+    return s
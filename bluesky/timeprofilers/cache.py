@@ -0,0 +1,49 @@
+"""bluesky.timeprofilers.cache"""
+
+__author__ = "Joel Dubowy"
+
+__all__ = [
+    'TimeProfileCache'
+]
+
+class TimeProfileCache():
+    """Memoizes computed time profiles for the duration of a run
+
+    Many active areas share the same time window and profile parameters,
+    so each distinct profile is computed once and then shared by every
+    active area with matching inputs.  Profiles must therefore not be
+    modified in place (HourlyTimeProfile objects are read-only).
+    """
+
+    def __init__(self):
+        self._profiles = {}
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key, compute):
+        """Returns the cached profile for `key`, computing it if necessary
+
+        args:
+         - key -- hashable tuple of all profiler inputs; if None, the
+            profile isn't cacheable and is always computed
+         - compute -- function that takes no args and returns the profile
+        """
+        if key is not None and key in self._profiles:
+            self._hits += 1
+            return self._profiles[key]
+
+        self._misses += 1
+        profile = compute()
+        if key is not None:
+            self._profiles[key] = profile
+        return profile
+
+    @property
+    def stats(self):
+        total = self._hits + self._misses
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "num_profiles": len(self._profiles),
+            "hit_rate": (self._hits / total) if total else 0.0
+        }
@@ -0,0 +1,270 @@
+"""bluesky.timeprofilers.feps
+
+In-process implementation of the FEPS diurnal weather and time profile
+models, i.e. the math performed by the feps_weather and feps_timeprofile
+binaries ("FEPS Time Profile model (revised 2008-03-28 STI)").  Results
+match the binaries' output to within the six decimal places they write.
+"""
+
+__author__ = "Joel Dubowy"
+
+import math
+
+import numpy
+
+__all__ = [
+    'diurnal_weather',
+    'timeprofile',
+    'INTERPOLATION_TYPES'
+]
+
+##
+## Diurnal weather (feps_weather)
+##
+
+HALF_PI = math.pi / 2
+NIGHT_DECAY = -3.0
+MPH_TO_MPS = 0.447
+XPORT_WIND_MIN = 5.0
+# Night time stability class thresholds, in mph (3 and 5 m/s)
+STABLE_WIND_MAX = 6.71080888
+SLIGHTLY_STABLE_WIND_MAX = 11.1846815
+STABILITY_CLASSES = 'ABCDEF'
+DIF_TEMP_GRAD = [-0.009, -0.008, -0.006, 0.0, 0.015, 0.025]
+DAY_STABILITY_CLASS = 1  # 'B'
+
+def _diurnal_fraction(hours, sunset, midday, predawn):
+    """Returns fraction of the way from min to max (temperature, etc.)
+    each hour, rising sinusoidally from predawn to midday and decaying
+    exponentially after sunset.
+    """
+    daylight = midday - predawn
+    day = (hours >= predawn) & (hours <= sunset)
+
+    day_frac = numpy.sin((hours - predawn) * HALF_PI / daylight)
+
+    sunset_frac = math.sin((sunset - predawn) * HALF_PI / daylight)
+    night_hours = numpy.where(predawn > hours, hours + 24, hours)
+    night_frac = sunset_frac * numpy.exp((night_hours - sunset)
+        * NIGHT_DECAY / (24 - (sunset - predawn)))
+
+    return numpy.where(day, day_frac, night_frac)
+
+def diurnal_weather(weather):
+    """Computes hourly weather for the 24 hours of the day
+
+    args:
+     - weather -- dict with 'sunset_hour', 'max_temp_hour', 'min_temp_hour',
+        'min_humid', 'max_humid', 'min_temp', 'max_temp', 'min_wind',
+        'max_wind', 'min_wind_aloft', and 'max_wind_aloft', as in the
+        fire location info passed to the ubc-bsf-feps time profiler
+
+    Returns dict of 24-element arrays: 'temp', 'humid', 'wind_flame',
+    'modified_wind', 'stability', and 'dif_temp_grad'
+    """
+    sunset = int(weather['sunset_hour'])
+    midday = int(weather['max_temp_hour'])
+    predawn = int(weather['min_temp_hour'])
+
+    hours = numpy.arange(24, dtype=float)
+    frac = _diurnal_fraction(hours, sunset, midday, predawn)
+
+    # Note that 'day' here excludes the predawn hour, unlike above
+    day = (hours > predawn) & (hours <= sunset)
+    wind_flame = numpy.where(day, float(weather['max_wind']),
+        float(weather['min_wind']))
+    wind_aloft = numpy.where(day, float(weather['max_wind_aloft']),
+        float(weather['min_wind_aloft']))
+
+    # Each hour's transport wind depends on the previous hour's
+    modified_wind = numpy.empty(24)
+    prev = float(weather['min_wind_aloft'])
+    for h in range(24):
+        prev = max(XPORT_WIND_MIN, MPH_TO_MPS * max(prev + prev, wind_aloft[h]))
+        modified_wind[h] = prev
+
+    stability = numpy.where(day, DAY_STABILITY_CLASS,
+        numpy.where(wind_flame < STABLE_WIND_MAX, 5,
+            numpy.where(wind_flame < SLIGHTLY_STABLE_WIND_MAX, 4, 3)))
+
+    return {
+        'temp': (float(weather['min_temp']) * (1 - frac)
+            + float(weather['max_temp']) * frac),
+        'humid': (float(weather['min_humid']) * frac
+            + float(weather['max_humid']) * (1 - frac)),
+        'wind_flame': wind_flame,
+        'modified_wind': modified_wind,
+        'stability': [STABILITY_CLASSES[s] for s in stability],
+        'dif_temp_grad': numpy.array(DIF_TEMP_GRAD)[stability]
+    }
+
+##
+## Time profile (feps_timeprofile)
+##
+
+NUM_HOURS = 768  # 32 days
+MISSING = -999.0
+
+# Consumption constants
+Tflm1 = 4.0 / 3.0
+Tflm2 = 8.0
+Tfldfsn = 0.5
+Tsts1 = 8.0 / 3.0
+Tsts2 = 8.0
+Tstdfsn = 0.5
+Krdr = 12.0
+Bsts = 12.0
+dBd = 20.0
+Mdbm = 130.0
+Klti = 1.0
+ONE_MINUS_INV_E = 1 - math.exp(-1)
+MINUTES_PER_HOUR = 60.0
+
+HUMI_BENCHMARK = 60.0
+WIND_BENCHMARK = 3.0
+# The humidity affecting consumption is lagged by this many hours
+HUMIDITY_LAG = 4
+
+INTERPOLATION_TYPES = {
+    'linear': 1,
+    'quadratic': 2,
+    'spline': 3,
+    'sqrt': 4
+}
+
+def _decay_factors(consumption, moisture_duff):
+    """Returns hourly decay factors for flaming, smoldering and
+    residual consumption
+    """
+    with numpy.errstate(divide='ignore'):
+        flm = numpy.float64(consumption['flaming'])
+        sts = numpy.float64(consumption['smoldering'])
+        t_flm = Tflm1 * Tflm2 * math.pow(math.sqrt(flm / dBd), Tfldfsn)
+        t_sts = Tsts1 * Tsts2 * math.pow(sts / Bsts, Tstdfsn)
+        t_rdr = (100.0 * math.exp(-Klti * moisture_duff / Mdbm)
+            * Krdr / 100.0 / ONE_MINUS_INV_E)
+        return [numpy.exp(-1.0 / (numpy.float64(t) / MINUTES_PER_HOUR))
+            for t in (t_flm, t_sts)] + [numpy.exp(-1.0 / numpy.float64(t_rdr))]
+
+def _interpolate(growth, interpolation_type):
+    """Fills in missing hours of cumulative growth in place
+
+    Returns indices of the first and last hours with growth data
+    """
+    known = numpy.nonzero(growth >= 0)[0]
+    if len(known) == 0:
+        raise ValueError("No growth data")
+
+    i = int(known[0])
+    growth[:i] = 0.0
+    first = i + 1 if growth[i] == 0 else i
+
+    c = [0.0, 0.0, 0.0, 0.0]  # polynomial coefficients, lowest order first
+    first_segment = True
+    for j in numpy.nonzero(growth[i + 1:] > 0)[0] + (i + 1):
+        j = int(j)
+        gi, gj = growth[i], growth[j]
+        if interpolation_type == 1:
+            slope = (gj - gi) / (j - i)
+            c = [gi - slope * i, slope, c[2], c[3]]
+        elif interpolation_type == 2 or (interpolation_type == 3 and first_segment):
+            # quadratic, with zero slope at i
+            a = (gj - gi) / ((j - i) * (j - i))
+            c = [a * i * i + gi, a * -2.0 * i, a, c[3]]
+        elif interpolation_type == 3:
+            # cubic spline, continuous through second derivative at i
+            a = numpy.array([
+                [1.0, j, j * j, j * j * j],
+                [1.0, i, i * i, i * i * i],
+                [0.0, 1.0, i + i, 3.0 * i * i],
+                [0.0, 0.0, 2.0, i * 6.0]
+            ])
+            b = numpy.array([gj, gi,
+                (c[2] + c[2]) * i + c[1] + 3.0 * c[3] * i * i,
+                c[3] * 6.0 * i + (c[2] + c[2])])
+            c = list(numpy.linalg.solve(a, b))
+        elif interpolation_type == 4:
+            s = (math.sqrt(gj) - math.sqrt(gi)) / (j - i)
+            b = math.sqrt(gi) - i * s
+            c = [b * b, (s + s) * b, s * s, c[3]]
+        else:
+            raise ValueError("Invalid interpolation method")
+
+        x = numpy.arange(i + 1, j, dtype=float)
+        growth[i + 1:j] = ((c[1] * x + c[0]) + (c[2] * x) * x
+            + x * ((c[3] * x) * x))
+        first_segment = False
+        i = j
+
+    return first, i
+
+def _exponential_filter(x, decay):
+    """Vectorized y[h] = (1 - decay) * x[h] + decay * y[h - 1]"""
+    kernel = (1.0 - decay) * decay ** numpy.arange(len(x))
+    return numpy.convolve(x, kernel)[:len(x)]
+
+def timeprofile(consumption, moisture_duff, growth, humid, wind,
+        interpolation_type=1, normalize=True):
+    """Computes hourly area, flaming, smoldering and residual fractions
+
+    args:
+     - consumption -- dict with 'flaming' and 'smoldering' consumption
+        per unit area
+     - moisture_duff -- duff moisture
+     - growth -- dict of cumulative fire size, keyed by hour index
+        (i.e. day * 24 + hour)
+     - humid -- 24 hourly relative humidity values
+     - wind -- 24 hourly wind speeds at flame height
+
+    kwargs:
+     - interpolation_type -- how growth is interpolated between
+        specified hours; see INTERPOLATION_TYPES
+     - normalize -- whether or not to normalize smoldering and residual
+        fractions to sum to 1
+
+    Returns dict of arrays, keyed by 'area_fraction', 'flaming',
+    'smoldering', and 'residual', each with an element for every hour
+    starting with hour 0 of day 0
+    """
+    g = numpy.full(NUM_HOURS, MISSING)
+    for h, size in growth.items():
+        g[h] = size
+    first, last = _interpolate(g, interpolation_type)
+
+    # Start a day early (if growth starts before 4am) so that lagged
+    # humidity is spun up by hour 0
+    start = (first // 24) * 24
+    if first < 4:
+        start -= 24
+    hours = numpy.arange(start, NUM_HOURS)
+
+    cumulative = g[numpy.clip(hours, first, last)]
+    cumulative[hours < first] = 0.0
+    area_fraction = numpy.diff(cumulative, prepend=0.0) / g[last]
+
+    humid = numpy.asarray(humid, dtype=float)
+    wind = numpy.asarray(wind, dtype=float)
+    rhum = humid[(hours - HUMIDITY_LAG) % 24]
+    rhum[:HUMIDITY_LAG] = 100.0
+    weather_factor = ((100.0 - rhum) * numpy.sqrt(wind[hours % 24] / WIND_BENCHMARK)
+        / HUMI_BENCHMARK * area_fraction)
+
+    d_flm, d_sts, d_rdr = _decay_factors(consumption, moisture_duff)
+    flaming = _exponential_filter(area_fraction, d_flm)
+    smoldering = _exponential_filter(weather_factor, d_sts)
+    residual = _exponential_filter(weather_factor, d_rdr)
+
+    # Hours before the first day of growth are zero
+    profile = {}
+    for k, v in (('area_fraction', area_fraction), ('flaming', flaming),
+            ('smoldering', smoldering), ('residual', residual)):
+        profile[k] = numpy.zeros(NUM_HOURS)
+        profile[k][max(start, 0):] = v[hours >= 0]
+
+    if normalize:
+        smoldering_total = profile['smoldering'].sum()
+        if smoldering_total > 0:
+            profile['smoldering'] = profile['smoldering'] / smoldering_total
+            profile['residual'] = profile['residual'] / profile['residual'].sum()
+
+    return profile
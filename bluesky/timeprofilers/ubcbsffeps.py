@@ -11,9 +11,9 @@ from datetime import timedelta, time, datetime, timezone
 from math import acos, asin, cos, sin, tan, exp, log, pow, sqrt, pi
 from math import degrees as deg, radians as rad
 
-from pyairfire import sun
-
+from bluesky import suntimes
 from bluesky.datetimeutils import parse_datetime
+from bluesky.timeprofilers import feps
 
 # required executables
 FEPS_WEATHER_BINARY = "feps_weather"
@@ -50,6 +50,38 @@ class UbcBsfFEPSTimeProfiler():
         if len(active_area["specified_points"]) != 1:
             raise ValueError("There should be exactly one specified_point per activity object before running Canadian timeprofiling")
 
+        if self._config.get("in_process"):
+            self.hourly_fractions = self._compute_profile(active_area)
+        else:
+            self.hourly_fractions = self._run_binaries(active_area, working_dir)
+        self.start_hour = parse_datetime(active_area["start"])
+        self.ONE_HOUR = timedelta(hours=1)
+
+    def _get_interpolation_type(self):
+        interpType = self.config("interpolation_type")
+        if not interpType: interpType = 1
+        return interpType
+
+    def _compute_profile(self, active_area):
+        """Runs the FEPS weather and time profile models in process,
+        rather than writing input files and running the binaries
+        """
+        fire_location_info = active_area["specified_points"][0]
+        self._fill_fire_location_info(active_area, fire_location_info)
+        weather = feps.diurnal_weather(fire_location_info)
+
+        cons, mduff = self._get_consumption(active_area)
+        growth = dict(enumerate(self._get_growth(active_area)))
+        profile = feps.timeprofile(cons, mduff, growth, weather['humid'],
+            weather['wind_flame'],
+            interpolation_type=self._get_interpolation_type(),
+            normalize=self.config("normalize"))
+
+        # Only the first day is used, as with readProfile
+        return {k: profile[k][:24].tolist() for k in
+            ["area_fraction", "flaming", "residual", "smoldering"]}
+
+    def _run_binaries(self, active_area, working_dir):
         diurnalFile = self._get_diurnal_file(active_area, active_area["specified_points"][0],working_dir)
 
         consumptionFile = os.path.join(working_dir, "cons.txt")
@@ -60,8 +92,7 @@ class UbcBsfFEPSTimeProfiler():
         self.writeGrowth(active_area, growthFile)
 
         # What interpolation mode are we using?
-        interpType = self.config("interpolation_type")
-        if not interpType: interpType = 1
+        interpType = self._get_interpolation_type()
         normalize = self.config("normalize")
         if normalize:
             normSwitch = "-n"
@@ -78,11 +109,12 @@ class UbcBsfFEPSTimeProfiler():
 
         subprocess.check_output(timeProfileArgs)
 
-        self.hourly_fractions = self.readProfile(active_area["start"], profileFile)
-        self.start_hour = parse_datetime(active_area["start"])
-        self.ONE_HOUR = timedelta(hours=1)
+        return self.readProfile(active_area["start"], profileFile)
 
-    def writeConsumption(self, active_area, filename):
+    def _get_consumption(self, active_area):
+        """Returns consumption per unit area, keyed by phase, and
+        average moisture_duff over all specified points
+        """
         cons = active_area["consumption"]["summary"]
 
         # compute total area and average moisture_duff over all specified points
@@ -91,27 +123,42 @@ class UbcBsfFEPSTimeProfiler():
             l['moisture_duff'] for l in active_area['specified_points']
         ]) / len(active_area['specified_points'])
 
+        return {k: cons[k] / area for k in
+            ("flaming", "smoldering", "residual", "duff")}, mduff
+
+    def writeConsumption(self, active_area, filename):
+        cons, mduff = self._get_consumption(active_area)
+
         f = open(filename, 'w')
-        f.write("cons_flm={}\n".format(cons["flaming"] / area))
-        f.write("cons_sts={}\n".format(cons["smoldering"] / area))
-        f.write("cons_lts={}\n".format(cons["residual"] / area))
-        f.write("cons_duff={}\n".format(cons["duff"] / area))
+        f.write("cons_flm={}\n".format(cons["flaming"]))
+        f.write("cons_sts={}\n".format(cons["smoldering"]))
+        f.write("cons_lts={}\n".format(cons["residual"]))
+        f.write("cons_duff={}\n".format(cons["duff"]))
         f.write("moist_duff={}\n".format(mduff))
         f.close()
 
-    def writeGrowth(self, active_area, filename):
-        f = open(filename, 'w')
-        f.write("day, hour, size\n")
-        cumul_size = 0
-        # Write area measurements using WRAP curve
+    def _get_growth(self, active_area):
+        """Returns cumulative fire size for each hour, starting with
+        hour 0 of day 0
+        """
+        # Use WRAP curve
         # NOTE: We are assuming that all fires are of the type WF.
         # This is based off of the standard being said by CWFIS and smartfire.
         # See the orginal framework's version of this method to see how it used to be done.
-        for h, size_fract in enumerate(self.WRAP_TIME_PROFILE):
+        area = active_area["specified_points"][0]["area"]
+        cumul_size = 0
+        growth = []
+        for size_fract in self.WRAP_TIME_PROFILE:
+            cumul_size += area * size_fract
+            growth.append(cumul_size)
+        return growth
+
+    def writeGrowth(self, active_area, filename):
+        f = open(filename, 'w')
+        f.write("day, hour, size\n")
+        for h, cumul_size in enumerate(self._get_growth(active_area)):
             day = h // 24
             hour = h % 24
-            size = active_area["specified_points"][0]["area"] * size_fract
-            cumul_size += size
             f.write("%d, %d, %f\n" %(day, hour, cumul_size))
         f.close()
 
@@ -188,9 +235,11 @@ class UbcBsfFEPSTimeProfiler():
             utc_offset = fire_loc['utc_offset']
             tmidday = datetime(dt.year, dt.month, dt.day, int(12))
             try:
-                s = sun.Sun(lat=float(fire_loc["specified_points"][0]['lat']), lng=float(fire_loc["specified_points"][0]['lng']))
-                fire_location_info['sunrise_hour'] = s.sunrise_hr(tmidday, int(utc_offset))
-                fire_location_info['sunset_hour'] = s.sunset_hr(tmidday, int(utc_offset))
+                (fire_location_info['sunrise_hour'],
+                    fire_location_info['sunset_hour']) = suntimes.get_sunrise_sunset_hours(
+                        float(fire_loc["specified_points"][0]['lat']),
+                        float(fire_loc["specified_points"][0]['lng']),
+                        tmidday, int(utc_offset))
             except:
                 # this calculation can fail near the North/South poles
                 fire_location_info['sunrise_hour'] = 6
@@ -20,6 +20,7 @@ setup(
         'bin/bsp',
         'bin/bsp-run-info',
         'bin/bsp-output-visualizer',
+        'bin/bsp-hysplit2netcdf',
         'bin/ecoregion-lookup'
     ],
     classifiers=[
@@ -0,0 +1,34 @@
+"""Unit tests for bluesky.dispersers.hysplit.filetemplate"""
+
+__author__ = "Joel Dubowy"
+
+from pytest import raises
+
+from bluesky.dispersers.hysplit.filetemplate import FileTemplate
+
+
+class TestFileTemplate():
+
+    def test_render(self):
+        t = FileTemplate().add("a\n").add("b\n").add_field('x').add("c\n")
+        t.add_field('y')
+        assert t.fields == ['x', 'y']
+        # consecutive literals are joined
+        assert len(t._parts) == 4
+        assert t.render(x="1\n", y="") == "a\nb\n1\nc\n"
+        assert t.render(x="", y="2\n3\n") == "a\nb\nc\n2\n3\n"
+
+    def test_literal_percent_and_braces(self):
+        t = FileTemplate().add("%Y {z}\n").add_field('x')
+        assert t.render(x="{y}") == "%Y {z}\n{y}"
+
+    def test_missing_field(self):
+        t = FileTemplate().add("a\n").add_field('x')
+        with raises(KeyError):
+            t.render()
+
+    def test_write(self, tmpdir):
+        filename = str(tmpdir.join('CONTROL'))
+        FileTemplate().add("a\n").add_field('x').write(filename, x="b\n")
+        with open(filename) as f:
+            assert f.read() == "a\nb\n"
@@ -3,8 +3,10 @@
 
 import datetime
 import os
+import random
 
 import afconfig
+import numpy
 from pytest import raises, approx
 
 from bluesky.config import to_lowercase_keys
@@ -12,7 +14,10 @@ from bluesky.dispersers.hysplit import hysplit
 from bluesky.dispersers import SQUARE_METERS_PER_ACRE, GRAMS_PER_TON
 from bluesky.dispersers.hysplit.emissions_file_utils import (
     _compute_emissions_rows_data,
-    _reduce_and_reallocate_vertical_levels
+    _reduce_and_reallocate_vertical_levels,
+    get_emissions_rows_data,
+    iter_emissions_rows_data,
+    reduce_and_reallocate_vertical_levels
 )
 
 class TestGetBinaries():
@@ -348,6 +353,76 @@ class TestReduceVerticalLevels():
         assert fractions == approx(expected_fractions, abs=0.00001)
 
 
+class TestReduceVerticalLevelsVectorized():
+
+    def _plumerise_hours(self):
+        rand = random.Random(2)
+        plumerise_hours = [
+            # equal fractions, all in top, and none
+            {"heights": [1000 + 100*n for n in range(21)],
+                "emission_fractions": [0.05] * 20},
+            {"heights": [1000 + 100*n for n in range(21)],
+                "emission_fractions": [0.0] * 19 + [1.0]},
+            {"heights": [1000 + 100*n for n in range(21)],
+                "emission_fractions": [0.0] * 20}
+        ]
+        for i in range(50):
+            w = [rand.random() for n in range(20)]
+            plumerise_hours.append({
+                "heights": sorted([rand.uniform(0, 5000) for n in range(21)]),
+                "emission_fractions": [e / sum(w) for e in w]
+            })
+        return plumerise_hours
+
+    def test_matches_scalar(self):
+        plumerise_hours = self._plumerise_hours()
+        for reduction_factor in (1, 2, 3, 4, 5, 7, 10, 20):
+            heights, fractions = reduce_and_reallocate_vertical_levels(
+                numpy.array([p['heights'] for p in plumerise_hours], dtype=float),
+                numpy.array([p['emission_fractions'] for p in plumerise_hours], dtype=float),
+                reduction_factor)
+            for i, p in enumerate(plumerise_hours):
+                expected = _reduce_and_reallocate_vertical_levels(p, reduction_factor)
+                # exact equality
+                assert heights[i].tolist() == expected[0]
+                assert fractions[i].tolist() == expected[1]
+
+    def test_iter_emissions_rows_data(self, monkeypatch):
+        monkeypatch.setattr(hysplit.HYSPLITDispersion, '_set_met_info',
+            lambda self, met_info: None)
+        h = hysplit.HYSPLITDispersion({})
+        plumerise_hours = self._plumerise_hours()
+        dts = [datetime.datetime(2015, 8, 5, 0) + datetime.timedelta(hours=n)
+            for n in range(5)]
+        fires = []
+        for i in range(4):
+            fire = hysplit.Fire(id=str(i), latitude=45.0, longitude=-120.0,
+                utc_offset=-i, plumerise={}, timeprofiled_emissions={},
+                timeprofiled_area={})
+            # some hours without emissions
+            for n, dt in enumerate(dts[i % 2:]):
+                local_dt = (dt - datetime.timedelta(hours=i)).strftime('%Y-%m-%dT%H:%M:%S')
+                plumerise_hour = dict(plumerise_hours[i * 5 + n],
+                    smolder_fraction=0.1 * n)
+                fire['plumerise'][local_dt] = plumerise_hour
+                fire['timeprofiled_emissions'][local_dt] = {"PM2.5": 1.5 * n}
+                fire['timeprofiled_area'][local_dt] = 10 + n
+            fires.append(fire)
+
+        for reduction_factor in (1, 5, 20):
+            # two hours at a time
+            results = list(iter_emissions_rows_data(fires, dts, h.config,
+                reduction_factor, max_fire_hours=8))
+            assert [r[0] for r in results] == dts
+            for dt, rows, num_rows, dummy in results:
+                for i, fire in enumerate(fires):
+                    expected_rows, expected_dummy = get_emissions_rows_data(
+                        fire, dt, h.config, reduction_factor)
+                    assert rows[i][:num_rows[i]].tolist() == [
+                        list(r) for r in expected_rows]
+                    assert dummy[i] == expected_dummy
+
+
 class TestGetEmissionsRowsDataForLatLon():
 
     def test_equal_fractions_reduction_factor_4_not_dummy(self, monkeypatch):
@@ -491,3 +566,110 @@ class TestGetEmissionsRowsDataForLatLon():
             plumerise_hour, pm25, area, dummy)
 
         assert rows == expected_rows
+
+
+class TestRecordTrancheRuntimes():
+
+    class MockTranche():
+        def __init__(self, fires, runtime):
+            self.fires = fires
+            self.runtime = runtime
+            self.attempts = 1
+
+    def test(self, monkeypatch):
+        monkeypatch.setattr(hysplit.HYSPLITDispersion, '_set_met_info',
+            lambda self, met_info: None)
+        h = hysplit.HYSPLITDispersion({})
+        tranches = [
+            self.MockTranche([{}, {}, {'is_dummy': True}], 30.0),
+            self.MockTranche([{}], 10.0)
+        ]
+        h._record_tranche_runtimes(tranches, [300.0, 100.0])
+        assert h._tranches == [
+            {"num_fires": 2, "cost": 300.0, "predicted_runtime": 30.0,
+                "runtime": 30.0, "attempts": 1},
+            {"num_fires": 1, "cost": 100.0, "predicted_runtime": 10.0,
+                "runtime": 10.0, "attempts": 1}
+        ]
+
+    def test_zero_cost(self, monkeypatch):
+        monkeypatch.setattr(hysplit.HYSPLITDispersion, '_set_met_info',
+            lambda self, met_info: None)
+        h = hysplit.HYSPLITDispersion({})
+        h._record_tranche_runtimes([self.MockTranche([{}], 1.0)], [0.0])
+        assert h._tranches[0]["predicted_runtime"] == 0.0
+
+    def test_not_run(self, monkeypatch):
+        monkeypatch.setattr(hysplit.HYSPLITDispersion, '_set_met_info',
+            lambda self, met_info: None)
+        h = hysplit.HYSPLITDispersion({})
+        tranches = [self.MockTranche([{}], 5.0), self.MockTranche([{}], None)]
+        h._record_tranche_runtimes(tranches, [10.0, 20.0])
+        assert [t["predicted_runtime"] for t in h._tranches] == [5.0, 10.0]
+        assert h._tranches[1]["runtime"] is None
+
+
+class TestWriteControlAndSetupFiles():
+
+    def _disperser(self, monkeypatch):
+        monkeypatch.setattr(hysplit.HYSPLITDispersion, '_set_met_info',
+            lambda self, met_info: None)
+        h = hysplit.HYSPLITDispersion({})
+        h._met_info = {'files': ['/met/b', '/met/a']}
+        h._model_start = datetime.datetime(2015, 8, 5, 1)
+        h._num_hours = 24
+        h.num_output_quantiles = 1
+        h._grid_params = {"center_latitude": 45.0, "center_longitude": -120.0,
+            "width_longitude": 10.0, "height_latitude": 8.0,
+            "spacing_longitude": 0.1, "spacing_latitude": 0.12}
+        return h
+
+    def _read(self, filename):
+        with open(filename) as f:
+            return f.read().split('\n')
+
+    def test_control_file(self, monkeypatch, tmpdir):
+        h = self._disperser(monkeypatch)
+        fires = [hysplit.Fire(latitude=40.0, longitude=-121.0),
+            hysplit.Fire(latitude=41.5, longitude=-122.25)]
+
+        h._write_control_file(fires, str(tmpdir.join('CONTROL-0')),
+            '/foo/hysplit.con')
+        lines = self._read(str(tmpdir.join('CONTROL-0')))
+        assert lines[:8] == [
+            '15 08 05 01',
+            '4',
+            '   40.000  -121.000    15.000',
+            '   40.000  -121.000    15.000',
+            '   41.500  -122.250    15.000',
+            '   41.500  -122.250    15.000',
+            '0024',
+            '0'
+        ]
+        assert lines[10:14] == ['./', 'a', './', 'b']
+        assert lines[19:25] == ['1', '   45.000  -120.000', '    0.120     0.100',
+            '    8.000    10.000', './', 'hysplit.con']
+
+        # template is reused, with fields filled in for the new fires
+        template = h._control_file_template
+        h._write_control_file(fires[1:], str(tmpdir.join('CONTROL-1')),
+            '/foo/hysplit.con')
+        assert h._control_file_template is template
+        lines_1 = self._read(str(tmpdir.join('CONTROL-1')))
+        assert lines_1[:4] == ['15 08 05 01', '2',
+            '   41.500  -122.250    15.000', '   41.500  -122.250    15.000']
+        assert lines_1[4:] == lines[6:]
+
+    def test_setup_file(self, monkeypatch, tmpdir):
+        h = self._disperser(monkeypatch)
+        fires = [hysplit.Fire(latitude=40.0, longitude=-121.0)]
+        for tranche_num, ninit_val in ((None, 0), (2, 1)):
+            setup_file = str(tmpdir.join('SETUP.CFG-{}'.format(tranche_num)))
+            h._write_setup_file(fires, '/foo/EMISS.CFG', setup_file,
+                ninit_val, 1, tranche_num)
+            lines = self._read(setup_file)
+            assert '  EFILE = "EMISS.CFG",' in lines
+            assert '  NINIT = {},'.format(ninit_val) in lines
+            assert ('  PINPF = "./input/dispersion/PARINIT-02",' in lines) == bool(ninit_val)
+            assert lines[0] == '&SETUP'
+            assert lines[-2] == '&END'
@@ -0,0 +1,167 @@
+"""Unit tests for bluesky.dispersers.hysplit.hysplit2netcdf"""
+
+__author__ = "Joel Dubowy"
+
+import datetime
+import os
+import struct
+
+import netCDF4
+import numpy
+from pytest import raises
+
+from bluesky.dispersers.hysplit import hysplit2netcdf
+
+NUM_LATS = 4
+NUM_LNGS = 5
+LEVELS = [100, 500, 1000]
+POLLUTANTS = ['PM25', 'CO']
+NUM_SAMPLES = 3
+
+def _concentrations(t, p, level):
+    # lat x lng, with zeros
+    j, i = numpy.mgrid[1:NUM_LATS + 1, 1:NUM_LNGS + 1]
+    conc = (t + 1) * (p + 1) * 1e-6 * i * j * level / 100
+    conc[(i + j + t) % 3 == 0] = 0.0
+    return conc.astype(numpy.float32)
+
+def _record(f, payload, split=False):
+    if split:
+        # gfortran splits long records into subrecords, with negative
+        # lengths for all but the last
+        n = len(payload) // 2
+        for length, data in ((-n, payload[:n]), (len(payload) - n, payload[n:])):
+            f.write(struct.pack('>i', length) + data + struct.pack('>i', length))
+    else:
+        f.write(struct.pack('>i', len(payload)) + payload
+            + struct.pack('>i', len(payload)))
+
+def _write_cdump(filename, packed, num_samples=NUM_SAMPLES, split=False):
+    with open(filename, 'wb') as f:
+        _record(f, b'NAM ' + struct.pack('>7i', 19, 7, 25, 0, 0, 1, int(packed)))
+        _record(f, struct.pack('>4i3fi', 19, 7, 25, 0, 45.0, -118.0, 10.0, 0))
+        _record(f, struct.pack('>2i4f', NUM_LATS, NUM_LNGS, 0.5, 0.25, 44.0, -119.0))
+        _record(f, struct.pack('>{}i'.format(len(LEVELS) + 1), len(LEVELS), *LEVELS))
+        _record(f, struct.pack('>i', len(POLLUTANTS))
+            + b''.join([p.ljust(4).encode() for p in POLLUTANTS]))
+        for t in range(num_samples):
+            _record(f, struct.pack('>6i', 19, 7, 25, t, 0, t))
+            _record(f, struct.pack('>6i', 19, 7, 25, t + 1, 0, t + 1))
+            for p, pollutant in enumerate(POLLUTANTS):
+                for level in LEVELS:
+                    conc = _concentrations(t, p, level)
+                    payload = pollutant.ljust(4).encode() + struct.pack('>i', level)
+                    if packed:
+                        j, i = numpy.nonzero(conc)
+                        payload += struct.pack('>i', len(i))
+                        for ii, jj, c in zip(i, j, conc[j, i]):
+                            payload += struct.pack('>2hf', ii + 1, jj + 1, c)
+                    else:
+                        payload += conc.astype('>f4').tobytes()
+                    _record(f, payload, split=split)
+
+
+class TestCdumpReader():
+
+    def _check(self, filename):
+        with open(filename, 'rb') as f:
+            reader = hysplit2netcdf.CdumpReader(f)
+            assert reader.met_model == 'NAM'
+            assert reader.met_start == datetime.datetime(2019, 7, 25, 0)
+            assert reader.starting_locations[0]['release_start'] == \
+                datetime.datetime(2019, 7, 25, 0)
+            assert (reader.num_lats, reader.num_lngs) == (NUM_LATS, NUM_LNGS)
+            assert (reader.lower_left_lat, reader.lower_left_lng) == (44.0, -119.0)
+            assert reader.levels == LEVELS
+            assert reader.pollutants == POLLUTANTS
+
+            records = list(reader)
+            assert len(records) == NUM_SAMPLES * len(POLLUTANTS) * len(LEVELS)
+            start, stop, pollutant, level, conc = records[-1]
+            assert start == datetime.datetime(2019, 7, 25, 2)
+            assert stop == datetime.datetime(2019, 7, 25, 3)
+            assert (pollutant, level) == ('CO', 1000)
+            assert conc.dtype == numpy.float32
+            assert (conc == _concentrations(2, 1, 1000)).all()
+
+    def test_packed(self, tmpdir):
+        filename = str(tmpdir.join('cdump'))
+        _write_cdump(filename, True)
+        self._check(filename)
+
+    def test_unpacked(self, tmpdir):
+        filename = str(tmpdir.join('cdump'))
+        _write_cdump(filename, False)
+        self._check(filename)
+
+    def test_subrecords(self, tmpdir):
+        filename = str(tmpdir.join('cdump'))
+        _write_cdump(filename, False, split=True)
+        self._check(filename)
+
+
+class TestConvert():
+
+    def test_convert(self, tmpdir):
+        input_file = str(tmpdir.join('cdump'))
+        output_file = str(tmpdir.join('out.nc'))
+        _write_cdump(input_file, True)
+        assert hysplit2netcdf.convert(input_file, output_file,
+            scale=1000000.0) == NUM_SAMPLES
+
+        with netCDF4.Dataset(output_file) as ds:
+            assert ds.data_model == 'NETCDF3_CLASSIC'
+            assert [(n, len(d)) for n, d in ds.dimensions.items()] == [
+                ('TSTEP', 3), ('DATE-TIME', 2), ('LAY', 3), ('VAR', 2),
+                ('ROW', 4), ('COL', 5)]
+            assert ds.SDATE == 2019206
+            assert ds.STIME == 10000
+            assert ds.TSTEP == 10000
+            assert (ds.NCOLS, ds.NROWS, ds.NLAYS, ds.NVARS) == (5, 4, 3, 2)
+            assert (ds.XORIG, ds.YORIG, ds.XCELL, ds.YCELL) == (-119.0, 44.0, 0.25, 0.5)
+            assert ds.XCENT == -118.5
+            assert ds.YCENT == 44.75
+            assert ds.VGLVLS.tolist() == [100, 500, 1000, 0]
+            assert ds.getncattr('VAR-LIST') == 'PM25            CO              '
+            assert len(ds.FILEDESC) == 4800
+
+            assert ds['TFLAG'][:].tolist() == [
+                [[2019206, 10000]] * 2, [[2019206, 20000]] * 2,
+                [[2019206, 30000]] * 2]
+            assert ds['PM25'].dimensions == ('TSTEP', 'LAY', 'ROW', 'COL')
+            assert ds['PM25'].units.strip() == 'ug/m^3'
+            for t in range(NUM_SAMPLES):
+                for k, level in enumerate(LEVELS):
+                    for p, pollutant in enumerate(POLLUTANTS):
+                        expected = _concentrations(t, p, level) * numpy.float32(1e6)
+                        assert (ds[pollutant][t, k] == expected).all()
+
+    def test_compression(self, tmpdir):
+        input_file = str(tmpdir.join('cdump'))
+        _write_cdump(input_file, False)
+        hysplit2netcdf.convert(input_file, str(tmpdir.join('a.nc')))
+        hysplit2netcdf.convert(input_file, str(tmpdir.join('b.nc')),
+            compression=4)
+        with netCDF4.Dataset(str(tmpdir.join('a.nc'))) as a, \
+                netCDF4.Dataset(str(tmpdir.join('b.nc'))) as b:
+            assert b.data_model == 'NETCDF4_CLASSIC'
+            assert b['PM25'].filters()['zlib']
+            assert (a['PM25'][:] == b['PM25'][:]).all()
+            assert (a['TFLAG'][:] == b['TFLAG'][:]).all()
+
+    def test_no_samples(self, tmpdir):
+        input_file = str(tmpdir.join('cdump'))
+        _write_cdump(input_file, True, num_samples=0)
+        with raises(ValueError):
+            hysplit2netcdf.convert(input_file, str(tmpdir.join('out.nc')))
+
+    def test_convert_files(self, tmpdir):
+        files = []
+        for i, packed in enumerate((True, False)):
+            files.append((str(tmpdir.join('cdump-{}'.format(i))),
+                str(tmpdir.join('out-{}.nc'.format(i)))))
+            _write_cdump(files[-1][0], packed)
+        assert hysplit2netcdf.convert_files(files, num_processes=2) == [3, 3]
+        with netCDF4.Dataset(files[0][1]) as a, netCDF4.Dataset(files[1][1]) as b:
+            assert (a['CO'][:] == b['CO'][:]).all()
+        assert all(os.path.exists(o) for i, o in files)
@@ -162,6 +162,92 @@ class TestCreateFireTranches():
         assert expected_tranches == fire_tranches
 
 
+class TestEstimateFireSetCosts():
+
+    def test(self, reset_config):
+        fire_sets = [
+            [{"utc_offset": -7, "timeprofiled_emissions": {
+                "2018-11-08T16:00:00": {"PM2.5": 10.0},  # before window
+                "2018-11-08T17:00:00": {"PM2.5": 10.0},
+                "2018-11-08T18:00:00": {"PM2.5": 0.0},   # no emissions
+                "2018-11-08T19:00:00": {"PM2.5": 30.0}   # after window
+            }}],
+            [{"timeprofiled_emissions": {
+                "2018-11-09T01:00:00": {"PM2.5": 5.0},
+                "2018-11-09T02:00:00": {"PM2.5": 5.0}   # after window
+            }}, {}],
+            [hysplit_utils.generate_dummy_fire(
+                datetime.datetime(2018, 11, 9, 0, 0, 0), 2, TestCreateFireTranches.GRID_PARAMS)]
+        ]
+        costs = hysplit_utils.estimate_fire_set_costs(fire_sets,
+            datetime.datetime(2018, 11, 9, 0, 0, 0), 2, 21)
+        assert costs == [1 + 21 + 0.1, 1 + 21 + 0.05, 0.0]
+
+        costs = hysplit_utils.estimate_fire_set_costs(fire_sets,
+            datetime.datetime(2018, 11, 9, 0, 0, 0), 2, 21,
+            weights={"location_hours": 0.0, "pm25_tons": 1.0})
+        assert costs == [21 + 10, 21 + 5, 0.0]
+
+
+class TestAssignTranches():
+
+    def test_lpt(self):
+        # LPT puts 7 & 3 together and 5 & 4 together (loads 10 and 9),
+        # whereas splitting by count would give loads 12 and 7
+        assert hysplit_utils.assign_tranches([7, 5, 4, 3], 2) == [[0, 3], [1, 2]]
+
+    def test_ties_and_empty_tranches(self):
+        assert hysplit_utils.assign_tranches([1, 1, 1, 1], 2) == [[0, 2], [1, 3]]
+        assert hysplit_utils.assign_tranches([2, 1], 3) == [[0], [1], []]
+
+    def test_zero_and_equal_costs(self):
+        assert hysplit_utils.assign_tranches([5.0, 0.0, 0.0], 3) == [[0], [1], [2]]
+        assert hysplit_utils.assign_tranches([0, 0, 0], 3) == [[0], [1], [2]]
+        assert hysplit_utils.assign_tranches([0, 0, 0, 0, 0], 2) == [
+            [0, 2, 4], [1, 3]]
+        assert hysplit_utils.assign_tranches([3, 3, 0, 0], 3) == [
+            [0], [1], [2, 3]]
+        for n in range(1, 6):
+            tranches = hysplit_utils.assign_tranches([1.0] + [0.0] * 9, n)
+            assert all(tranches)
+
+    def test_makespan(self):
+        costs = [(i * 37) % 101 for i in range(200)]
+        tranches = hysplit_utils.assign_tranches(costs, 8)
+        assert sorted(sum(tranches, [])) == list(range(200))
+        loads = [sum([costs[i] for i in t]) for t in tranches]
+        # LPT is within max(cost) of the optimal makespan
+        assert max(loads) - sum(costs) / 8 <= max(costs)
+
+
+class TestCreateFireTranchesByCost():
+
+    def test(self, reset_config):
+        fire_sets = [[MockFireLocationData(i)] for i in range(4)]
+        fire_tranches = hysplit_utils.create_fire_tranches(fire_sets, 2,
+            datetime.datetime(2018, 11, 9, 0, 0, 0), 24,
+            TestCreateFireTranches.GRID_PARAMS, costs=[7, 5, 4, 3])
+        assert fire_tranches == [
+            [fire_sets[0][0], fire_sets[3][0]],
+            [fire_sets[1][0], fire_sets[2][0]]
+        ]
+
+    def test_with_dummy_fires(self, reset_config):
+        fire_sets = [[MockFireLocationData(i)] for i in range(2)]
+        fire_tranches = hysplit_utils.create_fire_tranches(fire_sets, 3,
+            datetime.datetime(2018, 11, 9, 0, 0, 0), 24,
+            TestCreateFireTranches.GRID_PARAMS, costs=[1, 2])
+        assert fire_tranches[:2] == [[fire_sets[1][0]], [fire_sets[0][0]]]
+        assert fire_tranches[2][0].get('is_dummy')
+
+    def test_zero_costs(self, reset_config):
+        fire_sets = [[MockFireLocationData(i)] for i in range(3)]
+        fire_tranches = hysplit_utils.create_fire_tranches(fire_sets, 3,
+            datetime.datetime(2018, 11, 9, 0, 0, 0), 24,
+            TestCreateFireTranches.GRID_PARAMS, costs=[0, 0, 0])
+        assert fire_tranches == [[f] for fs in fire_sets for f in fs]
+
+
 class TestComputeNumProcesses():
 
     def test(self, reset_config):
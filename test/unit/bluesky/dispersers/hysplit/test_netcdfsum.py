@@ -0,0 +1,88 @@
+"""Unit tests for bluesky.dispersers.hysplit.netcdfsum"""
+
+__author__ = "Joel Dubowy"
+
+import os
+
+import netCDF4
+import numpy
+from pytest import raises
+
+from bluesky.dispersers.hysplit import netcdfsum
+from bluesky.dispersers.hysplit.netcdfsum import NetCDFSummer
+
+
+def _write(filename, pm25, tflag):
+    with netCDF4.Dataset(filename, 'w', format='NETCDF3_CLASSIC') as ds:
+        ds.setncatts({"IOAPI_VERSION": "1.0", "NVARS": 1})
+        ds.createDimension('TSTEP', None)
+        ds.createDimension('DATE-TIME', 2)
+        ds.createDimension('LAY', pm25.shape[1])
+        ds.createDimension('ROW', pm25.shape[2])
+        ds.createDimension('COL', pm25.shape[3])
+        ds.createDimension('VAR', 1)
+        v = ds.createVariable('PM25', 'f4', ('TSTEP', 'LAY', 'ROW', 'COL'))
+        v.setncatts({"units": "ug/m**3", "long_name": "PM25"})
+        v[:] = pm25
+        v = ds.createVariable('TFLAG', 'i4', ('TSTEP', 'VAR', 'DATE-TIME'))
+        v.units = "<YYYYDDD,HHMMSS>"
+        v[:] = tflag
+
+
+class TestChunks():
+
+    def test(self):
+        assert list(netcdfsum._chunks((5, 2, 3), 12)) == [
+            slice(0, 2), slice(2, 4), slice(4, 5)]
+        # at least one index of first dimension
+        assert list(netcdfsum._chunks((2, 2, 3), 4)) == [slice(0, 1), slice(1, 2)]
+        assert list(netcdfsum._chunks((3,), 100)) == [slice(0, 3)]
+
+
+class TestNetCDFSummer():
+
+    def setup_method(self):
+        rand = numpy.random.default_rng(0)
+        self.pm25 = [rand.random((5, 2, 3, 4), dtype=numpy.float32) * 100
+            for i in range(3)]
+        self.tflag = numpy.array([[[2019206, h * 10000]] for h in range(5)],
+            dtype=numpy.int32)
+
+    def test_sum(self, tmpdir):
+        output_file = str(tmpdir.join('hysplit_conc.nc'))
+        summer = NetCDFSummer(output_file, chunk_size=30)
+        for i, pm25 in enumerate(self.pm25):
+            f = str(tmpdir.join('{}.nc'.format(i)))
+            _write(f, pm25, self.tflag)
+            summer.add(f)
+        summer.write()
+
+        with netCDF4.Dataset(output_file) as ds:
+            assert set(ds.variables) == {'PM25', 'TFLAG'}
+            assert ds.IOAPI_VERSION == "1.0"
+            assert ds.dimensions['TSTEP'].isunlimited()
+            assert ds.variables['PM25'].units == "ug/m**3"
+            assert ds.variables['PM25'].dtype == numpy.float32
+            expected = (self.pm25[0].astype(float) + self.pm25[1]
+                + self.pm25[2]).astype(numpy.float32)
+            assert (ds.variables['PM25'][:] == expected).all()
+            # TFLAG is copied, not summed
+            assert (ds.variables['TFLAG'][:] == self.tflag).all()
+
+        # running totals are removed
+        assert sorted(os.listdir(str(tmpdir))) == [
+            '0.nc', '1.nc', '2.nc', 'hysplit_conc.nc']
+
+    def test_shape_mismatch(self, tmpdir):
+        summer = NetCDFSummer(str(tmpdir.join('out.nc')))
+        _write(str(tmpdir.join('0.nc')), self.pm25[0], self.tflag)
+        _write(str(tmpdir.join('1.nc')), self.pm25[1][:4], self.tflag[:4])
+        summer.add(str(tmpdir.join('0.nc')))
+        with raises(ValueError):
+            summer.add(str(tmpdir.join('1.nc')))
+        summer.close()
+        assert not tmpdir.join('out.nc.PM25.sum').check()
+
+    def test_no_files(self, tmpdir):
+        with raises(ValueError):
+            NetCDFSummer(str(tmpdir.join('out.nc'))).write()
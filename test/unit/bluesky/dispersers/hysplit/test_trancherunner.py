@@ -0,0 +1,125 @@
+"""Unit tests for bluesky.dispersers.hysplit.trancherunner"""
+
+__author__ = "Joel Dubowy"
+
+import threading
+import time
+
+from pytest import raises
+
+from bluesky.config import Config
+from bluesky.dispersers.hysplit import trancherunner
+from bluesky.dispersers.hysplit.trancherunner import Tranche, TrancheRunner
+
+
+class MockRunFunc():
+
+    def __init__(self, failures=None, sleep=0.01):
+        self._failures = dict(failures or {})
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self.num_running = 0
+        self.max_running = 0
+        self.calls = []
+        self.configs = []
+
+    def __call__(self, fires, working_dir, tranche_num):
+        with self._lock:
+            self.num_running += 1
+            self.max_running = max(self.max_running, self.num_running)
+            self.calls.append(tranche_num)
+            self.configs.append(Config().get('dispersion', 'hysplit', 'numpar'))
+        try:
+            time.sleep(self._sleep)
+            with self._lock:
+                if self._failures.get(tranche_num):
+                    self._failures[tranche_num] -= 1
+                    raise RuntimeError("tranche {} failed".format(tranche_num))
+        finally:
+            with self._lock:
+                self.num_running -= 1
+
+
+def _tranches(tmpdir, n):
+    return [Tranche(i, [{}], str(tmpdir.join(str(i)))) for i in range(n)]
+
+
+class TestTrancheRunner():
+
+    def test_max_concurrency(self, reset_config, tmpdir):
+        Config().set(123, 'dispersion', 'hysplit', 'NUMPAR')
+        run_func = MockRunFunc()
+        tranches = TrancheRunner(run_func, max_concurrency=3).run(
+            _tranches(tmpdir, 10))
+        assert run_func.max_running <= 3
+        assert sorted(run_func.calls) == list(range(10))
+        # workers use the main thread's config
+        assert run_func.configs == [123] * 10
+        assert all([t.exc is None and t.attempts == 1 and t.runtime > 0
+            for t in tranches])
+        assert tmpdir.join('9').check(dir=1)
+
+    def test_default_concurrency(self, monkeypatch):
+        monkeypatch.setattr(trancherunner.os, 'cpu_count', lambda: 8)
+        assert TrancheRunner(None)._compute_concurrency(20) == 8
+        assert TrancheRunner(None)._compute_concurrency(5) == 5
+        assert TrancheRunner(None, cpus_per_tranche=3)._compute_concurrency(20) == 2
+        assert TrancheRunner(None, max_concurrency=12)._compute_concurrency(20) == 12
+
+    def test_memory_limited_concurrency(self, monkeypatch):
+        monkeypatch.setattr(trancherunner.os, 'cpu_count', lambda: 8)
+        monkeypatch.setattr(trancherunner, 'get_available_memory_mb', lambda: 2500)
+        assert TrancheRunner(None, memory_mb=1000)._compute_concurrency(20) == 2
+        assert TrancheRunner(None, memory_mb=5000)._compute_concurrency(20) == 1
+
+        monkeypatch.setattr(trancherunner, 'get_available_memory_mb', lambda: None)
+        assert TrancheRunner(None, memory_mb=1000)._compute_concurrency(20) == 8
+
+    def test_memory_admission(self, reset_config, tmpdir, monkeypatch):
+        # Only the first tranche may start while memory is low
+        available = [0]
+        monkeypatch.setattr(trancherunner, 'get_available_memory_mb',
+            lambda: available[0])
+        monkeypatch.setattr(trancherunner, 'MEMORY_POLL_SECONDS', 0.01)
+        runner = TrancheRunner(MockRunFunc(), max_concurrency=4, memory_mb=100)
+        runner._compute_concurrency = lambda n: 4
+        tranches = runner.run(_tranches(tmpdir, 4))
+        assert runner._run_func.max_running == 1
+        assert all([t.exc is None for t in tranches])
+
+    def test_retries(self, reset_config, tmpdir):
+        run_func = MockRunFunc(failures={1: 2, 2: 1})
+        tranches = TrancheRunner(run_func, max_concurrency=2,
+            max_retries=2).run(_tranches(tmpdir, 3))
+        assert [t.attempts for t in tranches] == [1, 3, 2]
+        assert all([t.exc is None for t in tranches])
+
+    def test_failure(self, reset_config, tmpdir):
+        run_func = MockRunFunc(failures={0: 5})
+        tranches = TrancheRunner(run_func, max_concurrency=1,
+            max_retries=1).run(_tranches(tmpdir, 3))
+        assert str(tranches[0].exc) == "tranche 0 failed"
+        assert tranches[0].attempts == 2
+        # remaining tranches aren't started after the failure
+        assert run_func.calls == [0, 0]
+        assert [t.attempts for t in tranches[1:]] == [0, 0]
+        assert tranches[1].runtime is None
+
+    def test_on_complete(self, reset_config, tmpdir):
+        completed = []
+        tranches = TrancheRunner(MockRunFunc(failures={1: 1}), max_concurrency=2,
+            max_retries=1, on_complete=completed.append).run(
+            _tranches(tmpdir, 4))
+        assert sorted([t.tranche_num for t in completed]) == [0, 1, 2, 3]
+        # the failed tranche is reported once, after being retried
+        assert tranches[1].attempts == 2
+        assert all([t.exc is None for t in tranches])
+
+    def test_on_complete_failure(self, reset_config, tmpdir):
+        def on_complete(tranche):
+            raise ValueError("failed to sum")
+        run_func = MockRunFunc()
+        with raises(ValueError):
+            TrancheRunner(run_func, max_concurrency=1,
+                on_complete=on_complete).run(_tranches(tmpdir, 3))
+        assert run_func.calls == [0, 1]
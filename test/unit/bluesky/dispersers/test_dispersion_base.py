@@ -378,3 +378,57 @@ class TestDispersionBaseSetFireData():
             for k in f.keys():
                 assert f[k] == expected_fires[i][k], "{} don't match".format(k)
 
+
+
+class FakeVsmokeDisperser(FakeDisperser):
+
+    REQUIRED_SPECIES = ('PM2.5', 'CO')
+
+
+class TestDispersionBaseSpecies():
+
+    LOC = {
+        "fuelbeds": [
+            {
+                "emissions": {
+                    "flaming": {"PM2.5": [1.0], "CO": [2.0], "NOx": [3.0]},
+                    "smoldering": {"PM2.5": [4.0], "CO": [5.0]},
+                    "residual": {"PM2.5": [6.0]}
+                }
+            },
+            {
+                "emissions": {
+                    "flaming": {"PM2.5": [0.5], "NOx": [0.25, 0.25]},
+                    "smoldering": {},
+                    "residual": {"PM2.5": [1.5]}
+                }
+            }
+        ]
+    }
+
+    def teardown_method(self):
+        Config().reset()
+
+    def test_default(self, reset_config):
+        assert FakeDisperser({})._get_species() == ['PM2.5', 'CO']
+
+    def test_configured(self, reset_config):
+        Config().set(['NOx'], 'dispersion', 'species')
+        assert FakeDisperser({})._get_species() == ['NOx', 'PM2.5']
+        assert FakeVsmokeDisperser({})._get_species() == ['NOx', 'PM2.5', 'CO']
+
+        Config().set([], 'dispersion', 'species')
+        assert FakeDisperser({})._get_species() == ['PM2.5']
+
+    def test_get_emissions(self):
+        d = FakeDisperser({})
+        assert d._get_emissions(self.LOC, ['PM2.5']) == {
+            "flaming": {"PM2.5": 1.5},
+            "smoldering": {"PM2.5": 4.0},
+            "residual": {"PM2.5": 7.5}
+        }
+        assert d._get_emissions(self.LOC, ['CO', 'NOx']) == {
+            "flaming": {"CO": 2.0, "NOx": 3.5},
+            "smoldering": {"CO": 5.0},
+            "residual": {}
+        }
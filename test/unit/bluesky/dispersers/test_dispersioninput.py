@@ -0,0 +1,169 @@
+"""Unit tests for bluesky.dispersers.dispersioninput"""
+
+__author__ = "Joel Dubowy"
+
+import datetime
+
+from pytest import raises
+
+from bluesky.dispersers import dispersioninput
+from bluesky.models.timeprofile import HourlyTimeProfile
+
+PHASES = ['flaming', 'smoldering', 'residual']
+MISSING_PLUMERISE_HOUR = dict(heights=[0.0, 0.0], emission_fractions=[1.0],
+    smolder_fraction=0.0)
+MISSING_TIMEPROFILE_HOUR = dict({p: 0.0 for p in PHASES}, area_fraction=0.0)
+
+PLUMERISE_HOUR = dict(heights=[100.0, 200.0], emission_fractions=[1.0],
+    smolder_fraction=0.05)
+TIMEPROFILE = {
+    "2015-08-04T17:00:00": {"area_fraction": 0.1, "flaming": 0.2,
+        "smoldering": 0.1, "residual": 0.1},
+    "2015-08-04T18:00:00": {"area_fraction": 0.3, "flaming": 0.4,
+        "smoldering": 0.2, "residual": 0.0}
+}
+EMISSIONS = {
+    "flaming": {"PM2.5": 9.545588271207714, "CO": 3.0},
+    "smoldering": {"PM2.5": 21.073928205514225},
+    "residual": {"PM2.5": 24.10635856528243}
+}
+
+
+class TestDispersionInput():
+
+    def setup_method(self):
+        # local start, 2015-08-04T17:00:00, is one hour before timeprofile
+        self.input = dispersioninput.DispersionInput(
+            datetime.datetime(2015, 8, 5, 0), 3, ('PM2.5', 'CO'), PHASES,
+            MISSING_PLUMERISE_HOUR, MISSING_TIMEPROFILE_HOUR)
+
+    def _add(self, timeprofile, loc_num=0):
+        self.input.add_location('abc', loc_num, {}, None, None, 120.0,
+            47.41, -121.41, -8,
+            {"2015-08-04T17:00:00": PLUMERISE_HOUR}, timeprofile,
+            EMISSIONS, {"total": 1.0}, None)
+
+    def test_local_hours(self):
+        assert self.input.local_hours(-8) == [
+            "2015-08-04T16:00:00", "2015-08-04T17:00:00", "2015-08-04T18:00:00"]
+        assert self.input.hour_indices(-8) == {"2015-08-04T16:00:00": 0,
+            "2015-08-04T17:00:00": 1, "2015-08-04T18:00:00": 2}
+        assert self.input.local_hours(0)[0] == "2015-08-05T00:00:00"
+
+    def test_fires(self):
+        self._add(TIMEPROFILE)
+        fires = self.input.fires()
+        assert len(fires) == 1
+        f = fires[0]
+        assert f['id'] == 'abc-0'
+        assert f['original_fire_ids'] == {'abc'}
+        assert 'heat' not in f
+        assert f['plumerise'] == {
+            "2015-08-04T16:00:00": MISSING_PLUMERISE_HOUR,
+            "2015-08-04T17:00:00": PLUMERISE_HOUR,
+            "2015-08-04T18:00:00": MISSING_PLUMERISE_HOUR
+        }
+        assert f['timeprofiled_area'] == {
+            "2015-08-04T16:00:00": 0.0,
+            "2015-08-04T17:00:00": 0.1 * 120.0,
+            "2015-08-04T18:00:00": 0.3 * 120.0
+        }
+        assert f['timeprofiled_emissions'] == {
+            "2015-08-04T16:00:00": {"PM2.5": 0.0, "CO": 0.0},
+            "2015-08-04T17:00:00": {
+                "PM2.5": sum([0.2 * 9.545588271207714,
+                    0.1 * 21.073928205514225, 0.1 * 24.10635856528243]),
+                "CO": 0.2 * 3.0
+            },
+            "2015-08-04T18:00:00": {
+                "PM2.5": sum([0.4 * 9.545588271207714,
+                    0.2 * 21.073928205514225, 0.0 * 24.10635856528243]),
+                "CO": 0.4 * 3.0
+            }
+        }
+
+    def test_hourly_time_profile(self):
+        self._add(TIMEPROFILE, 0)
+        self._add(HourlyTimeProfile.from_dict(TIMEPROFILE), 1)
+        f1, f2 = self.input.fires()
+        for k in ('plumerise', 'timeprofiled_area', 'timeprofiled_emissions'):
+            assert f1[k].to_dict() == f2[k].to_dict()
+
+    def test_invalid_timeprofile(self):
+        with raises(KeyError):
+            self._add({"2015-08-04T17:00:00": {"area_fraction": 0.1}})
+        assert len(self.input) == 0
+        assert self.input.fires() == []
+
+    def test_none_fractions(self):
+        # None fractions used to raise TypeError when multiplied by area
+        # and emissions, and must not silently become NaN
+        for k in ('area_fraction', 'flaming'):
+            timeprofile = dict(TIMEPROFILE, **{
+                "2015-08-04T17:00:00": dict(TIMEPROFILE["2015-08-04T17:00:00"],
+                    **{k: None})})
+            with raises(TypeError):
+                self._add(timeprofile)
+        timeprofile = dict(TIMEPROFILE, **{
+            "2015-08-04T17:00:00": {"flaming": 0.2, "smoldering": 0.1,
+                "residual": 0.1}})
+        with raises(TypeError):
+            self._add(timeprofile)
+        assert len(self.input) == 0
+
+    def test_abstract_view(self):
+        with raises(TypeError):
+            dispersioninput._LocationHours(self.input, 0, -8)
+
+
+class TestHourlyEmissions():
+
+    def setup_method(self):
+        self.input = dispersioninput.DispersionInput(
+            datetime.datetime(2015, 8, 5, 0), 3, ('PM2.5', 'CO'), PHASES,
+            MISSING_PLUMERISE_HOUR, MISSING_TIMEPROFILE_HOUR)
+        self.input.add_location('abc', 0, {}, None, None, 120.0,
+            47.41, -121.41, -8, {}, TIMEPROFILE, EMISSIONS,
+            {"total": 1.0}, None)
+        self.emissions = self.input.fires()[0]['timeprofiled_emissions']
+
+    def test_species_value(self):
+        assert self.emissions.species_value("2015-08-04T17:00:00", 'CO') == 0.2 * 3.0
+        assert self.emissions.species_value("2015-08-04T16:00:00", 'PM2.5') == 0.0
+        with raises(KeyError):
+            self.emissions.species_value("2015-08-04T19:00:00", 'CO')
+        with raises(KeyError):
+            self.emissions.species_value("2015-08-04T17:00:00", 'NOx')
+
+    def test_species_items(self):
+        assert self.emissions.species_items('CO') == [
+            ("2015-08-04T16:00:00", 0.0),
+            ("2015-08-04T17:00:00", 0.2 * 3.0),
+            ("2015-08-04T18:00:00", 0.4 * 3.0)
+        ]
+        assert [v for k, v in self.emissions.species_items('NOx')] == [None] * 3
+
+    def test_get_hourly_emissions(self):
+        d = self.emissions.to_dict()
+        for hr in d:
+            for s in ('PM2.5', 'CO'):
+                assert (dispersioninput.get_hourly_emissions(self.emissions, hr, s)
+                    == dispersioninput.get_hourly_emissions(d, hr, s))
+        with raises(KeyError):
+            dispersioninput.get_hourly_emissions(d, "2015-08-04T19:00:00", 'CO')
+
+    def test_species_emissions(self):
+        assert self.input._emissions == {}
+        co = self.input.species_emissions('CO')
+        # only the requested species is computed
+        assert list(self.input._emissions) == ['CO']
+        assert co.tolist() == [[0.0, 0.2 * 3.0, 0.4 * 3.0]]
+        assert self.input.species_emissions('CO') is co
+        with raises(KeyError):
+            self.input.species_emissions('NOx')
+
+        # adding a location recomputes emissions
+        self.input.add_location('abc', 1, {}, None, None, 120.0,
+            47.41, -121.41, -8, {}, TIMEPROFILE, EMISSIONS,
+            {"total": 1.0}, None)
+        assert self.input.species_emissions('CO').shape == (2, 3)
@@ -2,6 +2,7 @@ import copy
 import datetime
 import uuid
 
+import numpy
 import pytest
 
 from bluesky.dispersers import firemerge
@@ -351,6 +352,63 @@ class TestFireMerger():
         assert self.FIRE_1 == original_fire_1
         assert self.FIRE_CONTIGUOUS_TIME_WINDOWS == original_fire_contiguous_time_windows
 
+    def test_three_fires(self, monkeypatch):
+        monkeypatch.setattr(uuid, 'uuid4', lambda: '1234abcd')
+
+        fire_3 = copy.deepcopy(self.FIRE_NON_CONTIGUOUS_TIME_WINDOWS)
+        fire_3.update(meta={'foo': 'bar'}, start=datetime.datetime(2015,8,4,21,0,0),
+            end=datetime.datetime(2015,8,4,23,0,0), original_fire_ids={"SF22"})
+        for k in ('plumerise', 'timeprofiled_area', 'timeprofiled_emissions'):
+            fire_3[k] = {"2015-08-04T{}:00:00".format(int(h[11:13]) + 1): v
+                for h, v in fire_3[k].items()}
+        fire_3.pop('heat')
+        fires = [fire_3, self.FIRE_CONTIGUOUS_TIME_WINDOWS, self.FIRE_1]
+        original_fires = copy.deepcopy(fires)
+
+        merged_fires = firemerge.FireMerger().merge(fires)
+
+        expected_merged_fires = [
+            Fire({
+                "id": "1234abcd",
+                "original_fire_ids": {"SF11C14225236095807750", "SF22"},
+                "meta": {'foo': 'bar', 'bar': 'asdasd'},
+                "start": datetime.datetime(2015,8,4,17,0,0),
+                "end": datetime.datetime(2015,8,4,23,0,0),
+                "area": 340.0, "latitude": 47.41, "longitude": -121.41, "utc_offset": -7.0,
+                "plumerise": {
+                    "2015-08-04T17:00:00": PLUMERISE_HOUR,
+                    "2015-08-04T18:00:00": EMPTY_PLUMERISE_HOUR,
+                    "2015-08-04T19:00:00": PLUMERISE_HOUR,
+                    "2015-08-04T20:00:00": EMPTY_PLUMERISE_HOUR,
+                    "2015-08-04T21:00:00": PLUMERISE_HOUR,
+                    "2015-08-04T22:00:00": EMPTY_PLUMERISE_HOUR
+                },
+                "timeprofiled_area": {
+                    "2015-08-04T17:00:00": 12.0,
+                    "2015-08-04T18:00:00": 0.0,
+                    "2015-08-04T19:00:00": 10.0,
+                    "2015-08-04T20:00:00": 0.0,
+                    "2015-08-04T21:00:00": 12.0,
+                    "2015-08-04T22:00:00": 0.0
+                },
+                "timeprofiled_emissions": {
+                    "2015-08-04T17:00:00": {"CO": 0.0, "PM2.5": 4.0},
+                    "2015-08-04T18:00:00": {"CO": 0.0, 'PM2.5': 0.0},
+                    "2015-08-04T19:00:00": {"CO": 0.0, "PM2.5": 5.0},
+                    "2015-08-04T20:00:00": {"CO": 0.0, 'PM2.5': 0.0},
+                    "2015-08-04T21:00:00": {"CO": 0.0, "PM2.5": 4.0},
+                    "2015-08-04T22:00:00": {"CO": 0.0, 'PM2.5': 0.0}
+                },
+                "consumption": {k: v + v + v for k,v in CONSUMPTION['summary'].items()},
+                "heat": 4000000.0
+            })
+        ]
+
+        assert merged_fires == expected_merged_fires
+
+        # make sure input fires weren't modified
+        assert fires == original_fires
+
     def test_all(self, monkeypatch):
         monkeypatch.setattr(uuid, 'uuid4', lambda: '1234abcd')
 
@@ -491,6 +549,19 @@ class TestPlumeMerger_ValidateConfig(BaseTestPlumeMerger):
                 }
             })
 
+        for precision in ('int32', 'sdf'):
+            with pytest.raises(BlueSkyConfigurationError) as e_info:
+                firemerge.PlumeMerger({
+                    "precision": precision,
+                    "grid": {
+                        "spacing": 0.5,
+                        "boundary": {
+                          "sw": { "lat": 30, "lng": -120 },
+                          "ne": { "lat": 40, "lng": -110 }
+                        }
+                    }
+                })
+
     def test_valid_not_empty(self):
         firemerge.PlumeMerger({
             "grid": {
@@ -793,6 +864,90 @@ class TestPlumeMerger_MergeFires(BaseTestPlumeMerger):
         #assert actual == expected
 
 
+    def test_merge_plumerise_float32(self):
+        merger = firemerge.PlumeMerger({
+            "precision": "float32",
+            "grid": {
+                "spacing": 0.5,
+                "boundary": {
+                  "sw": { "lat": 30, "lng": -110 },
+                  "ne": { "lat": 40, "lng": -120 }
+                }
+            }
+        })
+        fires = [copy.deepcopy(self.FIRE_1), copy.deepcopy(self.FIRE_2)]
+        expected = self.merger._merge_plumerise(fires)
+        actual = merger._merge_plumerise(fires)
+        assert set(actual) == set(expected)
+        for dt in expected:
+            for k in ('emission_fractions', 'heights', 'smolder_fraction'):
+                assert actual[dt][k] == pytest.approx(expected[dt][k], rel=1e-6)
+
+
+class TestPlumeMerger_MergePlumeriseHours(BaseTestPlumeMerger):
+
+    def _fire(self, dt, heights, fractions, pm25, smolder_fraction=0.05):
+        return Fire({
+            "plumerise": {dt: {
+                "emission_fractions": fractions,
+                "heights": heights,
+                "smolder_fraction": smolder_fraction
+            }},
+            "timeprofiled_emissions": {dt: {"PM2.5": pm25}}
+        })
+
+    def test_same_as_merge_plumerise_hour(self):
+        fires = [
+            self._fire("2015-08-04T17:00:00", [90, 250, 300, 325, 350],
+                [0.4, 0.2, 0.2, 0.2], 10.0),
+            self._fire("2015-08-04T17:00:00", [100, 200, 300, 400, 500],
+                [0.1, 0.3, 0.4, 0.2], 2.5, 0.06),
+            self._fire("2015-08-04T17:00:00", [95, 150, 170, 330, 410],
+                [0.15, 0.35, 0.3, 0.2], 1.3, 0.1)
+        ]
+        dt = "2015-08-04T17:00:00"
+        for n in (2, 3):
+            expected = self.merger._merge_plumerise_hour(fires[:n], dt)
+            actual = self.merger._merge_plumerise_hours(
+                firemerge._PlumeHours([(dt, fires[:n])], numpy.dtype('float64')))
+            assert actual == {dt: expected}
+
+    def test_unmerged_hours(self):
+        dts = ["2015-08-04T17:00:00", "2015-08-04T18:00:00", "2015-08-04T19:00:00"]
+        hours = [
+            # no emissions
+            (dts[0], [
+                self._fire(dts[0], [100, 200, 300], [0.5, 0.5], 0.0),
+                self._fire(dts[0], [150, 250, 350], [0.2, 0.8], 0.0)
+            ]),
+            # all heights zero
+            (dts[1], [
+                self._fire(dts[1], [0, 0, 0], [0.5, 0.5], 1.0),
+                self._fire(dts[1], [0, 0, 0], [0.2, 0.8], 2.0)
+            ]),
+            # merged; fewer fires than other hours
+            (dts[2], [
+                self._fire(dts[2], [100, 200, 300], [0.5, 0.5], 1.0)
+            ])
+        ]
+        hours[2][1].append(self._fire(dts[2], [200, 300, 500], [0.2, 0.8], 3.0))
+        actual = self.merger._merge_plumerise_hours(
+            firemerge._PlumeHours(hours, numpy.dtype('float64')))
+        assert actual == {
+            dts[0]: hours[0][1][0]['plumerise'][dts[0]],
+            dts[1]: hours[1][1][0]['plumerise'][dts[1]],
+            dts[2]: self.merger._merge_plumerise_hour(hours[2][1], dts[2])
+        }
+
+    def test_sum_segments(self):
+        values = [0.1, 0.2, 1e16, 1.0, -1e16, 0.3, 0.7, 0.25]
+        segments = [0, 0, 2, 2, 2, 2, 4, 4]
+        expected = [sum(values[0:2]), 0, sum(values[2:6]), 0, sum(values[6:])]
+        actual = firemerge._sum_segments(numpy.array(values),
+            numpy.array(segments), 5)
+        assert actual.tolist() == expected
+
+
 class TestPlumeMerger_Merge(BaseTestPlumeMerger):
     # TODO: add test with some fires merged and some not
     pass
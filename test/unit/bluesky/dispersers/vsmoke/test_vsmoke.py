@@ -0,0 +1,282 @@
+"""Unit tests for bluesky.dispersers.vsmoke.vsmoke"""
+
+__author__ = "Joel Dubowy"
+
+import datetime
+import json
+import os
+import threading
+import time
+import zipfile
+
+from pytest import raises
+
+from bluesky import io
+from bluesky.config import Config
+from bluesky.dispersers.dispersioninput import DispersionInput
+from bluesky.dispersers.vsmoke.vsmoke import (
+    VSMOKEDispersion, VSMOKEJobRunner, GeoJSON, KMZWriter
+)
+
+PHASES = ['flaming', 'smoldering', 'residual']
+TIMEPROFILE = {
+    "2015-08-04T17:00:00": {"area_fraction": 0.5, "flaming": 0.5,
+        "smoldering": 0.5, "residual": 0.5},
+    "2015-08-04T18:00:00": {"area_fraction": 0.5, "flaming": 0.5,
+        "smoldering": 0.5, "residual": 0.5}
+}
+EMISSIONS = {p: {"PM2.5": 10.0, "CO": 20.0} for p in PHASES}
+CONSUMPTION = {p: 100.0 for p in PHASES}
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+class MockSubprocessExecutor():
+    """Writes each binary's output files, with contents identifying the
+    job, in the job's directory, and records the max number of concurrent
+    jobs
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.num_running = 0
+        self.max_running = 0
+        self.cwds = []
+
+    def __call__(self, binary, cwd=None):
+        with self.lock:
+            self.num_running += 1
+            self.max_running = max(self.max_running, self.num_running)
+            self.cwds.append(cwd)
+        try:
+            # finish jobs out of order
+            time.sleep(0.02 if cwd.endswith('hour1') else 0.001)
+            if binary == 'vsmkgs':
+                with open(os.path.join(cwd, 'vsmkgs.ipt')) as f:
+                    d = float(f.readlines()[1].split()[2])
+                with open(os.path.join(cwd, 'vsmkgs.iso'), 'w') as f:
+                    for i in range(5):
+                        f.write("{} {} {}\n".format(i, d, i * 100))
+                        f.write("{} {}\n".format(d * 2, i * 200))
+                        f.write("{} {}\n".format(d * 3, i * 300))
+                        f.write("*\n")
+                with open(os.path.join(cwd, 'vsmkgs.opt'), 'w') as f:
+                    f.write(cwd)
+            else:
+                with open(os.path.join(cwd, 'VSMOKE.OUT'), 'w') as f:
+                    f.write(cwd)
+        finally:
+            with self.lock:
+                self.num_running -= 1
+
+
+class TestVSMOKEDispersionRun():
+
+    def _run(self, tmpdir, monkeypatch, num_workers):
+        Config().set(num_workers, 'dispersion', 'vsmoke', 'NUM_WORKERS')
+        mock_execute = MockSubprocessExecutor()
+        monkeypatch.setattr(io.SubprocessExecutor, 'execute',
+            lambda self, binary, cwd=None: mock_execute(binary, cwd=cwd))
+
+        dispersion_input = DispersionInput(datetime.datetime(2015, 8, 5, 0),
+            2, ('PM2.5', 'CO'), PHASES, {}, dict({p: 0.0 for p in PHASES},
+            area_fraction=0.0))
+        for i in range(3):
+            dispersion_input.add_location('fire{}'.format(i), 0,
+                {"vsmoke": {"ws": 5, "wd": 90}}, "2015-08-04T17:00:00",
+                "2015-08-04T19:00:00", 100.0 * (i + 1), 45.0 + i, -120.0, -7,
+                {}, TIMEPROFILE, EMISSIONS, CONSUMPTION, 1000000.0)
+
+        output_dir = str(tmpdir.mkdir('output-{}'.format(num_workers)))
+        wdir = str(tmpdir.mkdir('working-{}'.format(num_workers)))
+        d = VSMOKEDispersion({})
+        d._model_start = datetime.datetime(2015, 8, 5, 0)
+        d._num_hours = 2
+        d._run_output_dir = output_dir
+        d._dispersion_input = dispersion_input
+        d._fires = dispersion_input.fires()
+        r = d._run(wdir)
+
+        outputs = {}
+        for f in sorted(os.listdir(output_dir)):
+            if f.endswith('.kmz'):
+                with zipfile.ZipFile(os.path.join(output_dir, f)) as z:
+                    outputs[f] = {n: z.read(n) for n in z.namelist()}
+            else:
+                with open(os.path.join(output_dir, f)) as fh:
+                    # archived output files contain the job dir, which
+                    # differs between runs
+                    outputs[f] = fh.read().replace(wdir, '')
+        return r, outputs, mock_execute, wdir
+
+    def test_parallel_same_as_sequential(self, tmpdir, monkeypatch, reset_config):
+        r1, outputs1, mock1, wdir1 = self._run(tmpdir, monkeypatch, 1)
+        r4, outputs4, mock4, wdir4 = self._run(tmpdir, monkeypatch, 4)
+
+        assert mock1.max_running == 1
+        assert 1 < mock4.max_running <= 4
+        assert len(mock4.cwds) == 3 * 3
+
+        assert sorted(outputs1) == sorted(outputs4) == [
+            'VSMOKE_fire0-0.IPT', 'VSMOKE_fire0-0.OUT',
+            'VSMOKE_fire1-0.IPT', 'VSMOKE_fire1-0.OUT',
+            'VSMOKE_fire2-0.IPT', 'VSMOKE_fire2-0.OUT',
+            'smoke_dispersion.json', 'smoke_dispersion.kmz',
+        ] + sorted(['vsmkgs_fire{}-0_hour{}.{}'.format(i, h, e)
+            for i in range(3) for h in (1, 2) for e in ('ipt', 'iso', 'opt')])
+        assert outputs1 == outputs4
+
+        geo_json = json.loads(outputs1['smoke_dispersion.json'])
+        assert [f['fire_id'] for f in geo_json['fires']] == [
+            'fire0-0', 'fire1-0', 'fire2-0']
+        assert len(outputs1['smoke_dispersion.kmz']) == 3 * 2 + 2
+
+        # each job ran in its own scratch dir, and input and output files
+        # were moved out of it, and it was removed
+        assert len(set(mock4.cwds)) == len(mock4.cwds)
+        for cwd in mock4.cwds:
+            assert os.path.dirname(os.path.dirname(cwd)) == wdir4
+            assert not os.path.exists(cwd)
+        for wdir in (wdir1, wdir4):
+            assert not [f for f in os.listdir(wdir) if f.startswith('fire-')]
+
+
+class TestVSMOKEJobRunner():
+
+    def test_results_in_submitted_order(self, reset_config):
+        def job(i):
+            time.sleep(0.001 * (5 - i))
+            return i
+
+        with VSMOKEJobRunner(3) as runner:
+            for i in range(5):
+                runner.submit(job, i)
+            assert list(runner.completed(wait=True)) == list(range(5))
+            assert list(runner.completed(wait=True)) == []
+
+    def test_failure(self, reset_config):
+        def job(i):
+            if i == 1:
+                raise RuntimeError("job 1 failed")
+            return i
+
+        # with one worker, jobs are run, and fail, as they're submitted
+        for num_workers, expected in ((None, []), (1, []), (3, [0])):
+            results = []
+            with raises(RuntimeError):
+                with VSMOKEJobRunner(num_workers) as runner:
+                    for i in range(3):
+                        runner.submit(job, i)
+                    for r in runner.completed(wait=True):
+                        results.append(r)
+            assert results == expected
+
+
+class TestGeoJSON():
+
+    def test_written_incrementally(self, tmpdir):
+        filename = str(tmpdir.join('smoke_dispersion.json'))
+        geo_json = GeoJSON(filename)
+        pts = [(1.0, 2.0), (3.0, 4.0), (5.0, 6.0)]
+        geo_json.add_linestring('a', 'Moderate', 'ff00ffff', 0, list(pts), -7, 1.0)
+        geo_json.add_linestring('a', 'Moderate', 'ff00ffff', 1, list(pts), -7, 2.0)
+        with open(filename) as f:
+            assert f.read() == '{"fires": ['
+
+        # fire 'a' is written once a ring for another fire is added
+        geo_json.add_linestring('b', 'Moderate', 'ff00ffff', 0, list(pts), -7, 3.0)
+        assert list(geo_json.plume_rings) == ['b']
+        with open(filename) as f:
+            partial = f.read()
+        assert partial.startswith('{"fires": [{"fire_id": "a"')
+
+        geo_json.close()
+        with open(filename) as f:
+            d = json.loads(f.read())
+        assert [(f['fire_id'], f['max_pm25_hour'], len(f['geo_json']['features']))
+            for f in d['fires']] == [('a', 1, 2), ('b', 0, 1)]
+        assert d['fires'][0]['geo_json']['features'][0]['geometry'][
+            'coordinates'] == [list(p) for p in pts + pts[:1]]
+
+    def test_no_fires(self, tmpdir):
+        filename = str(tmpdir.join('smoke_dispersion.json'))
+        GeoJSON(filename).close()
+        with open(filename) as f:
+            assert json.loads(f.read()) == {"fires": []}
+
+
+def _read_kmz(filename):
+    """Returns list of (name, contents) of the files in the KMZ file, in
+    the order in which they're stored
+    """
+    with zipfile.ZipFile(filename) as z:
+        infos = sorted(z.infolist(), key=lambda i: i.header_offset)
+        return [(i.filename, z.read(i.filename)) for i in infos]
+
+
+class TestKMZWriter():
+
+    def _write_kml(self, tmpdir, name):
+        kml = str(tmpdir.join(name))
+        with open(kml, 'w') as f:
+            f.write(kml)
+        return kml
+
+    def test_same_as_baseline(self, tmpdir):
+        legend = self._write_kml(tmpdir, 'legend.png')
+        kmz_filename = str(tmpdir.join('smoke_dispersion.kmz'))
+        kmz = KMZWriter(kmz_filename, str(tmpdir.join('doc.kml')), 'Title',
+            'legend.png')
+        # data/doc.kml references the legend by name, rather than by its
+        # (temporary) path, which is what's zipped
+        kmz.legend_image = legend
+        kml_files = []
+        for fire_id, start, hours in (('a', '2015-08-04T17:00:00', 2),
+                ('b', '2015-08-04T19:00:00', 1)):
+            for hr in range(hours):
+                kml = self._write_kml(tmpdir, '{}_{}.kml'.format(fire_id, hr + 1))
+                kml_files.append(kml)
+                kmz.add_kml(kml, {'id': fire_id, 'start': start}, hr)
+        kmz.close()
+
+        # data/doc.kml was written by the original KMZAnimation, which
+        # was zipped with the fire-hour KML files and the legend, in order
+        baseline_filename = str(tmpdir.join('baseline.kmz'))
+        with zipfile.ZipFile(baseline_filename, 'w', zipfile.ZIP_DEFLATED) as z:
+            for f in [os.path.join(DATA_DIR, 'doc.kml')] + kml_files + [legend]:
+                z.write(f, os.path.basename(f))
+
+        assert _read_kmz(kmz_filename) == _read_kmz(baseline_filename)
+
+    def test_staged_kml_files(self, tmpdir):
+        legend = str(tmpdir.join('legend.png'))
+        with open(legend, 'w') as f:
+            f.write('png')
+        kmz_filename = str(tmpdir.join('smoke_dispersion.kmz'))
+        kmz = KMZWriter(kmz_filename, str(tmpdir.join('doc.kml')), 'Title',
+            legend)
+        fires = [{'id': 'a', 'start': '2015-08-04T17:00:00'},
+            {'id': 'b', 'start': '2015-08-04T19:00:00'}]
+        for fire in fires:
+            for hr in range(2):
+                kml = str(tmpdir.join('{}_{}.kml'.format(fire['id'], hr + 1)))
+                with open(kml, 'w') as f:
+                    f.write(kml)
+                kmz.add_kml(kml, fire, hr)
+        # only the last fire's links are held in memory
+        assert kmz.animation.fire_id == 'b'
+        assert len(kmz.animation.links) == 2
+        kmz.add_kml(str(tmpdir.join('missing.kml')), fires[1], 2)
+        kmz.close()
+
+        kmz_files = _read_kmz(kmz_filename)
+        # doc.kml is stored, and listed, first
+        assert [f for f, c in kmz_files] == ['doc.kml', 'a_1.kml', 'a_2.kml',
+            'b_1.kml', 'b_2.kml', 'legend.png']
+        with zipfile.ZipFile(kmz_filename) as z:
+            assert z.namelist() == [f for f, c in kmz_files]
+        doc_kml = kmz_files[0][1].decode()
+        assert doc_kml.count('<Folder>') == 2
+        assert doc_kml.count('<NetworkLink>') == 5
+        assert '<begin>2015-08-04T17:00:00</begin>' in doc_kml
+        assert doc_kml.index('a_2.kml') < doc_kml.index('b_1.kml')
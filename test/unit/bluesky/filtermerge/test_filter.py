@@ -913,3 +913,64 @@ class TestFiresManagerFilterFiresByTime():
         assert self.fm.num_fires == 0
         assert self.fm.num_locations == 0
         assert expected == sorted(self.fm.fires, key=lambda e: int(e.id))
+
+
+class TestFiresManagerFilterFiresByMultipleCriteria():
+
+    def setup_method(self):
+        self.fm = fires.FiresManager()
+        self.init_fires = [
+            fires.Fire({'id': '1', 'activity': [
+                {'active_areas': [
+                    {'start': '2019-01-01T17:00:00','end': "2019-01-02T17:00:00","utc_offset": "-07:00",
+                     'specified_points':[{'lat': 40.0, 'lng': -80.0, "area": 90.0}]},
+                    {'start': '2019-01-02T17:00:00','end': "2019-01-03T17:00:00","utc_offset": "-07:00",
+                     'specified_points':[{'lat': 40.1, 'lng': -80.1, "area": 10.0}]}
+                ]},
+                {'active_areas': [
+                    # no location information, which would fail the area
+                    # and location filters
+                    {'start': '2019-01-03T17:00:00','end': "2019-01-04T17:00:00","utc_offset": "-07:00"}
+                ]}
+            ]}),
+            fires.Fire({'id': '2', 'activity': [
+                {'active_areas': [
+                    {'start': '2019-01-02T20:00:00','end': "2019-01-03T20:00:00","utc_offset": "-04:00",
+                     'specified_points':[{'lat': 30.0, 'lng': -90.0, "area": 90.0}]}
+                ]}
+            ]})
+        ]
+        self.fm.fires = self.init_fires
+
+    def test_all_filters_applied(self, reset_config):
+        Config().set({"max": 50.0}, 'filter', 'area')
+        Config().set({"end": "2019-01-04T00:00:00"}, 'filter', 'time')
+        Config().set({"ne": {"lat": 45.0, "lng": -70.0},
+            "sw": {"lat": 35.0, "lng": -85.0}},
+            'filter', 'location', 'boundary')
+        Config().set(True, 'filter', 'skip_failures')
+
+        expected = [
+            fires.Fire({'id': '1', 'activity': [
+                {'active_areas': [
+                    {'start': '2019-01-02T17:00:00','end': "2019-01-03T17:00:00","utc_offset": "-07:00",
+                     'specified_points':[{'lat': 40.1, 'lng': -80.1, "area": 10.0}]}
+                ]}
+            ]})
+        ]
+        self.fm.filter_fires()
+        assert self.fm.num_fires == 1
+        assert expected == self.fm.fires
+        assert [f.id for f in self.fm.filtered_fires] == ['2']
+
+    def test_failure_leaves_fires_unmodified(self, reset_config):
+        # fire 1's third active area has no location information
+        Config().set({"max": 50.0}, 'filter', 'area')
+        Config().set(False, 'filter', 'skip_failures')
+
+        with raises(FireActivityFilter.FilterError) as e_info:
+            self.fm.filter_fires()
+        assert e_info.value.args[0].index(FireActivityFilter.MISSING_ACTIVITY_AREA_MSG) > 0
+        assert self.fm.num_fires == 2
+        assert self.init_fires == sorted(self.fm.fires, key=lambda e: int(e.id))
+        assert [len(f.active_areas) for f in self.fm.fires] == [3, 1]
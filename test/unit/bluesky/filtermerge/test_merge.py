@@ -362,3 +362,42 @@ class TestFiresManagerMergeFires():
         ]
         actual = sorted(fm.fires, key=lambda e: int(e.id))
         assert expected == actual
+
+    def test_merge_many_with_failure_skipped(self, reset_config):
+        fm = fires.FiresManager()
+        Config().set(True, 'merge', 'skip_failures')
+        fire_list = [
+            fires.Fire({
+                'id': '1',
+                "type": "rx" if i != 2 else "wildfire",
+                "activity": [
+                    {
+                        "active_areas": [
+                            {
+                                "start": "2014-05-{}T17:00:00".format(10 + i),
+                                "end": "2014-05-{}T17:00:00".format(11 + i),
+                                'specified_points': [
+                                    {'area': i, 'lat': 45.0, 'lng': -120.0}
+                                ]
+                            }
+                        ]
+                    }
+                ]
+            }) for i in range(5)
+        ]
+        fm.fires = fire_list
+        assert fm.num_fires == 5
+        fm.merge_fires()
+        # the third fire's type doesn't match
+        assert fm.num_fires == 2
+        assert fm.fires[0]['activity'][0]['active_areas'][0]['specified_points'][0]['area'] == 2
+        combined = fm.fires[1]
+        assert [a['active_areas'][0]['specified_points'][0]['area']
+            for a in combined['activity']] == [0, 1, 3, 4]
+        assert combined.start.day == 10
+        assert combined.end.day == 15
+
+        # the merged fires' activity was copied
+        combined['activity'][1]['active_areas'][0]['specified_points'][0]['area'] = 100
+        assert [f['activity'][0]['active_areas'][0]['specified_points'][0]['area']
+            for f in fire_list] == [0, 1, 2, 3, 4]
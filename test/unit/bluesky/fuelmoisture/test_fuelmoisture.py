@@ -234,3 +234,57 @@ class TestFillInDefaults():
 
         assert loc['fuelmoisture'] == expected
 
+    def test_partial_hour_window_and_multiple_locations(self):
+        f = fires.Fire({
+            "type": "wildfire",
+            "activity": [
+                {
+                    "active_areas": [
+                        {
+                            "start": "2018-11-07T17:30:00",
+                            "end": "2018-11-07T19:45:00",
+                            "ecoregion": "western",
+                            "utc_offset": "-07:00",
+                            "specified_points": [
+                                {
+                                    "area": 500,
+                                    "lng": -121.73434,
+                                    "lat": 46.7905,
+                                    "fuelmoisture": {
+                                        "2018-11-07T18:30:00": {},
+                                        "2018-11-07T19:30:00": {
+                                            "1_hr": 5.2,
+                                            "10_hr": None
+                                        }
+                                    }
+                                },
+                                {
+                                    "area": 200,
+                                    "lng": -121.73,
+                                    "lat": 46.79
+                                }
+                            ]
+                        }
+                    ]
+                }
+            ]
+        })
+
+        aa = f['activity'][0]['active_areas'][0]
+        loc1, loc2 = aa['specified_points']
+        fill_in_defaults(f, aa, loc1)
+        fill_in_defaults(f, aa, loc2)
+
+        assert loc1['fuelmoisture'] == {
+            "2018-11-07T18:30:00": MOISTURE_PROFILES['dry'],
+            "2018-11-07T19:30:00": dict(MOISTURE_PROFILES['dry'], **{'1_hr': 5.2}),
+            "2018-11-07T17:30:00": MOISTURE_PROFILES['dry']
+        }
+        assert list(loc2['fuelmoisture']) == [
+            "2018-11-07T17:30:00",
+            "2018-11-07T18:30:00",
+            "2018-11-07T19:30:00"
+        ]
+        # Hours without data share the defaults profile
+        assert all([v is MOISTURE_PROFILES['dry']
+            for v in loc2['fuelmoisture'].values()])
@@ -0,0 +1,117 @@
+"""Unit tests for bluesky.fuelmoisture.nfdrs"""
+
+__author__ = "Joel Dubowy"
+
+import itertools
+import random
+
+from pytest import raises
+
+from bluesky.fuelmoisture.nfdrs import (
+    NfdrsFuelMoisture, fm_1_10, fm_1_10_batch
+)
+
+
+class TestFm110Batch():
+
+    def _check(self, args, units='SI'):
+        fm_1hr, fm_10hr = fm_1_10_batch(
+            [a['temp'] for a in args], [a['rh'] for a in args],
+            [a['rain'] for a in args], [a['sow'] for a in args], units=units)
+        assert fm_1hr.shape == fm_10hr.shape == (len(args),)
+        expected = [fm_1_10(units=units, **a) for a in args]
+        # exact equality
+        assert list(zip(fm_1hr.tolist(), fm_10hr.tolist())) == expected
+
+    def test_grid(self):
+        # covers all three emc equations, both rh forms, and rain
+        args = [dict(temp=t, rh=r, rain=p, sow=s) for t, r, p, s in
+            itertools.product([-10, 0, 20, 38.5], [0.05, 0.5, 5, 10, 30, 50, 51, 99],
+                [0, 2.54, 2.55, 10], [0, 1, 2, 3, 4])]
+        self._check(args)
+        self._check(args, units='US')
+
+    def test_random(self):
+        rand = random.Random(1)
+        args = [dict(temp=rand.uniform(-20, 45), rh=rand.uniform(0, 100),
+            rain=rand.choice([0, rand.uniform(0, 5)]), sow=rand.randint(0, 3))
+            for i in range(200000)]
+        self._check(args)
+
+    def test_rh_squared(self):
+        # numpy's squares of these (corrected) rh values differ from
+        # python's rh**2 in the last ULP, as do the resulting fuel moistures
+        args = [
+            dict(temp=37.16199997674089, rh=93.66524183592784, rain=0, sow=2),
+            dict(temp=22.012303161992918, rh=95.86395113155753, rain=0, sow=0)
+        ]
+        self._check(args)
+        for a in args:
+            fm_1hr, fm_10hr = fm_1_10_batch(**a)
+            assert (float(fm_1hr), float(fm_10hr)) == fm_1_10(**a)
+
+    def test_broadcast(self):
+        fm_1hr, fm_10hr = fm_1_10_batch([[10, 20], [30, 40]], 30, 0, 1)
+        assert fm_1hr.shape == (2, 2)
+        assert fm_10hr[1][0] == fm_1_10(temp=30, rh=30, rain=0, sow=1)[1]
+
+    def test_none(self):
+        # fm_1_10 raises TypeError for None values, and so does
+        # fm_1_10_batch, rather than returning NaN
+        with raises(TypeError):
+            fm_1_10(temp=None)
+        with raises(TypeError):
+            fm_1_10_batch([10, None], 30, 0, 1)
+        with raises(TypeError):
+            fm_1_10_batch(10, [30, 40], None, 1)
+
+
+class TestNfdrsFuelMoisture():
+
+    def test_set_fuel_moisture(self):
+        location = {
+            "fuelmoisture": {"2019-07-26T17:00:00": {"duff": 40}},
+            "localmet": {
+                "2019-07-26T17:00:00": {"TEMP": [9.3, 10.0], "RELH": [71.1],
+                    "TCLD": [60], "TPP1": [0.0]},
+                "2019-07-26T18:00:00": {"TEMP": [9.1], "RELH": [8.2],
+                    "TPP3": [0.5]},
+                "2019-07-26T19:00:00": {"RELH": [40.0]}
+            }
+        }
+        NfdrsFuelMoisture().set_fuel_moisture({}, location)
+
+        expected = [
+            fm_1_10(temp=9.3, rh=71.1, sow=2, rain=0.0),
+            fm_1_10(temp=9.1, rh=8.2, rain=0.004),
+            fm_1_10(rh=40.0)
+        ]
+        assert location['fuelmoisture'] == {
+            "2019-07-26T17:00:00": {"duff": 40, "1_hr": expected[0][0], "10_hr": expected[0][1]},
+            "2019-07-26T18:00:00": {"1_hr": expected[1][0], "10_hr": expected[1][1]},
+            "2019-07-26T19:00:00": {"1_hr": expected[2][0], "10_hr": expected[2][1]}
+        }
+
+    def test_none_met_values(self):
+        # Met values that are None are missing, and defaults are used;
+        # None in a list of values is invalid
+        location = {
+            "fuelmoisture": {},
+            "localmet": {
+                "2019-07-26T17:00:00": {"TEMP": None, "RELH": [71.1]}
+            }
+        }
+        NfdrsFuelMoisture().set_fuel_moisture({}, location)
+        expected = fm_1_10(rh=71.1)
+        assert location['fuelmoisture'] == {
+            "2019-07-26T17:00:00": {"1_hr": expected[0], "10_hr": expected[1]}
+        }
+
+        location['localmet']["2019-07-26T17:00:00"]["TEMP"] = [None]
+        with raises(TypeError):
+            NfdrsFuelMoisture().set_fuel_moisture({}, location)
+
+    def test_no_localmet(self):
+        location = {"fuelmoisture": {}}
+        NfdrsFuelMoisture().set_fuel_moisture({}, location)
+        assert location['fuelmoisture'] == {}
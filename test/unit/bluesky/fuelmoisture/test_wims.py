@@ -0,0 +1,184 @@
+"""Unit tests for bluesky.fuelmoisture.wims"""
+
+__author__ = "Joel Dubowy"
+
+import datetime
+import os
+import socket
+import urllib.request
+
+import numpy
+from numpy.testing import assert_allclose
+
+from bluesky.config import Config
+from bluesky.fuelmoisture import wims
+from bluesky.models import fires
+
+HEADER = [
+    "  Fire Danger Rating Observations\n",
+    "\n",
+    "  Stn  Name               Elev  Lat   Long  Mdl  ...\n"
+]
+
+def _line(station_id, lat, lng, hun, thou, ten):
+    # lat, lng, and fm values in BSF's fixed width columns
+    return "{:<6}{:<24}{:>5}{:>6}{:<46}{:>6}{:>6}{:>6}\n".format(
+        station_id, "STATION", lat, lng, "", hun, thou, ten)
+
+STATIONS = [
+    _line('100101', 47.5, 122.3, 15, 20, 10),
+    _line('100102', 46.0, 122.0, 17, 22, 12),
+    _line('100103', 35.0, 110.0, 9, 14, -99),
+    _line('100104', '', 110.0, 9, 14, 5)
+]
+
+def _write(data_dir, date, lines):
+    with open(os.path.join(data_dir, date.strftime('%Y%m%d_fdr_obs.dat')), 'w') as f:
+        f.writelines(HEADER + lines)
+
+
+class TestParseWimsData():
+
+    def test_parse(self):
+        stations = wims.parse_wims_data(HEADER + STATIONS)
+        assert stations.station_ids == ['100101', '100102', '100103']
+        assert_allclose(numpy.degrees(stations._lat), [47.5, 46.0, 35.0])
+        assert_allclose(numpy.degrees(stations._lng), [-122.3, -122.0, -110.0])
+        assert_allclose(stations.fuel_moisture['100_hr'], [15, 17, 9])
+        assert_allclose(stations.fuel_moisture['1000_hr'], [20, 22, 14])
+        assert_allclose(stations.fuel_moisture['10_hr'], [10, 12, numpy.nan])
+
+    def test_bytes(self):
+        stations = wims.parse_wims_data([l.encode() for l in HEADER + STATIONS])
+        assert len(stations) == 3
+
+
+class TestWimsStations():
+
+    def setup_method(self):
+        self.stations = wims.parse_wims_data(STATIONS)
+
+    def test_nearest(self):
+        indices, distances = self.stations.nearest(
+            [47.5, 46.1, 36.0], [-122.3, -122.0, -111.0], num_stations=2)
+        assert indices.tolist() == [[0, 1], [1, 0], [2, 1]]
+        assert distances[0][0] == 0.0
+        assert_allclose(distances[1][0], 11.1, atol=0.1)
+        assert (numpy.diff(distances, axis=1) >= 0).all()
+
+    def test_nearest_chunked(self, monkeypatch):
+        lats = numpy.linspace(30, 50, 101)
+        lngs = numpy.linspace(-125, -105, 101)
+        expected = self.stations.nearest(lats, lngs, num_stations=3)
+        monkeypatch.setattr(wims, 'MAX_NUM_DISTANCES', 7)
+        actual = self.stations.nearest(lats, lngs, num_stations=3)
+        assert (actual[0] == expected[0]).all()
+        assert (actual[1] == expected[1]).all()
+
+    def test_interpolate_nearest(self):
+        fm = self.stations.interpolate([46.1, 36.0, 20.0],
+            [-122.0, -111.0, -100.0], max_distance_km=300)
+        assert_allclose(fm['100_hr'], [17, 9, numpy.nan])
+        assert_allclose(fm['10_hr'], [12, numpy.nan, numpy.nan])
+
+    def test_interpolate_weighted(self):
+        fm = self.stations.interpolate([47.5, 46.75], [-122.3, -122.15],
+            num_stations=3, max_distance_km=300)
+        # the 3rd station is too far away
+        indices, distances = self.stations.nearest([46.75], [-122.15],
+            num_stations=2)
+        w = 1 / distances[0] ** 2
+        values = [[15, 17][i] for i in indices[0]]
+        assert fm['100_hr'][0] == 15
+        assert_allclose(fm['100_hr'][1], (w * values).sum() / w.sum())
+        assert 15 < fm['100_hr'][1] < 17
+
+class TestWimsDataCache():
+
+    def test_download_timeout(self, reset_config, tmpdir, monkeypatch):
+        Config().set('http://wims/%Y%m%d.dat', 'fuelmoisture', 'wims', 'url')
+        Config().set(str(tmpdir), 'fuelmoisture', 'wims', 'data_dir')
+        Config().set(5, 'fuelmoisture', 'wims', 'download_timeout')
+        requests = []
+        def urlopen(url, timeout=None):
+            requests.append((url, timeout))
+            raise socket.timeout("timed out")
+        monkeypatch.setattr(urllib.request, 'urlopen', urlopen)
+
+        fm = wims.WimsFuelMoisture()
+        assert fm._cache.get(datetime.date(2019, 7, 26)) is None
+        assert requests == [
+            ('http://wims/20190726.dat', 5),
+            ('http://wims/20190726.txt', 5)
+        ]
+
+
+class TestWimsFuelMoisture():
+
+    def _fire(self, lat, lng):
+        return fires.Fire({"activity": [{"active_areas": [{
+            "start": "2019-07-26T22:00:00", "end": "2019-07-27T02:00:00",
+            "specified_points": [{"lat": lat, "lng": lng, "area": 100}]
+        }]}]})
+
+    def test_set_fuel_moisture(self, reset_config, tmpdir):
+        data_dir = str(tmpdir)
+        _write(data_dir, datetime.date(2019, 7, 26), STATIONS)
+        _write(data_dir, datetime.date(2019, 7, 27), STATIONS[:1])
+        Config().set(None, 'fuelmoisture', 'wims', 'url')
+        Config().set(data_dir, 'fuelmoisture', 'wims', 'data_dir')
+
+        fires_ = [self._fire(46.1, -122.0), self._fire(20.0, -100.0)]
+        fm = wims.WimsFuelMoisture()
+        fm.prepare(fires_)
+
+        # data files aren't read again
+        os.remove(os.path.join(data_dir, '20190726_fdr_obs.dat'))
+
+        aa = fires_[0].active_areas[0]
+        loc = aa.locations[0]
+        loc['fuelmoisture'] = {"2019-07-26T22:00:00": {"1_hr": 5}}
+        fm.set_fuel_moisture(aa, loc)
+        assert loc['fuelmoisture'] == {
+            "2019-07-26T22:00:00": {"1_hr": 5, "10_hr": 12.0, "100_hr": 17.0, "1000_hr": 22.0},
+            "2019-07-26T23:00:00": {"10_hr": 12.0, "100_hr": 17.0, "1000_hr": 22.0},
+            "2019-07-27T00:00:00": {"10_hr": 10.0, "100_hr": 15.0, "1000_hr": 20.0},
+            "2019-07-27T01:00:00": {"10_hr": 10.0, "100_hr": 15.0, "1000_hr": 20.0}
+        }
+
+        # no stations within max distance
+        aa = fires_[1].active_areas[0]
+        loc = aa.locations[0]
+        loc['fuelmoisture'] = {}
+        fm.set_fuel_moisture(aa, loc)
+        assert loc['fuelmoisture'] == {}
+
+    def test_prepare_invalid_active_area(self, reset_config, tmpdir, monkeypatch):
+        data_dir = str(tmpdir)
+        _write(data_dir, datetime.date(2019, 7, 26), STATIONS)
+        Config().set(None, 'fuelmoisture', 'wims', 'url')
+        Config().set(data_dir, 'fuelmoisture', 'wims', 'data_dir')
+
+        invalid = self._fire(47.5, -122.3)
+        invalid['activity'][0]['active_areas'][0].pop('start')
+        fires_ = [invalid, self._fire(46.1, -122.0)]
+        fm = wims.WimsFuelMoisture()
+        queries = []
+        monkeypatch.setattr(fm, '_query',
+            lambda date, latlngs: queries.append((date, sorted(latlngs))))
+        # the invalid active area doesn't prevent other fires' lookups
+        fm.prepare(fires_)
+        assert queries == [
+            (datetime.date(2019, 7, 26), [(46.1, -122.0)]),
+            (datetime.date(2019, 7, 27), [(46.1, -122.0)])
+        ]
+
+    def test_no_data(self, reset_config, tmpdir):
+        Config().set(None, 'fuelmoisture', 'wims', 'url')
+        Config().set(str(tmpdir), 'fuelmoisture', 'wims', 'data_dir')
+        fire = self._fire(46.1, -122.0)
+        aa = fire.active_areas[0]
+        loc = aa.locations[0]
+        loc['fuelmoisture'] = {}
+        wims.WimsFuelMoisture().set_fuel_moisture(aa, loc)
+        assert loc['fuelmoisture'] == {}
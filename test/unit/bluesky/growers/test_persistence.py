@@ -12,6 +12,7 @@ from bluesky.config import Config
 from bluesky.exceptions import BlueSkyConfigurationError
 from bluesky.growers import persistence
 from bluesky.models.fires import Fire
+from bluesky.models.timeprofile import HourlyTimeProfile
 
 # TODO: moke Fire class
 # TODO: MockFiresManager was copied from test_datautils.py.
@@ -1148,3 +1149,116 @@ class TestPersistenceWfWtihDailyPercentages():
         assert fm.fires[0]['activity'][1] == expected[0]['activity'][1]
         assert fm.fires[0]['activity'][2] == expected[0]['activity'][2]
         assert fm.fires == expected
+
+
+class TestPersistenceWfCopyOnWrite():
+
+    FIRE = {
+        "id": "abc123",
+        "type": "wildfire",
+        "activity": [
+            {
+                "active_areas": [
+                    {
+                        "start": "2016-08-01T08:00:00",
+                        "end": "2016-08-01T10:00:00",
+                        "utc_offset": "-05:00",
+                        "timeprofile": {
+                            "2016-08-01T08:00:00": {"area_fraction": 0.5},
+                            "2016-08-01T09:00:00": {"area_fraction": 0.5}
+                        },
+                        "specified_points": [
+                            {
+                                'lat': 40,'lng':-115,'area': 20,
+                                "geometry": {"type": "Point", "coordinates": [-115, 40]},
+                                "plumerise": {
+                                    "2016-08-01T08:00:00": {"smolder_fraction": 0.1},
+                                    "2016-08-01T09:00:00": {"smolder_fraction": 0.1}
+                                },
+                                "fuelbeds": [
+                                    {
+                                        "fccs_id": "52", "pct": 100.0,
+                                        "emissions": {"total": {"PM2.5": [10]}}
+                                    }
+                                ]
+                            }
+                        ]
+                    }
+                ]
+            }
+        ]
+    }
+
+    def _grow(self, copy_on_write):
+        Config().set({
+            "date_to_persist": datetime.date(2016,8,1),
+            "daily_percentages": [100, 50],
+            'copy_on_write': copy_on_write
+        }, "growth", "persistence")
+        fm = MockFiresManager([copy.deepcopy(self.FIRE)])
+        persistence.Grower(fm).grow()
+        return fm.fires[0]
+
+    def test_same_output(self, reset_config):
+        expected = self._grow(False)
+        fire = self._grow(True)
+        assert fire == expected
+        assert len(fire['activity']) == 3
+
+        aa = fire['activity'][2]['active_areas'][0]
+        assert aa['start'] == datetime.datetime(2016,8,3,8,0,0)
+        assert set(aa['timeprofile']) == set(["2016-08-03T08:00:00",
+            "2016-08-03T09:00:00"])
+        loc = aa['specified_points'][0]
+        assert loc['area'] == 10
+        assert set(loc['plumerise']) == set(["2016-08-03T08:00:00",
+            "2016-08-03T09:00:00"])
+        assert loc['fuelbeds'][0]['emissions'] == {"total": {"PM2.5": [5.0]}}
+
+    def test_unmodified_data_shared(self, reset_config):
+        fire = self._grow(True)
+        locs = [a['active_areas'][0]['specified_points'][0]
+            for a in fire['activity']]
+        tps = [a['active_areas'][0]['timeprofile'] for a in fire['activity']]
+
+        # containers that persistence modifies are copied
+        assert locs[0] is not locs[1] and locs[0] is not locs[2]
+        assert tps[0] is not tps[1]
+        assert locs[0]['area'] == 20
+
+        # everything else is shared, except for reduced data
+        assert locs[1]['geometry'] is locs[0]['geometry']
+        assert locs[2]['geometry'] is locs[0]['geometry']
+        assert (tps[1]["2016-08-02T08:00:00"]
+            is tps[0]["2016-08-01T08:00:00"])
+        assert locs[1]['fuelbeds'] is locs[0]['fuelbeds']
+        assert locs[2]['fuelbeds'] is not locs[0]['fuelbeds']
+        assert locs[0]['fuelbeds'][0]['emissions'] == {"total": {"PM2.5": [10]}}
+
+    def test_not_shared_by_default(self, reset_config):
+        fire = self._grow(False)
+        locs = [a['active_areas'][0]['specified_points'][0]
+            for a in fire['activity']]
+        assert locs[1]['geometry'] is not locs[0]['geometry']
+        assert locs[1]['fuelbeds'] is not locs[0]['fuelbeds']
+
+    def test_columnar_timeprofile(self, reset_config):
+        fire = copy.deepcopy(self.FIRE)
+        aa = fire['activity'][0]['active_areas'][0]
+        aa['timeprofile'] = HourlyTimeProfile.from_dict(aa['timeprofile'])
+        Config().set({
+            "date_to_persist": datetime.date(2016,8,1),
+            "days_to_persist": 1,
+            'copy_on_write': True
+        }, "growth", "persistence")
+        fm = MockFiresManager([fire])
+        persistence.Grower(fm).grow()
+
+        tp = fm.fires[0]['activity'][1]['active_areas'][0]['timeprofile']
+        assert isinstance(tp, HourlyTimeProfile)
+        assert tp == {
+            "2016-08-02T08:00:00": {"area_fraction": 0.5},
+            "2016-08-02T09:00:00": {"area_fraction": 0.5}
+        }
+        assert (fm.fires[0]['activity'][0]['active_areas'][0]['timeprofile']
+            .start == datetime.datetime(2016,8,1,8))
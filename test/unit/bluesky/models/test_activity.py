@@ -2,6 +2,8 @@
 
 __author__ = "Joel Dubowy"
 
+import datetime
+
 from pytest import raises
 
 from bluesky.models import activity
@@ -409,6 +411,40 @@ class TestActiveAreaTotalArea():
 ##
 
 
+class TestActiveAreaStartEnd():
+
+    def test_not_defined(self):
+        aa = activity.ActiveArea({})
+        assert aa.start == None
+        assert aa.end == None
+        assert aa.start_utc == None
+        assert aa.end_utc == None
+
+    def test_defined(self):
+        aa = activity.ActiveArea({
+            "start": "2014-05-27T17:00:00",
+            "end": "2014-05-28T17:00:00",
+            "utc_offset": "-07:00"
+        })
+        assert aa.start == datetime.datetime(2014,5,27,17)
+        assert aa.end == datetime.datetime(2014,5,28,17)
+        assert aa.start_utc == datetime.datetime(2014,5,28,0)
+        assert aa.end_utc == datetime.datetime(2014,5,29,0)
+
+    def test_reparsed_when_modified(self):
+        aa = activity.ActiveArea({
+            "start": "2014-05-27T17:00:00",
+            "end": "2014-05-28T17:00:00"
+        })
+        assert aa.start == datetime.datetime(2014,5,27,17)
+        aa['start'] = "2014-05-26T17:00:00"
+        assert aa.start == datetime.datetime(2014,5,26,17)
+        aa['end'] = datetime.datetime(2014,5,29,17)
+        assert aa.end == datetime.datetime(2014,5,29,17)
+        aa.pop('end')
+        assert aa.end == None
+
+
 class TestActivityCollectionActiveAreas():
 
     def test_no_active_areas(self):
@@ -232,6 +232,21 @@ class TestFire():
         assert datetime.datetime(2014,5,28,0,0,0) == f.start_utc
         assert datetime.datetime(2014,5,31,0,0,0) == f.end_utc
 
+        # modifying, adding, and removing activity windows
+        aas = f['activity'][0]['active_areas']
+        aas[1]['start'] = "2014-05-26T17:00:00"
+        assert datetime.datetime(2014,5,26,17,0,0) == f.start
+        assert datetime.datetime(2014,5,27,0,0,0) == f.start_utc
+        aas.append(activity.ActiveArea({
+            "utc_offset": '-05:00',
+            'start': "2014-05-29T17:00:00",
+            'end': "2014-05-31T17:00:00"
+        }))
+        assert datetime.datetime(2014,5,31,17,0,0) == f.end
+        assert datetime.datetime(2014,5,31,22,0,0) == f.end_utc
+        aas.pop(1)
+        assert datetime.datetime(2014,5,28,17,0,0) == f.start
+
     TEST_FIRE = fires.Fire({
         'id': '1',
         'activity': [
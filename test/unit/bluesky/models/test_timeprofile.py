@@ -0,0 +1,86 @@
+"""Unit tests for bluesky.models.timeprofile"""
+
+__author__ = "Joel Dubowy"
+
+import copy
+import datetime
+import json
+
+import numpy
+from pytest import raises
+
+from bluesky.models.fires import FireEncoder
+from bluesky.models.timeprofile import HourlyTimeProfile
+
+
+class TestHourlyTimeProfile():
+
+    HOURLY_FRACTIONS = {
+        "area_fraction": [0.5, 0.3, 0.2],
+        "flaming": [0.6, 0.3, 0.1],
+        "smoldering": [0.2, 0.4, 0.4],
+        "residual": [0.1, 0.2, 0.7]
+    }
+
+    EXPECTED = {
+        "2015-08-04T17:00:00": {"area_fraction": 0.5, "flaming": 0.6, "smoldering": 0.2, "residual": 0.1},
+        "2015-08-04T18:00:00": {"area_fraction": 0.3, "flaming": 0.3, "smoldering": 0.4, "residual": 0.2},
+        "2015-08-04T19:00:00": {"area_fraction": 0.2, "flaming": 0.1, "smoldering": 0.4, "residual": 0.7}
+    }
+
+    def setup_method(self):
+        self.tp = HourlyTimeProfile(datetime.datetime(2015,8,4,17),
+            self.HOURLY_FRACTIONS)
+
+    def test_invalid(self):
+        with raises(ValueError):
+            HourlyTimeProfile(datetime.datetime(2015,8,4,17),
+                {"flaming": [0.5, 0.5], "smoldering": [1.0]})
+
+    def test_mapping_interface(self):
+        assert len(self.tp) == 3
+        assert list(self.tp) == sorted(self.EXPECTED)
+        assert self.tp["2015-08-04T18:00:00"] == self.EXPECTED["2015-08-04T18:00:00"]
+        assert self.tp[datetime.datetime(2015,8,4,19)] == self.EXPECTED["2015-08-04T19:00:00"]
+        assert "2015-08-04T17:00:00" in self.tp
+        assert "2015-08-04T20:00:00" not in self.tp
+        assert self.tp.get("2015-08-04T20:00:00") is None
+        with raises(KeyError):
+            self.tp["2015-08-04T16:00:00"]
+        assert self.tp == self.EXPECTED
+        assert self.EXPECTED == self.tp
+        assert dict(self.tp) == self.EXPECTED
+        assert self.tp.to_dict() == self.EXPECTED
+        assert not HourlyTimeProfile(datetime.datetime(2015,8,4,17), {})
+
+    def test_columnar_access(self):
+        assert self.tp.start == datetime.datetime(2015,8,4,17)
+        assert self.tp.end == datetime.datetime(2015,8,4,20)
+        assert self.tp.hours == [datetime.datetime(2015,8,4,h)
+            for h in (17, 18, 19)]
+        assert set(self.tp.fields) == set(self.HOURLY_FRACTIONS)
+        numpy.testing.assert_array_equal(self.tp.fractions['flaming'],
+            [0.6, 0.3, 0.1])
+        with raises(ValueError):
+            self.tp.fractions['flaming'][0] = 1.0
+
+    def test_shift(self):
+        shifted = self.tp.shift(datetime.timedelta(days=1))
+        assert shifted.start == datetime.datetime(2015,8,5,17)
+        assert shifted["2015-08-05T17:00:00"] == self.EXPECTED["2015-08-04T17:00:00"]
+        assert self.tp == self.EXPECTED
+
+    def test_from_dict(self):
+        tp = HourlyTimeProfile.from_dict(self.EXPECTED)
+        assert tp.start == datetime.datetime(2015,8,4,17)
+        assert tp == self.EXPECTED
+
+        d = dict(self.EXPECTED)
+        d.pop("2015-08-04T18:00:00")
+        with raises(ValueError):
+            HourlyTimeProfile.from_dict(d)
+
+    def test_serialization(self):
+        assert json.loads(json.dumps({"timeprofile": self.tp},
+            cls=FireEncoder)) == {"timeprofile": self.EXPECTED}
+        assert copy.deepcopy(self.tp) == self.EXPECTED
@@ -6,6 +6,7 @@ import copy
 import datetime
 import os
 import tempfile
+import threading
 import uuid
 
 from pytest import raises
@@ -183,21 +184,27 @@ _PR_ARGS = {}
 _PR_KWARGS = {}
 _PR_COMPUTE_CALL_ARGS = {}
 _PR_COMPUTE_CALL_KWARGS = {}
+_PR_NUM_INSTANCES = {}
+_PR_COMPUTE_IN_OWN_THREAD = {}
 
 def get_plumerise_class(model):
 
     class MockPlumeRise():
 
         def __init__(self, *args, **kwargs):
-            global _PR_ARGS, _PR_KWARGS, _PR_COMPUTE_CALL_ARGS, _PR_COMPUTE_CALL_KWARGS
+            global _PR_ARGS, _PR_KWARGS
             _PR_ARGS[model] = args
             _PR_KWARGS[model] = kwargs
-            _PR_COMPUTE_CALL_ARGS[model] = []
-            _PR_COMPUTE_CALL_KWARGS[model] = []
+            # Worker threads each instantiate their own, so compute calls
+            # are reset in monkeypatch_plumerise_class rather than here
+            _PR_NUM_INSTANCES[model] += 1
+            self._thread_id = threading.get_ident()
 
         def compute(self, *args, **kwargs):
             _PR_COMPUTE_CALL_ARGS[model].append(args)
             _PR_COMPUTE_CALL_KWARGS[model].append(kwargs)
+            _PR_COMPUTE_IN_OWN_THREAD[model].append(
+                self._thread_id == threading.get_ident())
             return {"hours": "compute return value"}
 
     return MockPlumeRise
@@ -206,6 +213,11 @@ MockPlumeRiseSEV = get_plumerise_class('sev')
 MockPlumeRiseFEPS = get_plumerise_class('feps')
 
 def monkeypatch_plumerise_class(monkeypatch):
+    for model in ('sev', 'feps'):
+        _PR_COMPUTE_CALL_ARGS[model] = []
+        _PR_COMPUTE_CALL_KWARGS[model] = []
+        _PR_NUM_INSTANCES[model] = 0
+        _PR_COMPUTE_IN_OWN_THREAD[model] = []
     monkeypatch.setattr(sev, 'SEVPlumeRise', MockPlumeRiseSEV)
     monkeypatch.setattr(feps, 'FEPSPlumeRise', MockPlumeRiseFEPS)
 
@@ -373,6 +385,65 @@ class TestPlumeRiseRunFeps():
         }
         # TOOD: assert plumerise return value
 
+class TestPlumeRiseRunFepsParallel():
+
+    def setup_method(self):
+        self.fm = FiresManager()
+
+    def set_config(self):
+        Config().set('feps', 'plumerise', 'model')
+        Config().set(3, 'plumerise', 'num_workers')
+        Config().set(False, 'skip_failed_fires')
+
+    def test_fire_missing_location_consumption(self, reset_config, monkeypatch):
+        self.set_config()
+        monkeypatch_plumerise_class(monkeypatch)
+
+        self.fm.load({"fires": [FIRE_MISSING_CONSUMPTION]})
+        with raises(ValueError) as e_info:
+            plumerise.run(self.fm)
+        assert e_info.value.args[0] == plumerise.MISSING_CONSUMPTION_ERROR_MSG
+
+    def test_one_fire(self, reset_config, monkeypatch):
+        self.set_config()
+        monkeypatch_plumerise_class(monkeypatch)
+        monkeypatch_tempfile_mkdtemp(monkeypatch)
+
+        fire = copy.deepcopy(FIRE)
+        self.fm.load({"fires": [fire]})
+        plumerise.run(self.fm)
+
+        loc1 = fire['activity'][0]['active_areas'][0]['specified_points'][0]
+        loc2 = fire['activity'][0]['active_areas'][1]['perimeter']
+        assert 'compute return value' == loc1.pop('plumerise')
+        assert 'compute return value' == loc2.pop('plumerise')
+        assert 'feps' == loc1.pop('plumerise-model')
+        assert 'feps' == loc2.pop('plumerise-model')
+
+        # locations may be computed in any order
+        call_args = sorted(_PR_COMPUTE_CALL_ARGS['feps'],
+            key=lambda a: list(a[1].keys()))
+        assert call_args == [
+            ({"2015-01-20T17:00:00":{"bar": 2}}, {"flaming": 434}, loc2),
+            ({"2015-01-20T17:00:00":{"foo": 1}},{"smoldering": 123}, loc1)
+        ]
+        worker_dirs = [os.path.join(TEMPFILE_DIRS[-1], 'worker-{}'.format(i))
+            for i in range(3)]
+        for kwargs in _PR_COMPUTE_CALL_KWARGS['feps']:
+            assert os.path.dirname(kwargs['working_dir']) in worker_dirs
+            assert os.path.basename(kwargs['working_dir']) == 'feps-plumerise-' + fire.id
+
+        record = self.fm.processing[-1]
+        assert record['module'] == 'bluesky.modules.plumerise'
+        assert record['num_workers'] == 3
+        assert record['timing']['num_locations'] == 2
+        assert list(record['timing']['locations']) == [fire.id]
+        assert len(record['timing']['locations'][fire.id]) == 2
+        # each worker thread uses its own FEPSPlumeRise
+        assert _PR_COMPUTE_IN_OWN_THREAD['feps'] == [True, True]
+        assert 2 <= _PR_NUM_INSTANCES['feps'] <= 4
+        assert set(record['sun_times']) == {'hits', 'misses', 'hit_rate'}
+
 class TestPlumeRiseRunSev():
 
     def setup_method(self):
@@ -0,0 +1,41 @@
+"""Unit tests for bluesky.numpyutils"""
+
+__author__ = "Joel Dubowy"
+
+import random
+
+import numpy
+
+from bluesky.numpyutils import SequentialSum
+
+
+class TestSequentialSum():
+
+    def test_same_as_sum(self):
+        random.seed(1)
+        values = [[random.choice([1e16, -1e16, 0.1, 1.0, 3e-5, -0.7])
+            * random.random() for j in range(20)] for i in range(7)]
+        values[0] += [float('inf'), 1e100, -1e100]
+        values[1:] = [v + [1.0, 1.0, 1.0] for v in values[1:]]
+        values[3][-1] = -1e100
+
+        s = SequentialSum(len(values[0]))
+        for v in values:
+            s.add(numpy.array(v))
+        assert s.totals().tolist() == [sum(v) for v in zip(*values)]
+
+    def test_index(self):
+        s = SequentialSum((2, 3))
+        s.add(numpy.array([[0.1, 0.2], [0.3, 0.4]]),
+            (slice(None), slice(None, 2)))
+        s.add(numpy.array([[1e16, 1e16, 1e16]]), numpy.array([0]))
+        s.add(numpy.array([[-1e16, 0.5, -1e16]]), numpy.array([0]))
+        assert s.totals().tolist() == [
+            [sum([0.1, 1e16, -1e16]), sum([0.2, 1e16, 0.5]), sum([1e16, -1e16])],
+            [0.3, 0.4, 0.0]
+        ]
+
+    def test_dtype(self):
+        s = SequentialSum(2, dtype='float32')
+        s.add(numpy.array([0.1, 0.2], dtype='float32'))
+        assert s.totals().dtype == numpy.float32
@@ -0,0 +1,106 @@
+"""Unit tests for bluesky.suntimes"""
+
+__author__ = "Joel Dubowy"
+
+import concurrent.futures
+import datetime
+
+from pyairfire import sun
+from pytest import raises
+
+from bluesky import suntimes
+
+
+class MockSun():
+
+    calls = []
+
+    def __init__(self, lat, lng):
+        self.lat = lat
+        self.lng = lng
+
+    def sunrise_hr(self, when, utc_offset):
+        if abs(self.lat) > 80:
+            raise ValueError("math domain error")
+        self.calls.append((self.lat, self.lng, when, utc_offset))
+        return 6
+
+    def sunset_hr(self, when, utc_offset):
+        return 20
+
+
+class TestSunTimesCache():
+
+    def setup_method(self):
+        MockSun.calls = []
+
+    def test_get(self, monkeypatch):
+        monkeypatch.setattr(sun, 'Sun', MockSun)
+        cache = suntimes.SunTimesCache()
+        d = datetime.date(2015, 8, 4)
+
+        assert cache.get(47.6062, -122.3321, d, -7) == (6, 20)
+        assert cache.get(47.6071, -122.3348, d, -7) == (6, 20)
+        assert cache.get(47.6062, -122.3321, d + datetime.timedelta(1), -7) == (6, 20)
+        assert cache.get(47.6062, -122.3321, d, -8) == (6, 20)
+        assert cache.get(45.0, -122.3321, d, -7) == (6, 20)
+        assert MockSun.calls == [
+            (47.61, -122.33, d, -7),
+            (47.61, -122.33, d + datetime.timedelta(1), -7),
+            (47.61, -122.33, d, -8),
+            (45.0, -122.33, d, -7)
+        ]
+        assert cache.stats == {"hits": 1, "misses": 4, "hit_rate": 0.2}
+
+    def test_failure_not_cached(self, monkeypatch):
+        monkeypatch.setattr(sun, 'Sun', MockSun)
+        cache = suntimes.SunTimesCache()
+        for i in range(2):
+            with raises(ValueError):
+                cache.get(85.0, 10.0, datetime.date(2015, 6, 21), 0)
+        assert cache.stats["misses"] == 2
+
+    def test_max_size(self, monkeypatch):
+        monkeypatch.setattr(sun, 'Sun', MockSun)
+        cache = suntimes.SunTimesCache(max_size=2)
+        d = datetime.date(2015, 8, 4)
+        for lat in (40, 41, 42, 40):
+            cache.get(lat, -120, d, -7)
+        assert cache.stats == {"hits": 0, "misses": 4, "hit_rate": 0.0}
+
+
+
+class TestStats():
+
+    def test_stats(self, monkeypatch):
+        monkeypatch.setattr(sun, 'Sun', MockSun)
+        monkeypatch.setattr(suntimes, '_cache', suntimes.SunTimesCache())
+        for i in range(3):
+            suntimes.get_sunrise_sunset_hours(47.6062, -122.3321,
+                datetime.date(2015, 8, 4), -7)
+        assert suntimes.stats() == {"hits": 2, "misses": 1,
+            "hit_rate": 2 / 3}
+
+        since = suntimes.stats()
+        assert suntimes.stats(since=since) == {"hits": 0, "misses": 0,
+            "hit_rate": 0.0}
+        suntimes.get_sunrise_sunset_hours(47.6062, -122.3321,
+            datetime.date(2015, 8, 4), -7)
+        suntimes.get_sunrise_sunset_hours(45.0, -122.3321,
+            datetime.date(2015, 8, 4), -7)
+        assert suntimes.stats(since=since) == {"hits": 1, "misses": 1,
+            "hit_rate": 0.5}
+
+    def test_threads(self, monkeypatch):
+        monkeypatch.setattr(sun, 'Sun', MockSun)
+        # a small cache, so that it's cleared while other threads read it
+        cache = suntimes.SunTimesCache(max_size=3)
+        d = datetime.date(2015, 8, 4)
+        def lookup():
+            for i in range(2000):
+                assert cache.get(40 + i % 5, -120, d, -7) == (6, 20)
+        with concurrent.futures.ThreadPoolExecutor(4) as pool:
+            for f in [pool.submit(lookup) for i in range(4)]:
+                f.result()
+        stats = cache.stats
+        assert stats["hits"] + stats["misses"] == 8000
@@ -0,0 +1,48 @@
+"""Unit tests for bluesky.timeprofilers.cache"""
+
+__author__ = "Joel Dubowy"
+
+import datetime
+
+from bluesky.timeprofilers.cache import TimeProfileCache
+
+
+class TestTimeProfileCache():
+
+    def setup_method(self):
+        self.num_computed = 0
+
+    def _compute(self):
+        self.num_computed += 1
+        return {"num": self.num_computed}
+
+    def test_empty(self):
+        assert TimeProfileCache().stats == {
+            "hits": 0, "misses": 0, "num_profiles": 0, "hit_rate": 0.0
+        }
+
+    def test_hits_and_misses(self):
+        cache = TimeProfileCache()
+        k1 = ('static', datetime.datetime(2015,8,4,17), datetime.datetime(2015,8,5,17))
+        k2 = ('static', datetime.datetime(2015,8,5,17), datetime.datetime(2015,8,6,17))
+
+        p1 = cache.get(k1, self._compute)
+        assert p1 == {"num": 1}
+        assert cache.get(k1, self._compute) is p1
+        assert cache.get(tuple(k1), self._compute) is p1
+        p2 = cache.get(k2, self._compute)
+        assert p2 == {"num": 2}
+        assert cache.get(k1, self._compute) is p1
+        assert self.num_computed == 2
+
+        assert cache.stats == {
+            "hits": 3, "misses": 2, "num_profiles": 2, "hit_rate": 0.6
+        }
+
+    def test_uncacheable(self):
+        cache = TimeProfileCache()
+        assert cache.get(None, self._compute) == {"num": 1}
+        assert cache.get(None, self._compute) == {"num": 2}
+        assert cache.stats == {
+            "hits": 0, "misses": 2, "num_profiles": 0, "hit_rate": 0.0
+        }
@@ -0,0 +1,143 @@
+"""Unit tests for bluesky.timeprofilers.feps"""
+
+__author__ = "Joel Dubowy"
+
+import copy
+import datetime
+import os
+import tempfile
+
+import numpy
+import pytest
+
+from bluesky.timeprofilers import feps
+from bluesky.timeprofilers.ubcbsffeps import UbcBsfFEPSTimeProfiler
+
+BIN_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__),
+    '..', '..', '..', '..', 'bin'))
+
+def _binaries_available():
+    return all([os.access(os.path.join(BIN_DIR, b), os.X_OK)
+        for b in ('feps_weather', 'feps_timeprofile')])
+
+
+WEATHER = {
+    "sunset_hour": 19,
+    "max_temp_hour": 14,
+    "min_temp_hour": 4,
+    "min_humid": 40,
+    "max_humid": 80,
+    "min_temp": 13,
+    "max_temp": 30,
+    "min_wind": 6,
+    "max_wind": 6,
+    "min_wind_aloft": 6,
+    "max_wind_aloft": 6
+}
+
+class TestDiurnalWeather():
+
+    # output of feps_weather, hours 0, 4, 5, 14, 20, and 23
+    EXPECTED = {
+        'temp': [15.270439, 13.0, 15.659386, 30.0, 21.613291, 16.168653],
+        'humid': [74.657791, 80.0, 73.742621, 40.0, 59.733434, 72.544347],
+        'modified_wind': [5.364, 5.0, 5.0, 5.0, 5.0, 5.0],
+        'dif_temp_grad': [0.025, 0.025, -0.008, -0.008, 0.025, 0.025]
+    }
+    HOURS = [0, 4, 5, 14, 20, 23]
+
+    def test_basic(self):
+        weather = feps.diurnal_weather(WEATHER)
+        for k, expected in self.EXPECTED.items():
+            numpy.testing.assert_allclose(
+                numpy.array(weather[k])[self.HOURS], expected, atol=1e-6)
+        assert ''.join(weather['stability']) == 'FFFFFBBBBBBBBBBBBBBBFFFF'
+        numpy.testing.assert_array_equal(weather['wind_flame'], [6.0] * 24)
+
+
+class TestTimeprofile():
+
+    def setup_method(self):
+        self.weather = feps.diurnal_weather(WEATHER)
+        self.growth = dict(enumerate(
+            numpy.cumsum(UbcBsfFEPSTimeProfiler.WRAP_TIME_PROFILE) * 100))
+
+    def _run(self, **kwargs):
+        return feps.timeprofile({'flaming': 5.2, 'smoldering': 3.1}, 40,
+            self.growth, self.weather['humid'], self.weather['wind_flame'],
+            **kwargs)
+
+    def test_area_fraction(self):
+        profile = self._run()
+        assert len(profile['area_fraction']) == feps.NUM_HOURS
+        numpy.testing.assert_allclose(profile['area_fraction'][:24],
+            numpy.array(UbcBsfFEPSTimeProfiler.WRAP_TIME_PROFILE)
+            / sum(UbcBsfFEPSTimeProfiler.WRAP_TIME_PROFILE))
+        assert profile['area_fraction'][24:].sum() == 0
+
+    def test_normalize(self):
+        profile = self._run()
+        assert profile['smoldering'].sum() == pytest.approx(1.0)
+        assert profile['residual'].sum() == pytest.approx(1.0)
+
+        profile = self._run(normalize=False)
+        assert profile['smoldering'].sum() != pytest.approx(1.0)
+
+    def test_invalid_interpolation_type(self):
+        with pytest.raises(ValueError):
+            self._run(interpolation_type=5)
+
+    def test_no_growth(self):
+        with pytest.raises(ValueError):
+            feps.timeprofile({'flaming': 5.2, 'smoldering': 3.1}, 40, {},
+                self.weather['humid'], self.weather['wind_flame'])
+
+
+@pytest.mark.skipif(not _binaries_available(),
+    reason="feps_weather and feps_timeprofile not available")
+class TestEquivalenceWithBinaries():
+
+    ACTIVE_AREA = {
+        "start": datetime.datetime(2015,8,4,17),
+        "end": datetime.datetime(2015,8,5,17),
+        "utc_offset": "-07:00",
+        "consumption": {
+            "summary": {
+                "flaming": 1311.2, "smoldering": 1449.2,
+                "residual": 1267.4, "duff": 544.8
+            }
+        },
+        "specified_points": [
+            {
+                "lat": 47.4, "lng": -121.3, "area": 120.0,
+                "moisture_duff": 40, "sunset_hour": 19, "min_wind": 3,
+                "max_wind": 12, "min_wind_aloft": 4, "max_wind_aloft": 20
+            }
+        ]
+    }
+
+    def setup_method(self):
+        self._path = os.environ['PATH']
+        os.environ['PATH'] = BIN_DIR + os.pathsep + self._path
+
+    def teardown_method(self):
+        os.environ['PATH'] = self._path
+
+    @pytest.mark.parametrize('interpolation_type', [1, 2, 3, 4])
+    @pytest.mark.parametrize('normalize', [True, False])
+    def test_same_profile(self, interpolation_type, normalize):
+        config = {
+            "interpolation_type": interpolation_type,
+            "normalize": normalize
+        }
+        with tempfile.TemporaryDirectory() as wdir:
+            expected = UbcBsfFEPSTimeProfiler(copy.deepcopy(self.ACTIVE_AREA),
+                wdir, config)
+        actual = UbcBsfFEPSTimeProfiler(copy.deepcopy(self.ACTIVE_AREA),
+            None, dict(config, in_process=True))
+
+        assert actual.start_hour == expected.start_hour
+        assert set(actual.hourly_fractions) == set(expected.hourly_fractions)
+        for k in expected.hourly_fractions:
+            numpy.testing.assert_allclose(actual.hourly_fractions[k],
+                expected.hourly_fractions[k], atol=2e-6)